@@ -8,6 +8,7 @@ import os
 
 import grafica.transformations as tr
 from grafica.intersections import intersect_mesh, ray_triangle_intersection
+from grafica.bvh import BVH, bvh_path
 from grafica.utils import load_pipeline
 
 # ============================================
@@ -37,6 +38,10 @@ def ray_triangle_example(filename, width, height):
     mesh.apply_scale(2.3 / mesh.scale) # Escalar para que quepa en [-1,1]
 
     print(f"Mesh loaded: {len(mesh.vertices)} vertices, {len(mesh.faces)} faces")
+
+    # BVH para que cada click cueste O(log n) triángulos; se guarda junto a la malla
+    bvh = BVH.cached(mesh.vertices, mesh.faces, bvh_path(filename))
+    print(f"BVH: {len(bvh)} nodos, profundidad {bvh.depth}")
     print(f"Mesh bounds: min={mesh.vertices.min(axis=0)}, max={mesh.vertices.max(axis=0)}")
     print(f"Mesh centered at origin, scaled to [-1, 1]")
     print(f"Camera at: [0, 0, 3], looking at: [0, 0, 0]")
@@ -72,6 +77,7 @@ def ray_triangle_example(filename, width, height):
     # Configurar cámara
     aspect = width / height
     projection = tr.perspective(45.0, aspect, 0.1, 100.0)
+    projection_inv = tr.perspectiveInverse(45.0, aspect, 0.1, 100.0)
     view = tr.lookAt(np.array([0, 0, 3]), np.array([0, 0, 0]), np.array([0, 1, 0]))
 
     # Variables para visualización de debug en ESPACIO LOCAL
@@ -152,10 +158,11 @@ def ray_triangle_example(filename, width, height):
         near_clip = np.array([ndc_x, ndc_y, -1.0, 1.0])
         far_clip = np.array([ndc_x, ndc_y, 1.0, 1.0])
         
-        # Paso 3: Unproject usando MVP completa
-        # Esto nos da el rayo directamente en espacio local del modelo
-        mvp = projection @ view @ rotation
-        mvp_inv = np.linalg.inv(mvp)
+        # Paso 3: Unproject usando la inversa de la MVP completa
+        # Esto nos da el rayo directamente en espacio local del modelo.
+        # view @ rotation es rígida (solo rota y traslada), así que su inversa
+        # es R^T y -R^T t; la de la proyección se calcula una sola vez
+        mvp_inv = tr.rigidInverse(view @ rotation) @ projection_inv
         
         # Transformar y des-homogeneizar
         near_local = mvp_inv @ near_clip
@@ -189,7 +196,7 @@ def ray_triangle_example(filename, width, height):
             
             # Intersección con la malla (ya estamos en espacio local)
             hit, hit_point_local, face_idx, distance = intersect_mesh(
-                local_origin, local_direction, mesh.vertices, mesh.faces
+                local_origin, local_direction, mesh.vertices, mesh.faces, bvh=bvh
             )
             
             # Crear visualización del rayo EN ESPACIO LOCAL
@@ -0,0 +1,226 @@
+import json
+import platform
+import sys
+import time
+
+import pyglet
+
+# no necesitamos ventana ni contexto de OpenGL
+pyglet.options["shadow_window"] = False
+
+import click
+import numpy as np
+import pyglet.gl as GL
+
+import grafica.transformations as tr
+from grafica.scenegraph import Scenegraph
+
+from .recording import RecordingShaderProgram, recording_gl
+
+
+def cube_mesh():
+    """
+    Un cubo unitario con el formato de nodo de malla de grafica.scenegraph_nodes.
+    """
+    corners = np.array(
+        [[x, y, z] for x in (-0.5, 0.5) for y in (-0.5, 0.5) for z in (-0.5, 0.5)],
+        dtype=np.float32,
+    )
+    faces = np.array(
+        [
+            [0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5],
+            [0, 4, 5], [0, 5, 1], [2, 3, 7], [2, 7, 6],
+            [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3],
+        ],
+        dtype=np.uint32,
+    )
+
+    return {
+        "mesh": {"n_vertices": len(corners), "texture": None, "textures": {}},
+        "attributes": {
+            "position": corners.ravel(),
+            "uv": None,
+            "normal": (corners * 2).ravel(),
+            "color": np.full(len(corners) * 4, 255, dtype=np.uint8),
+        },
+        "indices": faces.ravel().tolist(),
+        "GL_TYPE": GL.GL_TRIANGLES,
+        "transform": tr.identity(),
+        "children": [],
+        "has_texture": False,
+    }
+
+
+def build_graph(shape, n_nodes, timings=None):
+    """
+    Construye un grafo de escena sintético con aproximadamente n_nodes nodos.
+
+    Parámetros:
+    shape -- "wide" (todas las mallas cuelgan de la raíz), "deep" (una cadena
+             de transformaciones, cada una con una malla) o "mixed" (un árbol
+             con 8 hijos por nodo, con mallas en las hojas)
+    n_nodes -- Cantidad aproximada de nodos
+    timings -- Si no es None, se agrega la duración de add_mesh_instance (en segundos)
+    """
+    graph = Scenegraph("root")
+    graph.register_pipeline("pipeline", RecordingShaderProgram())
+    graph.register_mesh("cube", cube_mesh())
+    rng = np.random.default_rng(0)
+
+    def add_instance(name, parent):
+        start = time.perf_counter()
+        graph.add_mesh_instance(name, "cube", "pipeline")
+        if timings is not None:
+            timings.append(time.perf_counter() - start)
+        graph.add_edge(parent, name)
+
+    if shape == "wide":
+        for i in range(n_nodes - 1):
+            add_instance(f"mesh_{i}", "root")
+            graph.nodes[f"mesh_{i}"]["transform"] = tr.translate(*rng.uniform(-10, 10, 3))
+
+    elif shape == "deep":
+        parent = "root"
+        for i in range((n_nodes - 1) // 2):
+            graph.add_transform(f"joint_{i}", tr.translate(0, 0.1, 0) @ tr.rotationY(0.01))
+            graph.add_edge(parent, f"joint_{i}")
+            add_instance(f"mesh_{i}", f"joint_{i}")
+            parent = f"joint_{i}"
+
+    elif shape == "mixed":
+        frontier = ["root"]
+        count = 1
+        while count < n_nodes:
+            next_frontier = []
+            leaves = count * 8 >= n_nodes
+            for parent in frontier:
+                for j in range(8):
+                    if count >= n_nodes:
+                        break
+                    name = f"{parent}/{j}"
+                    if leaves:
+                        add_instance(name, parent)
+                    else:
+                        graph.add_transform(name, tr.translate(*rng.uniform(-1, 1, 3)))
+                        graph.add_edge(parent, name)
+                    next_frontier.append(name)
+                    count += 1
+            frontier = next_frontier
+
+    else:
+        raise ValueError(f"Forma de grafo desconocida: {shape}")
+
+    return graph
+
+
+def measure(function, repeat):
+    """
+    Ejecuta function repeat veces y entrega los tiempos en milisegundos.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000.0)
+    return times
+
+
+def run_benchmarks(shape, n_nodes, repeat):
+    """
+    Mide las operaciones principales del grafo para una forma y tamaño.
+    Entrega una lista de resultados (diccionarios).
+    """
+    results = []
+
+    def record(name, times, **extra):
+        results.append(
+            dict(
+                shape=shape,
+                nodes=n_nodes,
+                benchmark=name,
+                repeat=len(times),
+                mean_ms=float(np.mean(times)),
+                min_ms=float(np.min(times)),
+                max_ms=float(np.max(times)),
+                **extra,
+            )
+        )
+
+    instance_times = []
+    start = time.perf_counter()
+    graph = build_graph(shape, n_nodes, instance_times)
+    build_time = (time.perf_counter() - start) * 1000.0
+    record("build", [build_time], graph_nodes=len(graph))
+    record("add_mesh_instance", [t * 1000.0 for t in instance_times])
+
+    # cálculo completo (después de un cambio de estructura)
+    def full_update():
+        graph.calculate_global_transforms(full=True)
+
+    record("calculate_global_transforms_full", measure(full_update, repeat))
+
+    # cálculo incremental: se anima el 1% de los nodos
+    rng = np.random.default_rng(1)
+    keys = list(graph.nodes)
+    animated = [keys[i] for i in rng.choice(len(keys), max(1, len(keys) // 100), replace=False)]
+
+    def incremental_update():
+        for node_key in animated:
+            graph.mark_dirty(node_key)
+        graph.calculate_global_transforms()
+
+    record("calculate_global_transforms_1pct", measure(incremental_update, repeat))
+
+    # costo de render en la CPU: el primer cuadro compila el plan de dibujo
+    record("render_first_frame", measure(lambda: (graph.invalidate_render_plan(), graph.render()), 1))
+    record("render", measure(graph.render, repeat), **graph.get_render_stats())
+
+    lookups = [keys[i] for i in rng.choice(len(keys), min(1000, len(keys)), replace=False)]
+
+    def global_positions():
+        for node_key in lookups:
+            graph.get_global_position(node_key)
+
+    # tiempo por consulta
+    times = [t / len(lookups) for t in measure(global_positions, repeat)]
+    record("get_global_position", times, lookups=len(lookups))
+
+    return results
+
+
+@click.command("scenegraph_benchmark", short_help="Benchmark del grafo de escena (sin ventana ni GPU)")
+@click.option("--shapes", type=str, default="wide,deep,mixed")
+@click.option("--sizes", type=str, default="100,1000,10000,100000")
+@click.option("--repeat", type=int, default=10)
+@click.option("--output", type=click.Path(), default=None, help="Archivo JSON de salida (por omisión, la consola)")
+def scenegraph_benchmark(shapes, sizes, repeat, output):
+    results = []
+    with recording_gl() as calls:
+        for shape in shapes.split(","):
+            for size in sizes.split(","):
+                print(f"{shape} {size}...", file=sys.stderr)
+                results.extend(run_benchmarks(shape, int(size), repeat))
+
+    report = json.dumps(
+        {
+            "environment": {
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "pyglet": pyglet.version,
+                "platform": platform.platform(),
+            },
+            "gl_calls": dict(calls),
+            "results": results,
+        },
+        indent=2,
+    )
+
+    if output is None:
+        print(report)
+    else:
+        with open(output, "w") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    scenegraph_benchmark()
@@ -0,0 +1,123 @@
+"""
+Reemplazos de ShaderProgram, vertex lists y funciones de OpenGL que solo
+registran las llamadas que reciben. Permiten ejecutar Scenegraph (incluyendo
+render) sin ventana ni GPU, para medir el costo en la CPU.
+"""
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+import pyglet.gl as GL
+
+import grafica.scenegraph_instancing
+import grafica.scenegraph_render
+
+# llamadas registradas: nombre -> cantidad
+calls = Counter()
+
+
+class RecordingAttribute:
+    """
+    Atributo de vértices de una RecordingVertexList (ej: position).
+    """
+
+    def __init__(self, n_vertices):
+        self.n_vertices = n_vertices
+        self.data = None
+
+    def __setitem__(self, key, value):
+        calls["attribute_upload"] += 1
+        self.data = np.asarray(value)
+
+
+class RecordingVertexList:
+    """
+    Imita la vertex list indexada de pyglet.
+    """
+
+    def __init__(self, n_vertices, mode, indices, attribute_names):
+        self.count = n_vertices
+        self.mode = mode
+        self.indices = indices
+        for name in attribute_names:
+            setattr(self, name, RecordingAttribute(n_vertices))
+
+    def draw(self, mode):
+        calls["draw"] += 1
+
+    def delete(self):
+        calls["delete"] += 1
+
+
+class RecordingUniform:
+    def __init__(self, name):
+        self.name = name
+
+    def set(self, value):
+        calls["uniform"] += 1
+
+
+class RecordingShaderProgram:
+    """
+    Imita un pyglet.graphics.shader.ShaderProgram con los uniforms y
+    atributos indicados.
+
+    Parámetros:
+    uniforms -- Nombres de los uniforms activos del programa
+    attributes -- Nombres de los atributos de vértice del programa
+    """
+
+    def __init__(self, uniforms=("transform", "view", "projection"), attributes=("position", "normal", "color")):
+        self._uniforms = {name: RecordingUniform(name) for name in uniforms}
+        self.attribute_names = tuple(attributes)
+        self.uniform_blocks = {}
+
+    @property
+    def uniforms(self):
+        return {name: {} for name in self._uniforms}
+
+    def __setitem__(self, name, value):
+        self._uniforms[name].set(value)
+
+    def use(self):
+        calls["use"] += 1
+
+    def stop(self):
+        pass
+
+    def vertex_list_indexed(self, count, mode, indices, **kwargs):
+        calls["vertex_list"] += 1
+        return RecordingVertexList(count, mode, indices, self.attribute_names)
+
+
+class RecordingGL:
+    """
+    Imita el módulo pyglet.gl: las constantes son las originales y las
+    funciones solo cuentan sus llamadas.
+    """
+
+    def __getattr__(self, name):
+        if not name.startswith("gl"):
+            return getattr(GL, name)
+
+        def record(*args):
+            calls[name] += 1
+
+        return record
+
+
+@contextmanager
+def recording_gl():
+    """
+    Reemplaza las llamadas a OpenGL del grafo de escena por RecordingGL
+    mientras dure el bloque with.
+    """
+    modules = (grafica.scenegraph_render, grafica.scenegraph_instancing)
+    originals = [module.GL for module in modules]
+    try:
+        for module in modules:
+            module.GL = RecordingGL()
+        yield calls
+    finally:
+        for module, original in zip(modules, originals):
+            module.GL = original
@@ -0,0 +1,382 @@
+"""
+Jerarquía de volúmenes envolventes (BVH) sobre los triángulos de una malla,
+para consultas de rayos en tiempo logarítmico (ver intersect_mesh en
+grafica.intersections).
+
+La jerarquía se construye con SAH por intervalos ("binned SAH") y se guarda
+en arreglos planos de NumPy: un nodo interior i tiene sus hijos en first[i]
+y first[i] + 1; una hoja tiene count[i] > 0 triángulos, los de
+order[first[i] : first[i] + count[i]].
+
+La construcción avanza por niveles: todos los nodos de un mismo nivel se
+dividen a la vez con operaciones vectorizadas. Las consultas también: en
+cada paso se prueban todas las cajas de la frontera y todos los triángulos
+de las hojas alcanzadas.
+"""
+import hashlib
+import os
+import tempfile
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+from .intersections import EPSILON, ray_triangles_intersection
+
+# aumentar si cambia el formato de los archivos o la construcción
+BVH_VERSION = 1
+
+# intervalos por eje al evaluar el SAH
+BINS = 16
+# triángulos por hoja: siempre se divide sobre MAX_LEAF_SIZE y nunca bajo LEAF_SIZE
+LEAF_SIZE = 4
+MAX_LEAF_SIZE = 32
+# costo de recorrer un nodo interior, relativo al de probar un triángulo
+TRAVERSAL_COST = 1.0
+
+_ARRAYS = ("bounds_min", "bounds_max", "first", "count", "order")
+
+
+def _ranges(starts, counts):
+    """
+    Concatena los rangos [start, start + count). Entrega (posiciones, segmento
+    de cada posición).
+    """
+    total = int(counts.sum())
+    segment = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.cumsum(counts) - counts
+    return np.arange(total) - offsets[segment] + starts[segment], segment
+
+
+def _half_area(low, high):
+    with np.errstate(invalid="ignore"):
+        d = high - low
+        return d[..., 0] * d[..., 1] + d[..., 1] * d[..., 2] + d[..., 2] * d[..., 0]
+
+
+def fingerprint(vertices, faces):
+    """
+    Hash del contenido de una malla, para saber si una BVH guardada le corresponde.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{BVH_VERSION}:{BINS}:{LEAF_SIZE}:{MAX_LEAF_SIZE}:".encode())
+    digest.update(np.ascontiguousarray(vertices, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(faces, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def bvh_path(filename):
+    """
+    Archivo en el que se guarda la BVH de una malla, junto al archivo de la malla.
+    """
+    filename = Path(filename)
+    return filename.with_name(filename.name + ".bvh.npz")
+
+
+def build_bvh(vertices, faces):
+    """
+    Construye la jerarquía de una malla con SAH por intervalos. Entrega un
+    diccionario con los arreglos bounds_min, bounds_max, first, count y order
+    (ver la descripción del módulo).
+
+    Parámetros:
+    vertices -- Arreglo (vértices, 3)
+    faces -- Arreglo (triángulos, 3) de índices
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    triangles = vertices[np.asarray(faces, dtype=np.int64)]
+    n_triangles = len(triangles)
+
+    # las cajas de los triángulos se agrandan un poco, para no perder los
+    # impactos que Möller-Trumbore acepta justo fuera del borde (tolerancia EPSILON)
+    tri_min = triangles.min(axis=1)
+    tri_max = triangles.max(axis=1)
+    pad = (2 * EPSILON * (tri_max - tri_min).max(axis=1, initial=0) + EPSILON)[:, np.newaxis]
+    tri_min -= pad
+    tri_max += pad
+    centroids = (tri_min + tri_max) / 2
+
+    order = np.arange(n_triangles, dtype=np.int64)
+    levels = []
+    n_nodes = 1
+
+    # segmentos de order que corresponden a los nodos del nivel actual
+    starts = np.zeros(1, dtype=np.int64)
+    counts = np.array([n_triangles], dtype=np.int64)
+
+    while len(starts):
+        n_segments = len(starts)
+        positions, segment = _ranges(starts, counts)
+        offsets = np.cumsum(counts) - counts
+        triangle = order[positions]
+
+        low = np.minimum.reduceat(tri_min[triangle], offsets) if len(positions) else np.zeros((n_segments, 3))
+        high = np.maximum.reduceat(tri_max[triangle], offsets) if len(positions) else np.zeros((n_segments, 3))
+        first = np.zeros(n_segments, dtype=np.int64)
+        node_count = counts.copy()
+
+        splitting = counts > LEAF_SIZE
+        if splitting.any():
+            c = centroids[triangle]
+            c_low = np.minimum.reduceat(c, offsets)
+            c_high = np.maximum.reduceat(c, offsets)
+            extent = c_high - c_low
+
+            # intervalo de cada triángulo en cada eje; en los niveles profundos
+            # los nodos tienen pocos triángulos y no necesitan tantos intervalos
+            n_bins = int(min(BINS, max(counts.max(), 2)))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                scaled = (c - c_low[segment]) * (n_bins / extent[segment])
+            bins = np.clip(np.nan_to_num(scaled, nan=0.0, posinf=0.0), 0, n_bins - 1).astype(np.int64)
+
+            # cajas y cantidades por (intervalo, segmento, eje); los intervalos
+            # van primero para acumularlos sobre el eje más externo
+            keys = (bins * n_segments + segment[:, np.newaxis]) * 3 + np.arange(3)
+            keys = keys.reshape(-1)
+            # (ufunc.at es mucho más rápido sobre arreglos de una dimensión)
+            bin_min = np.full((3, n_bins * n_segments * 3), np.inf)
+            bin_max = np.full((3, n_bins * n_segments * 3), -np.inf)
+            for coordinate in range(3):
+                np.minimum.at(bin_min[coordinate], keys, np.repeat(tri_min[triangle, coordinate], 3))
+                np.maximum.at(bin_max[coordinate], keys, np.repeat(tri_max[triangle, coordinate], 3))
+            bin_count = np.bincount(keys, minlength=n_bins * n_segments * 3).reshape(n_bins, n_segments, 3)
+
+            bin_min = bin_min.T.reshape(n_bins, n_segments, 3, 3)
+            bin_max = bin_max.T.reshape(n_bins, n_segments, 3, 3)
+
+            # división entre los intervalos j - 1 y j, para j = 1 .. n_bins - 1
+            left_area = _half_area(np.minimum.accumulate(bin_min, axis=0), np.maximum.accumulate(bin_max, axis=0))[:-1]
+            right_area = _half_area(
+                np.minimum.accumulate(bin_min[::-1], axis=0)[::-1],
+                np.maximum.accumulate(bin_max[::-1], axis=0)[::-1],
+            )[1:]
+            left_count = np.cumsum(bin_count, axis=0)[:-1]
+            right_count = counts[:, np.newaxis] - left_count
+
+            with np.errstate(invalid="ignore"):
+                cost = np.where(
+                    (left_count > 0) & (right_count > 0),
+                    left_count * left_area + right_count * right_area,
+                    np.inf,
+                )
+            # (segmento, eje * (n_bins - 1) + división)
+            cost = cost.transpose(1, 2, 0).reshape(n_segments, -1)
+            best = cost.argmin(axis=1)
+            best_cost = cost[np.arange(n_segments), best]
+            axis, split = best // (n_bins - 1), best % (n_bins - 1) + 1
+
+            # SAH: dividir conviene si cuesta menos que probar todos los triángulos
+            node_area = _half_area(low, high)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                split_cost = TRAVERSAL_COST + best_cost / node_area
+            sah = np.isfinite(best_cost) & ((split_cost < counts) | (counts > MAX_LEAF_SIZE))
+            # si todos los centroides coinciden no hay división por SAH: se parte por la mitad
+            halves = ~np.isfinite(best_cost) & (counts > MAX_LEAF_SIZE)
+            splitting &= sah | halves
+
+        if splitting.any():
+            inside = splitting[segment]
+            rank = positions - starts[segment]
+            goes_left = np.where(
+                sah[segment],
+                bins[np.arange(len(positions)), axis[segment]] < split[segment],
+                rank < counts[segment] // 2,
+            )
+
+            # partición estable de cada segmento: primero los de la izquierda
+            moved = np.lexsort((~goes_left[inside], segment[inside]))
+            order[positions[inside]] = triangle[inside][moved]
+
+            left_count = np.bincount(segment[inside & goes_left], minlength=n_segments)
+            divided = np.flatnonzero(splitting)
+            first[divided] = n_nodes + 2 * np.arange(len(divided))
+            node_count[divided] = 0
+            n_nodes += 2 * len(divided)
+
+            next_starts = np.empty(2 * len(divided), dtype=np.int64)
+            next_counts = np.empty(2 * len(divided), dtype=np.int64)
+            next_starts[0::2] = starts[divided]
+            next_counts[0::2] = left_count[divided]
+            next_starts[1::2] = starts[divided] + left_count[divided]
+            next_counts[1::2] = counts[divided] - left_count[divided]
+        else:
+            next_starts = next_counts = np.zeros(0, dtype=np.int64)
+
+        leaves = ~splitting
+        first[leaves] = starts[leaves]
+        levels.append((low, high, first, node_count))
+        starts, counts = next_starts, next_counts
+
+    return {
+        "bounds_min": np.concatenate([level[0] for level in levels]),
+        "bounds_max": np.concatenate([level[1] for level in levels]),
+        "first": np.concatenate([level[2] for level in levels]),
+        "count": np.concatenate([level[3] for level in levels]),
+        "order": order,
+    }
+
+
+class BVH:
+    """
+    Jerarquía de volúmenes envolventes de una malla de triángulos.
+
+    Parámetros:
+    vertices -- Arreglo (vértices, 3)
+    faces -- Arreglo (triángulos, 3) de índices
+    arrays -- Arreglos de la jerarquía (ver build_bvh). Si es None, se construye
+    """
+
+    def __init__(self, vertices, faces, arrays=None):
+        vertices = np.asarray(vertices, dtype=np.float64)
+        faces = np.asarray(faces, dtype=np.int64)
+        if arrays is None:
+            arrays = build_bvh(vertices, faces)
+
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+
+        # vértices de los triángulos en el orden de las hojas, para leerlos seguidos
+        triangles = vertices[faces[self.order]]
+        self._v0 = np.ascontiguousarray(triangles[:, 0])
+        self._v1 = np.ascontiguousarray(triangles[:, 1])
+        self._v2 = np.ascontiguousarray(triangles[:, 2])
+        self.fingerprint = fingerprint(vertices, faces)
+
+    def __len__(self):
+        return len(self.first)
+
+    @property
+    def depth(self):
+        depth = np.zeros(len(self), dtype=np.int64)
+        inner = np.flatnonzero(self.count == 0)
+        for i in inner:
+            depth[self.first[i]] = depth[self.first[i] + 1] = depth[i] + 1
+        return int(depth.max())
+
+    def _visit(self, nodes, origin, inverse, t_max):
+        # nodos cuya caja toca el rayo antes de t_max
+        with np.errstate(invalid="ignore"):
+            t1 = (self.bounds_min[nodes] - origin) * inverse
+            t2 = (self.bounds_max[nodes] - origin) * inverse
+        near = np.nan_to_num(np.minimum(t1, t2), nan=-np.inf).max(axis=1)
+        far = np.nan_to_num(np.maximum(t1, t2), nan=np.inf).min(axis=1)
+        return nodes[(far >= np.maximum(near, 0.0)) & (near <= t_max)]
+
+    def _traverse(self, origin, direction, t_max, any_hit):
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+        with np.errstate(divide="ignore"):
+            inverse = 1.0 / direction
+
+        best = (-1, float(t_max), 0.0, 0.0)
+        if len(self.order) == 0:
+            return best
+
+        frontier = np.zeros(1, dtype=np.int64)
+        while len(frontier):
+            frontier = self._visit(frontier, origin, inverse, best[1])
+            counts = self.count[frontier]
+            leaves = frontier[counts > 0]
+
+            if len(leaves):
+                positions, _ = _ranges(self.first[leaves], self.count[leaves])
+                hit, t, u, v = ray_triangles_intersection(
+                    origin, direction, self._v0[positions], self._v1[positions], self._v2[positions]
+                )
+                hit &= t <= best[1]
+                if hit.any():
+                    t = np.where(hit, t, np.inf)
+                    # en caso de empate gana la cara de menor índice, como sin BVH
+                    closest = np.flatnonzero(t == t.min())
+                    i = closest[np.argmin(self.order[positions[closest]])]
+                    face = int(self.order[positions[i]])
+                    if t[i] < best[1] or best[0] < 0 or face < best[0]:
+                        best = (face, float(t[i]), float(u[i]), float(v[i]))
+                    if any_hit:
+                        return best
+
+            inner = self.first[frontier[counts == 0]]
+            frontier = np.concatenate([inner, inner + 1])
+
+        return best
+
+    def closest_hit(self, origin, direction, t_max=np.inf):
+        """
+        Triángulo más cercano que toca el rayo. Entrega (cara, t, u, v), igual
+        que intersect_triangles en grafica.intersections (cara = -1 si no hay).
+
+        Parámetros:
+        origin -- Origen del rayo (3,)
+        direction -- Dirección del rayo (3,)
+        t_max -- Distancia máxima (en unidades de direction)
+        """
+        face, t, u, v = self._traverse(origin, direction, t_max, any_hit=False)
+        if face < 0:
+            return -1, float("inf"), 0.0, 0.0
+        return face, t, u, v
+
+    def any_hit(self, origin, direction, t_max=np.inf):
+        """
+        Indica si el rayo toca algún triángulo antes de t_max (por ejemplo,
+        para sombras o visibilidad). Termina en el primer impacto que encuentra.
+        """
+        face, _, _, _ = self._traverse(origin, direction, t_max, any_hit=True)
+        return face >= 0
+
+    def save(self, path):
+        """
+        Guarda la jerarquía en un archivo .npz, junto con el hash de la malla.
+        """
+        path = Path(path)
+        # escribimos en un archivo temporal y lo renombramos al final,
+        # para que otro proceso nunca lea un archivo a medio escribir
+        handle, staging = tempfile.mkstemp(suffix=".npz", dir=path.parent)
+        try:
+            with os.fdopen(handle, "wb") as f:
+                np.savez(
+                    f,
+                    fingerprint=np.array(self.fingerprint),
+                    **{name: getattr(self, name) for name in _ARRAYS},
+                )
+            os.replace(staging, path)
+        except BaseException:
+            if os.path.exists(staging):
+                os.remove(staging)
+            raise
+
+    @classmethod
+    def load(cls, path, vertices, faces):
+        """
+        Lee una jerarquía guardada con save. Entrega None si el archivo no
+        existe o si corresponde a otra malla (o a otra versión).
+        """
+        path = Path(path)
+        if not path.exists():
+            return None
+
+        with np.load(path) as stored:
+            if str(stored["fingerprint"]) != fingerprint(vertices, faces):
+                return None
+            arrays = {name: stored[name] for name in _ARRAYS}
+        return cls(vertices, faces, arrays)
+
+    @classmethod
+    def cached(cls, vertices, faces, path):
+        """
+        Lee la jerarquía de path o, si no existe o no corresponde a la malla,
+        la construye y la guarda ahí.
+
+        Parámetros:
+        vertices -- Arreglo (vértices, 3)
+        faces -- Arreglo (triángulos, 3) de índices
+        path -- Archivo .npz (ver bvh_path para guardarlo junto a la malla)
+        """
+        bvh = cls.load(path, vertices, faces)
+        if bvh is None:
+            bvh = cls(vertices, faces)
+            try:
+                bvh.save(path)
+            except OSError as error:
+                # sin permisos de escritura la BVH sirve igual, solo no queda guardada
+                warnings.warn(f"No se pudo guardar la BVH en {path}: {error}", RuntimeWarning, stacklevel=2)
+        return bvh
@@ -1,12 +1,16 @@
 import numpy as np
 
+EPSILON = 1e-6
+
+# triángulos por bloque en intersect_triangles (acota la memoria temporal)
+CHUNK_SIZE = 65536
+
+
 def ray_triangle_intersection(origin, direction, v0, v1, v2):
     """
     Algoritmo de Möller-Trumbore para intersección rayo-triángulo.
     Mejorado para manejar casos especiales y evitar problemas numéricos.
     """
-    EPSILON = 1e-6
-    
     # Vectores de los lados del triángulo
     edge1 = v1 - v0
     edge2 = v2 - v0
@@ -45,36 +49,119 @@ def ray_triangle_intersection(origin, direction, v0, v1, v2):
     return False, 0, 0, 0
 
 
-def intersect_mesh(origin, direction, vertices, faces):
+def ray_triangles_intersection(origin, direction, v0, v1, v2):
+    """
+    Möller-Trumbore vectorizado: prueba un rayo contra muchos triángulos a la
+    vez, con las mismas tolerancias y sin backface culling, igual que
+    ray_triangle_intersection. Entrega arreglos (hit, t, u, v), uno por triángulo.
+
+    Parámetros:
+    origin -- Origen del rayo (3,)
+    direction -- Dirección del rayo (3,)
+    v0, v1, v2 -- Vértices de los triángulos, arreglos (triángulos, 3)
+    """
+    edge1 = v1 - v0
+    edge2 = v2 - v0
+
+    h = np.cross(direction, edge2)
+    a = np.einsum("ij,ij->i", edge1, h)
+
+    # los triángulos paralelos al rayo (a casi 0) se descartan abajo
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f = 1.0 / a
+        s = origin - v0
+        u = f * np.einsum("ij,ij->i", s, h)
+        q = np.cross(s, edge1)
+        v = f * (q @ direction)
+        t = f * np.einsum("ij,ij->i", edge2, q)
+
+        hit = (
+            (np.abs(a) >= EPSILON)
+            & (u >= -EPSILON) & (u <= 1.0 + EPSILON)
+            & (v >= -EPSILON) & (u + v <= 1.0 + EPSILON)
+            & (t > EPSILON)
+        )
+    return hit, t, u, v
+
+
+def intersect_triangles(origin, direction, vertices, faces, chunk_size=CHUNK_SIZE):
+    """
+    Encuentra el triángulo más cercano que toca el rayo, probando todos los
+    triángulos con ray_triangles_intersection. Entrega (cara, t, u, v), con
+    cara = -1 y t = inf si el rayo no toca la malla. (u, v) son las
+    coordenadas baricéntricas del punto respecto de los vértices 1 y 2.
+
+    Parámetros:
+    origin -- Origen del rayo (3,)
+    direction -- Dirección del rayo (3,), no necesariamente normalizada
+    vertices -- Arreglo (vértices, 3)
+    faces -- Arreglo (triángulos, 3) de índices
+    chunk_size -- Triángulos por bloque, o None para probarlos todos de una vez
+    """
+    origin = np.asarray(origin, dtype=np.float64)
+    direction = np.asarray(direction, dtype=np.float64)
+    vertices = np.asarray(vertices)
+    faces = np.asarray(faces)
+
+    n_faces = len(faces)
+    if chunk_size is None:
+        chunk_size = max(n_faces, 1)
+
+    best = (-1, float('inf'), 0.0, 0.0)
+    for start in range(0, n_faces, chunk_size):
+        chunk = faces[start : start + chunk_size]
+        hit, t, u, v = ray_triangles_intersection(
+            origin,
+            direction,
+            vertices[chunk[:, 0]].astype(np.float64, copy=False),
+            vertices[chunk[:, 1]].astype(np.float64, copy=False),
+            vertices[chunk[:, 2]].astype(np.float64, copy=False),
+        )
+        if not hit.any():
+            continue
+
+        # argmin entrega el primero en caso de empate, como el recorrido en orden
+        t = np.where(hit, t, np.inf)
+        i = int(np.argmin(t))
+        if t[i] < best[1]:
+            best = (start + i, float(t[i]), float(u[i]), float(v[i]))
+
+    return best
+
+
+def intersect_mesh(origin, direction, vertices, faces, chunk_size=CHUNK_SIZE, barycentric=False, bvh=None):
     """
     Encuentra la intersección más cercana del rayo con la malla.
-    Mejorado con debugging y manejo de casos especiales.
+    Entrega (hit, punto, cara, t) y, si barycentric es True, también las
+    coordenadas baricéntricas (w, u, v) del punto.
+
+    Si se entrega una BVH de la malla (ver grafica.bvh), se usa para la
+    consulta; si no, se prueban todos los triángulos.
+
+    Parámetros:
+    origin -- Origen del rayo
+    direction -- Dirección del rayo (se normaliza, así que t es la distancia)
+    vertices -- Arreglo (vértices, 3)
+    faces -- Arreglo (triángulos, 3) de índices
+    chunk_size -- Triángulos por bloque (ver intersect_triangles)
+    barycentric -- Si es True, agrega (w, u, v) al resultado
+    bvh -- BVH construida sobre vertices y faces, o None
     """
-    min_t = float('inf')
-    hit_point = None
-    hit_face = -1
-    hits_count = 0
-    
     # Normalizar dirección para asegurar consistencia
     direction = direction / np.linalg.norm(direction)
-    
-    for i, face in enumerate(faces):
-        v0 = vertices[face[0]]
-        v1 = vertices[face[1]]
-        v2 = vertices[face[2]]
-        
-        hit, t, u, v = ray_triangle_intersection(origin, direction, v0, v1, v2)
-        
-        if hit:
-            hits_count += 1
-            if t < min_t:
-                min_t = t
-                # Calcular punto usando coordenadas baricéntricas para mayor precisión
-                w = 1.0 - u - v
-                hit_point = w * v0 + u * v1 + v * v2
-                hit_face = i
-    
-    if hits_count > 0:
-        print(f"  Total hits: {hits_count}, closest at t={min_t:.6f}")
-    
-    return hit_face >= 0, hit_point, hit_face, min_t
\ No newline at end of file
+
+    if bvh is not None:
+        hit_face, min_t, u, v = bvh.closest_hit(origin, direction)
+    else:
+        hit_face, min_t, u, v = intersect_triangles(origin, direction, vertices, faces, chunk_size)
+
+    hit_point = None
+    w = 1.0 - u - v
+    if hit_face >= 0:
+        # Calcular punto usando coordenadas baricéntricas para mayor precisión
+        v0, v1, v2 = (vertices[index] for index in faces[hit_face])
+        hit_point = w * v0 + u * v1 + v * v2
+
+    if barycentric:
+        return hit_face >= 0, hit_point, hit_face, min_t, (w, u, v)
+    return hit_face >= 0, hit_point, hit_face, min_t
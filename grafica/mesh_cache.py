@@ -0,0 +1,287 @@
+"""
+Caché en disco de mallas preprocesadas (ver _node_from_file).
+
+Cada entrada es una carpeta con los arreglos de vértices de cada geometría
+(archivos .npy que se abren con memory-mapping) y un meta.json. La llave de la
+entrada es un hash del contenido del archivo (y de los archivos .mtl y
+texturas que referencia un .obj), de las opciones de preprocesamiento y de
+la versión de trimesh, así que cualquier cambio en ellos produce otra entrada.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import trimesh as tm
+from PIL import Image
+
+# aumentar si cambia el formato de las entradas o el preprocesamiento
+CACHE_VERSION = 3
+
+_ARRAY_NAMES = ("position", "normal", "uv", "color", "indices", "vertices", "faces")
+_FLOAT_ARRAYS = ("position", "normal", "uv")
+# modos de imagen que Image.fromarray deduce de la forma del arreglo
+_ARRAY_IMAGE_MODES = ("L", "LA", "RGB", "RGBA")
+
+
+def _dependencies(filename):
+    """
+    Entrega los archivos de los que depende filename: los .mtl de un .obj
+    y las texturas que esos .mtl referencian.
+    """
+    filename = Path(filename)
+    if filename.suffix.lower() != ".obj":
+        return []
+
+    def referenced(path, pattern):
+        found = []
+        with open(path, errors="ignore") as f:
+            for line in f:
+                match = re.match(pattern, line.strip())
+                if match:
+                    candidate = path.parent / match.group(1).strip()
+                    if candidate.exists():
+                        found.append(candidate)
+        return found
+
+    materials = referenced(filename, r"mtllib\s+(.+)")
+    textures = []
+    for material in materials:
+        textures.extend(referenced(material, r"map_\w+\s+(?:-\S+\s+\S+\s+)*(.+)"))
+    return materials + textures
+
+
+class CachedObject:
+    """
+    Reemplazo liviano del objeto de trimesh (node['object']) de una malla
+    leída desde el caché. Tiene bounds, centroid, extents y scale sin cargar
+    nada; cualquier otro atributo reconstruye el objeto de trimesh con los
+    vértices y caras guardados.
+    """
+
+    def __init__(self, summary, loader):
+        self.bounds = np.array(summary["bounds"])
+        self.centroid = np.array(summary["centroid"])
+        self.extents = self.bounds[1] - self.bounds[0]
+        self.scale = float(np.linalg.norm(self.extents))
+        self._loader = loader
+        self._object = None
+
+    def __getattr__(self, name):
+        # solo se llama si el atributo no existe en la instancia
+        if name.startswith("__") or name in ("_loader", "_object"):
+            raise AttributeError(name)
+        if self._object is None:
+            self._object = self._loader()
+        return getattr(self._object, name)
+
+
+class MeshCache:
+    """
+    Caché en disco de mallas preprocesadas, con tamaño máximo. Cuando se
+    supera, se borran las entradas usadas hace más tiempo.
+
+    Parámetros:
+    directory -- Carpeta del caché (se crea si no existe)
+    max_bytes -- Tamaño máximo total de las entradas, en bytes
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, filename, options):
+        """
+        Calcula la llave (hash) de un archivo de malla con sus opciones de preprocesamiento.
+        """
+        digest = hashlib.sha256()
+        digest.update(f"{CACHE_VERSION}:{tm.__version__}:".encode())
+        digest.update(json.dumps(options, sort_keys=True, default=str).encode())
+
+        for path in [Path(filename)] + _dependencies(filename):
+            digest.update(path.name.encode())
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+
+        return digest.hexdigest()
+
+    def load(self, filename, options):
+        """
+        Entrega la entrada de filename con esas opciones como (meta, geometrías),
+        donde cada geometría es un diccionario como el de _mesh_arrays,
+        o None si no está en el caché.
+        """
+        entry = self.directory / self.key(filename, options)
+        meta_path = entry / "meta.json"
+        if not meta_path.exists():
+            self.misses += 1
+            return None
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        geometries = []
+        for i, child in enumerate(meta["children"]):
+            arrays = {"n_vertices": child["n_vertices"], "image": None, "optimization": child.get("optimization")}
+            for name in _ARRAY_NAMES:
+                path = entry / f"{i}_{name}.npy"
+                arrays[name] = np.load(path, mmap_mode="r") if path.exists() else None
+
+            image_path = entry / f"{i}_image.npy"
+            if image_path.exists():
+                image = Image.fromarray(np.load(image_path))
+                if image.mode != child["image_mode"]:
+                    image = image.convert(child["image_mode"])
+                arrays["image"] = image
+            geometries.append(arrays)
+
+        # marcamos la entrada como usada recientemente
+        os.utime(meta_path)
+        self.hits += 1
+        return meta, geometries
+
+    def store(self, filename, options, scene, geometries):
+        """
+        Guarda en el caché la escena preprocesada de filename.
+
+        Parámetros:
+        filename -- Archivo de la malla
+        options -- Opciones de preprocesamiento (las mismas de load)
+        scene -- Escena de trimesh ya preprocesada
+        geometries -- Lista de diccionarios de _mesh_arrays, uno por geometría de scene
+        """
+        key = self.key(filename, options)
+        entry = self.directory / key
+        if entry.exists():
+            return
+
+        # escribimos en una carpeta temporal y la renombramos al final,
+        # para que otro proceso nunca lea una entrada a medio escribir
+        staging = Path(tempfile.mkdtemp(prefix=f".{key}-", dir=self.directory))
+        try:
+            children = []
+            for i, (geometry, arrays) in enumerate(zip(scene.geometry.values(), geometries)):
+                values = dict(arrays)
+                values["vertices"] = np.asarray(geometry.vertices)
+                values["faces"] = np.asarray(geometry.faces)
+
+                for name in _ARRAY_NAMES:
+                    if values.get(name) is None:
+                        continue
+                    array = np.asarray(values[name])
+                    if name in _FLOAT_ARRAYS:
+                        array = array.astype(np.float32)
+                    elif name == "indices":
+                        # los índices optimizados pueden ser de 16 bits
+                        array = array.astype(np.uint16 if array.dtype == np.uint16 else np.uint32)
+                    elif name == "color":
+                        array = array.astype(np.uint8)
+                    np.save(staging / f"{i}_{name}.npy", array)
+
+                image_mode = None
+                if arrays["image"] is not None:
+                    image = arrays["image"]
+                    # guardamos los pixeles en un modo que Pillow reconoce al leer el arreglo
+                    if image.mode not in _ARRAY_IMAGE_MODES:
+                        image = image.convert("RGBA")
+                    image_mode = image.mode
+                    np.save(staging / f"{i}_image.npy", np.asarray(image))
+
+                children.append(
+                    {
+                        "n_vertices": arrays["n_vertices"],
+                        "image_mode": image_mode,
+                        "optimization": arrays.get("optimization"),
+                        "bounds": np.asarray(geometry.bounds).tolist(),
+                        "centroid": np.asarray(geometry.centroid).tolist(),
+                    }
+                )
+
+            meta = {
+                "version": CACHE_VERSION,
+                "source": str(filename),
+                "options": options,
+                "scene": {
+                    "bounds": np.asarray(scene.bounds).tolist(),
+                    "centroid": np.asarray(scene.centroid).tolist(),
+                },
+                "children": children,
+            }
+            with open(staging / "meta.json", "w") as f:
+                json.dump(meta, f, default=str)
+
+            try:
+                os.replace(staging, entry)
+            except OSError:
+                # otro proceso guardó la misma entrada primero
+                shutil.rmtree(staging, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        self.evict(keep=key)
+
+    def entries(self):
+        """
+        Entrega las entradas del caché como tuplas (última vez usada, bytes, carpeta).
+        """
+        found = []
+        for entry in self.directory.iterdir():
+            meta_path = entry / "meta.json"
+            if entry.name.startswith(".") or not meta_path.exists():
+                continue
+            size = sum(path.stat().st_size for path in entry.iterdir())
+            found.append((meta_path.stat().st_mtime, size, entry))
+        return found
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """
+        Borra las entradas usadas hace más tiempo hasta que el caché
+        ocupe a lo más max_bytes (nunca borra la entrada keep).
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry[0])
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry.name == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for _, _, entry in self.entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
+    @staticmethod
+    def scene_object(meta, geometries):
+        """
+        Entrega los reemplazos de los objetos de trimesh de una entrada:
+        (objeto de la escena, lista de objetos de cada geometría).
+        """
+
+        def mesh_loader(arrays):
+            return lambda: tm.Trimesh(
+                vertices=np.array(arrays["vertices"]), faces=np.array(arrays["faces"]), process=False
+            )
+
+        children = [
+            CachedObject(child, mesh_loader(arrays)) for child, arrays in zip(meta["children"], geometries)
+        ]
+        scene = CachedObject(
+            meta["scene"],
+            lambda: tm.Scene([child._loader() for child in children]),
+        )
+        return scene, children
@@ -0,0 +1,315 @@
+"""
+Cadenas de mipmaps calculadas en la CPU, compresión por bloques (BC1 y BC3,
+también conocidas como DXT1 y DXT5) y un caché en disco para ambas
+(ver grafica.textures.texture_2D_mipmap_setup).
+"""
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+# aumentar si cambia el formato del caché o la forma de calcular los niveles
+MIPMAP_CACHE_VERSION = 1
+
+FILTERS = ("box", "lanczos")
+FORMATS = ("rgba", "bc1", "bc3")
+
+
+def _halve(pixels, axis):
+    """
+    Reduce a la mitad (hacia abajo) el tamaño de pixels en el eje axis
+    promediando vecinos. Con tamaño impar se usan 3 pixeles por resultado,
+    con pesos que cubren exactamente el pixel original.
+    """
+    p = np.moveaxis(pixels, axis, 0)
+    n = p.shape[0]
+    if n == 1:
+        return pixels
+
+    half = n // 2
+    if n % 2 == 0:
+        result = (p[0::2] + p[1::2]) * 0.5
+    else:
+        i = np.arange(half, dtype=np.float32).reshape((-1,) + (1,) * (p.ndim - 1))
+        result = (
+            p[0 : 2 * half : 2] * ((half - i) / n)
+            + p[1 : 2 * half : 2] * (half / n)
+            + p[2 : 2 * half + 1 : 2] * ((i + 1) / n)
+        )
+    return np.moveaxis(result, 0, axis)
+
+
+def mip_chain(image, filter="box"):
+    """
+    Calcula la cadena de mipmaps de una imagen hasta el nivel de 1x1.
+    Cada nivel mide la mitad (hacia abajo, mínimo 1) del anterior, como
+    exige OpenGL. Entrega una lista de arreglos uint8 (alto, ancho, canales).
+
+    Parámetros:
+    image -- Imagen de PIL
+    filter -- "box" (promedio de 2x2, rápido) o "lanczos" (más nítido; cada
+              nivel se calcula desde la imagen original)
+    """
+    if filter not in FILTERS:
+        raise ValueError(f"Filtro de mipmaps desconocido: {filter}")
+
+    base = np.asarray(image)
+    if base.ndim == 2:
+        base = base[:, :, np.newaxis]
+    levels = [np.ascontiguousarray(base, dtype=np.uint8)]
+
+    height, width = base.shape[:2]
+    current = base.astype(np.float32)
+    while width > 1 or height > 1:
+        width, height = max(1, width // 2), max(1, height // 2)
+
+        if filter == "box":
+            current = _halve(_halve(current, 0), 1)
+            pixels = current
+        else:
+            pixels = np.asarray(image.resize((width, height), Image.LANCZOS), dtype=np.float32)
+            if pixels.ndim == 2:
+                pixels = pixels[:, :, np.newaxis]
+
+        levels.append(np.clip(np.rint(pixels), 0, 255).astype(np.uint8))
+
+    return levels
+
+
+def _blocks(pixels):
+    """
+    Separa una imagen (alto, ancho, canales) en bloques de 4x4, repitiendo
+    los bordes si el tamaño no es múltiplo de 4. Entrega (bloques, 16, canales).
+    """
+    height, width, channels = pixels.shape
+    padded = np.pad(pixels, ((0, -height % 4), (0, -width % 4), (0, 0)), mode="edge")
+    rows, columns = padded.shape[0] // 4, padded.shape[1] // 4
+    blocks = padded.reshape(rows, 4, columns, 4, channels).transpose(0, 2, 1, 3, 4)
+    return blocks.reshape(rows * columns, 16, channels)
+
+
+def _pack_indices(indices, bits):
+    """
+    Empaqueta índices (bloques, 16) de bits bits cada uno, el pixel 0 en los
+    bits menos significativos.
+    """
+    shifts = np.arange(16, dtype=np.uint64) * np.uint64(bits)
+    return np.bitwise_or.reduce(indices.astype(np.uint64) << shifts, axis=1)
+
+
+def _to_565(colors):
+    colors = np.clip(np.rint(colors), 0, 255).astype(np.uint32)
+    return ((colors[..., 0] >> 3) << 11) | ((colors[..., 1] >> 2) << 5) | (colors[..., 2] >> 3)
+
+
+def _from_565(packed):
+    r = (packed >> 11) & 31
+    g = (packed >> 5) & 63
+    b = packed & 31
+    return np.stack([(r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)], axis=-1).astype(np.float32)
+
+
+def _color_blocks(blocks):
+    """
+    Codifica el color de bloques (bloques, 16, 3) en formato BC1 (4 colores).
+    Los extremos son los pixeles más alejados a lo largo del eje principal
+    de los colores del bloque. Entrega un arreglo (bloques, 8) de uint8.
+    """
+    colors = blocks.astype(np.float32)
+    centered = colors - colors.mean(axis=1, keepdims=True)
+
+    # eje principal por iteración de potencia sobre la covarianza
+    covariance = np.einsum("nki,nkj->nij", centered, centered)
+    axis = np.ones((len(blocks), 3), dtype=np.float32)
+    for _ in range(4):
+        axis = np.einsum("nij,nj->ni", covariance, axis)
+        axis /= np.maximum(np.linalg.norm(axis, axis=1, keepdims=True), 1e-12)
+
+    projection = np.einsum("nki,ni->nk", centered, axis)
+    rows = np.arange(len(blocks))
+    high = _to_565(colors[rows, projection.argmax(axis=1)])
+    low = _to_565(colors[rows, projection.argmin(axis=1)])
+
+    # en modo de 4 colores el primer extremo debe ser mayor
+    c0, c1 = np.maximum(high, low), np.minimum(high, low)
+    e0, e1 = _from_565(c0), _from_565(c1)
+    palette = np.stack([e0, e1, (2 * e0 + e1) / 3, (e0 + 2 * e1) / 3], axis=1)
+
+    distances = ((colors[:, :, np.newaxis, :] - palette[:, np.newaxis, :, :]) ** 2).sum(axis=-1)
+    indices = distances.argmin(axis=2)
+    # si ambos extremos son iguales, todos los pixeles usan el primero
+    indices[c0 == c1] = 0
+
+    encoded = np.zeros(len(blocks), dtype=[("c0", "<u2"), ("c1", "<u2"), ("indices", "<u4")])
+    encoded["c0"] = c0
+    encoded["c1"] = c1
+    encoded["indices"] = _pack_indices(indices, 2)
+    return encoded.view(np.uint8).reshape(-1, 8)
+
+
+def _alpha_blocks(alpha):
+    """
+    Codifica la transparencia de bloques (bloques, 16) en formato BC3
+    (8 valores entre el máximo y el mínimo del bloque). Entrega (bloques, 8) de uint8.
+    """
+    alpha = alpha.astype(np.float32)
+    a0 = alpha.max(axis=1)
+    a1 = alpha.min(axis=1)
+    # orden de la paleta: a0, a1 y luego 6 valores intermedios
+    weights = np.array([7, 0, 6, 5, 4, 3, 2, 1], dtype=np.float32) / 7
+    palette = a0[:, np.newaxis] * weights + a1[:, np.newaxis] * (1 - weights)
+
+    indices = np.abs(alpha[:, :, np.newaxis] - palette[:, np.newaxis, :]).argmin(axis=2)
+    indices[a0 == a1] = 0
+
+    encoded = np.zeros((len(alpha), 8), dtype=np.uint8)
+    encoded[:, 0] = a0
+    encoded[:, 1] = a1
+    packed = _pack_indices(indices, 3)
+    for i in range(6):
+        encoded[:, 2 + i] = (packed >> np.uint64(8 * i)) & np.uint64(255)
+    return encoded
+
+
+def compress_bc1(pixels):
+    """
+    Comprime una imagen (alto, ancho, canales) en formato BC1 (DXT1, RGB,
+    4 bits por pixel). Entrega los bytes como un arreglo uint8.
+    """
+    blocks = _blocks(_rgba(pixels))
+    return _color_blocks(blocks[:, :, :3]).reshape(-1)
+
+
+def compress_bc3(pixels):
+    """
+    Comprime una imagen (alto, ancho, canales) en formato BC3 (DXT5, RGBA,
+    8 bits por pixel). Entrega los bytes como un arreglo uint8.
+    """
+    blocks = _blocks(_rgba(pixels))
+    return np.concatenate([_alpha_blocks(blocks[:, :, 3]), _color_blocks(blocks[:, :, :3])], axis=1).reshape(-1)
+
+
+def _rgba(pixels):
+    channels = pixels.shape[2]
+    if channels == 4:
+        return pixels
+    if channels == 3:
+        return np.concatenate([pixels, np.full(pixels.shape[:2] + (1,), 255, dtype=np.uint8)], axis=2)
+    # escala de grises, con o sin transparencia
+    alpha = pixels[:, :, 1:2] if channels == 2 else np.full(pixels.shape[:2] + (1,), 255, dtype=np.uint8)
+    return np.concatenate([pixels[:, :, :1]] * 3 + [alpha], axis=2)
+
+
+class MipmapChain:
+    """
+    Niveles de mipmap de una textura, listos para subir a la GPU.
+
+    Parámetros:
+    format -- "rgba" (sin comprimir), "bc1" o "bc3"
+    levels -- Lista de (ancho, alto, datos); los datos son un arreglo uint8
+              (pixeles RGB o RGBA para "rgba", bloques comprimidos para los demás)
+    """
+
+    def __init__(self, format, levels):
+        self.format = format
+        self.levels = levels
+
+    @classmethod
+    def from_image(cls, image, filter="box", format="rgba"):
+        """
+        Calcula la cadena de una imagen de PIL (ya invertida, si corresponde).
+
+        Parámetros:
+        image -- Imagen de PIL
+        filter -- Filtro de reducción (ver mip_chain)
+        format -- "rgba", "bc1" o "bc3"
+        """
+        if format not in FORMATS:
+            raise ValueError(f"Formato de textura desconocido: {format}")
+
+        levels = []
+        for pixels in mip_chain(image, filter):
+            height, width = pixels.shape[:2]
+            if format == "bc1":
+                data = compress_bc1(pixels)
+            elif format == "bc3":
+                data = compress_bc3(pixels)
+            elif pixels.shape[2] in (3, 4):
+                data = pixels
+            else:
+                data = _rgba(pixels)
+            levels.append((width, height, data))
+
+        return cls(format, levels)
+
+    @property
+    def nbytes(self):
+        return sum(data.nbytes for _, _, data in self.levels)
+
+    def __len__(self):
+        return len(self.levels)
+
+
+class MipmapCache:
+    """
+    Caché en disco de cadenas de mipmaps: un archivo .npz comprimido por
+    imagen, filtro y formato, con la llave calculada a partir del contenido
+    de la imagen.
+
+    Parámetros:
+    directory -- Carpeta del caché (se crea si no existe)
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(image, filter, format):
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{MIPMAP_CACHE_VERSION}:{image.mode}:{image.size}:{filter}:{format}:".encode())
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def get(self, image, filter="box", format="rgba"):
+        """
+        Entrega la cadena de mipmaps de image, leyéndola del caché o
+        calculándola (y guardándola) si no existe.
+        """
+        path = self.directory / f"{self.key(image, filter, format)}.npz"
+        if path.exists():
+            self.hits += 1
+            with np.load(path) as stored:
+                sizes = stored["sizes"]
+                levels = [(int(w), int(h), stored[f"level_{i}"]) for i, (w, h) in enumerate(sizes)]
+            return MipmapChain(str(format), levels)
+
+        self.misses += 1
+        chain = MipmapChain.from_image(image, filter, format)
+
+        # escribimos en un archivo temporal y lo renombramos al final,
+        # para que otro proceso nunca lea un archivo a medio escribir
+        handle, staging = tempfile.mkstemp(suffix=".npz", dir=self.directory)
+        try:
+            with os.fdopen(handle, "wb") as f:
+                np.savez_compressed(
+                    f,
+                    sizes=np.array([(w, h) for w, h, _ in chain.levels], dtype=np.int64),
+                    **{f"level_{i}": data for i, (_, _, data) in enumerate(chain.levels)},
+                )
+            os.replace(staging, path)
+        except BaseException:
+            if os.path.exists(staging):
+                os.remove(staging)
+            raise
+
+        return chain
+
+    def clear(self):
+        for path in self.directory.glob("*.npz"):
+            path.unlink()
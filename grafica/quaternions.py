@@ -0,0 +1,341 @@
+"""
+Cuaterniones y transformaciones TRS (traslación, rotación y escala).
+
+Un cuaternión es un arreglo (..., 4) con componentes (w, x, y, z); todas las
+funciones aceptan un cuaternión o pilas de ellos. Una transformación TRS
+guarda por separado su traslación (3), rotación (cuaternión, 4) y escala (3),
+es decir, 10 números en vez de los 16 de una matriz, y se convierte en la
+matriz T @ R @ S solo cuando se necesita (ver TRS.matrices).
+"""
+import numpy as np
+
+
+def identity(n=None):
+    """
+    Cuaternión identidad (sin rotación), o una pila de n de ellos.
+    """
+    q = np.zeros((4,) if n is None else (n, 4), dtype=np.float32)
+    q[..., 0] = 1
+    return q
+
+
+def normalize(q):
+    q = np.asarray(q, dtype=np.float32)
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+
+def conjugate(q):
+    """
+    Conjugado de q, que para cuaterniones unitarios es la rotación inversa.
+    """
+    q = np.array(q, dtype=np.float32)
+    q[..., 1:] *= -1
+    return q
+
+
+def multiply(a, b):
+    """
+    Producto de Hamilton a * b: la rotación b seguida de la rotación a
+    (como el producto de matrices A @ B).
+    """
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    aw, ax, ay, az = np.moveaxis(a, -1, 0)
+    bw, bx, by, bz = np.moveaxis(b, -1, 0)
+    return np.stack(
+        [
+            aw * bw - ax * bx - ay * by - az * bz,
+            aw * bx + ax * bw + ay * bz - az * by,
+            aw * by - ax * bz + ay * bw + az * bx,
+            aw * bz + ax * by - ay * bx + az * bw,
+        ],
+        axis=-1,
+    )
+
+
+def from_axis_angle(theta, axis):
+    """
+    Cuaternión de la rotación de theta radianes en torno a axis, la misma
+    que entrega transformations.rotationA(theta, axis).
+
+    Parámetros:
+    theta -- Ángulo (o arreglo (N,) de ángulos) en radianes
+    axis -- Eje (3,) o ejes (N,3); se normalizan
+    """
+    theta = np.asarray(theta, dtype=np.float32)
+    axis = normalize(axis)
+    half = theta[..., np.newaxis] / 2
+    vector = np.sin(half) * axis
+    return np.concatenate([np.broadcast_to(np.cos(half), vector.shape[:-1] + (1,)), vector], axis=-1)
+
+
+def to_axis_angle(q):
+    """
+    Entrega (theta, axis) de la rotación de q, con theta en [0, pi], de modo
+    que transformations.rotationA(theta, axis) es la misma rotación.
+    Para rotaciones nulas el eje es (1, 0, 0).
+    """
+    q = normalize(q)
+    # q y -q son la misma rotación; elegimos w >= 0 para que theta <= pi
+    q = np.where(q[..., :1] < 0, -q, q)
+
+    sin_half = np.linalg.norm(q[..., 1:], axis=-1)
+    theta = 2 * np.arctan2(sin_half, q[..., 0])
+
+    small = sin_half < 1e-7
+    axis = q[..., 1:] / np.where(small, 1, sin_half)[..., np.newaxis]
+    axis = np.where(small[..., np.newaxis], np.array([1, 0, 0], dtype=np.float32), axis)
+    return theta.astype(np.float32), axis.astype(np.float32)
+
+
+def to_matrix(q):
+    """
+    Matriz de rotación (..., 3, 3) de q.
+    """
+    q = normalize(q)
+    w, x, y, z = np.moveaxis(q, -1, 0)
+    m = np.empty(q.shape[:-1] + (3, 3), dtype=np.float32)
+    m[..., 0, 0] = 1 - 2 * (y * y + z * z)
+    m[..., 0, 1] = 2 * (x * y - w * z)
+    m[..., 0, 2] = 2 * (x * z + w * y)
+    m[..., 1, 0] = 2 * (x * y + w * z)
+    m[..., 1, 1] = 1 - 2 * (x * x + z * z)
+    m[..., 1, 2] = 2 * (y * z - w * x)
+    m[..., 2, 0] = 2 * (x * z - w * y)
+    m[..., 2, 1] = 2 * (y * z + w * x)
+    m[..., 2, 2] = 1 - 2 * (x * x + y * y)
+    return m
+
+
+def from_matrix(m):
+    """
+    Cuaternión de una matriz de rotación (..., 3, 3) (o de la parte 3x3 de
+    una matriz (..., 4, 4)). Usa el método de Shepperd, que elige la fórmula
+    numéricamente estable según la diagonal de cada matriz.
+    """
+    m = np.asarray(m, dtype=np.float64)[..., :3, :3]
+    m00, m11, m22 = m[..., 0, 0], m[..., 1, 1], m[..., 2, 2]
+    trace = m00 + m11 + m22
+
+    # 4 candidatos, cada uno estable cuando su componente es la mayor
+    candidates = np.stack(
+        [
+            np.stack([1 + trace, m[..., 2, 1] - m[..., 1, 2], m[..., 0, 2] - m[..., 2, 0], m[..., 1, 0] - m[..., 0, 1]], -1),
+            np.stack([m[..., 2, 1] - m[..., 1, 2], 1 + m00 - m11 - m22, m[..., 0, 1] + m[..., 1, 0], m[..., 0, 2] + m[..., 2, 0]], -1),
+            np.stack([m[..., 0, 2] - m[..., 2, 0], m[..., 0, 1] + m[..., 1, 0], 1 - m00 + m11 - m22, m[..., 1, 2] + m[..., 2, 1]], -1),
+            np.stack([m[..., 1, 0] - m[..., 0, 1], m[..., 0, 2] + m[..., 2, 0], m[..., 1, 2] + m[..., 2, 1], 1 - m00 - m11 + m22], -1),
+        ],
+        axis=-2,
+    )
+    choice = np.argmax(np.stack([trace, m00, m11, m22], axis=-1), axis=-1)
+    q = np.take_along_axis(candidates, choice[..., np.newaxis, np.newaxis], axis=-2)[..., 0, :]
+    q = q / np.linalg.norm(q, axis=-1, keepdims=True)
+    return np.where(q[..., :1] < 0, -q, q).astype(np.float32)
+
+
+def rotate(q, v):
+    """
+    Aplica la rotación q a vectores v (..., 3).
+    """
+    q = normalize(q)
+    v = np.asarray(v, dtype=np.float32)
+    u = q[..., 1:]
+    w = q[..., :1]
+    t = 2 * np.cross(u, v)
+    return v + w * t + np.cross(u, t)
+
+
+def nlerp(a, b, t):
+    """
+    Interpolación lineal normalizada entre cuaterniones (por el camino más
+    corto). Es más barata que slerp, pero su velocidad angular no es constante.
+
+    Parámetros:
+    a, b -- Cuaterniones (4,) o (N,4)
+    t -- Parámetro (o arreglo (N,) de parámetros) entre 0 y 1
+    """
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    t = np.asarray(t, dtype=np.float32)[..., np.newaxis]
+    b = np.where((a * b).sum(axis=-1, keepdims=True) < 0, -b, b)
+    return normalize(a + (b - a) * t)
+
+
+def slerp(a, b, t):
+    """
+    Interpolación esférica entre cuaterniones (por el camino más corto),
+    con velocidad angular constante. Para rotaciones muy parecidas usa nlerp.
+
+    Parámetros:
+    a, b -- Cuaterniones (4,) o (N,4)
+    t -- Parámetro (o arreglo (N,) de parámetros) entre 0 y 1
+    """
+    a = normalize(a)
+    b = normalize(b)
+    t = np.asarray(t, dtype=np.float32)[..., np.newaxis]
+
+    cos_omega = (a * b).sum(axis=-1, keepdims=True)
+    b = np.where(cos_omega < 0, -b, b)
+    cos_omega = np.abs(cos_omega)
+
+    near = cos_omega > 0.9995
+    omega = np.arccos(np.clip(cos_omega, -1, 1))
+    sin_omega = np.where(near, 1, np.sin(omega))
+    wa = np.where(near, 1 - t, np.sin((1 - t) * omega) / sin_omega)
+    wb = np.where(near, t, np.sin(t * omega) / sin_omega)
+    return normalize(wa * a + wb * b)
+
+
+def compose(translations=None, rotations=None, scales=None, n=None, out=None):
+    """
+    Compone matrices T @ R @ S (N,4,4) float32 a partir de traslaciones
+    (N,3), rotaciones (cuaterniones (N,4) o matrices (N,3,3)) y escalas
+    ((N,3) por eje o (N,) uniformes). Los componentes que no se entregan
+    quedan como identidad. Es la única implementación de T @ R @ S del
+    paquete (scenegraph_hierarchy.compose_transforms la usa).
+
+    Parámetros:
+    n -- Cantidad de matrices, si no se puede deducir de los componentes
+    out -- Arreglo (N,4,4) float32 donde escribir el resultado, o None
+    """
+    if n is None:
+        if translations is not None:
+            n = len(np.atleast_2d(translations))
+        elif rotations is not None:
+            shape = (-1, 4) if np.shape(rotations)[-1] == 4 else (-1, 3, 3)
+            n = len(np.reshape(rotations, shape))
+        else:
+            n = len(np.atleast_1d(scales))
+
+    if out is None:
+        out = np.zeros((n, 4, 4), dtype=np.float32)
+    else:
+        out[...] = 0
+    out[:, 3, 3] = 1
+
+    if rotations is None:
+        out[:, [0, 1, 2], [0, 1, 2]] = 1
+    elif np.shape(rotations)[-1] == 4:
+        out[:, :3, :3] = to_matrix(rotations)
+    else:
+        out[:, :3, :3] = rotations
+
+    if scales is not None:
+        scales = np.asarray(scales, dtype=np.float32)
+        if scales.ndim == 1:
+            scales = scales[:, np.newaxis]
+        # multiplicar R por S escala las columnas de R
+        out[:, :3, :3] *= scales[:, np.newaxis, :]
+
+    if translations is not None:
+        out[:, :3, 3] = translations
+
+    return out
+
+
+def decompose(matrices):
+    """
+    Descompone matrices (..., 4, 4) de la forma T @ R @ S (sin cizalle ni
+    proyección) en (traslaciones, rotaciones, escalas). Si la matriz refleja
+    (determinante negativo), la escala en x queda negativa.
+    """
+    matrices = np.asarray(matrices, dtype=np.float32)
+    translations = matrices[..., :3, 3].copy()
+    linear = matrices[..., :3, :3]
+
+    scales = np.linalg.norm(linear, axis=-2)
+    scales[..., 0] *= np.sign(np.linalg.det(linear)) + (np.linalg.det(linear) == 0)
+    rotations = from_matrix(linear / np.where(scales == 0, 1, scales)[..., np.newaxis, :])
+    return translations, rotations, scales.astype(np.float32)
+
+
+class TRS:
+    """
+    Pila de N transformaciones guardadas como traslación, rotación
+    (cuaternión) y escala.
+
+    Parámetros:
+    translations -- Arreglo (N,3)
+    rotations -- Arreglo (N,4) de cuaterniones
+    scales -- Arreglo (N,3)
+    """
+
+    def __init__(self, translations, rotations, scales):
+        self.translations = np.asarray(translations, dtype=np.float32).reshape(-1, 3)
+        self.rotations = np.asarray(rotations, dtype=np.float32).reshape(-1, 4)
+        self.scales = np.asarray(scales, dtype=np.float32).reshape(-1, 3)
+
+    @classmethod
+    def identity(cls, n):
+        return cls(np.zeros((n, 3)), identity(n), np.ones((n, 3)))
+
+    @classmethod
+    def from_matrices(cls, matrices):
+        return cls(*decompose(np.asarray(matrices).reshape(-1, 4, 4)))
+
+    @classmethod
+    def from_array(cls, array):
+        """
+        Crea la pila a partir de un arreglo (N,10) de as_array.
+        """
+        array = np.asarray(array, dtype=np.float32).reshape(-1, 10)
+        return cls(array[:, :3], array[:, 3:7], array[:, 7:])
+
+    def as_array(self):
+        """
+        Entrega un arreglo (N,10) float32: traslación, cuaternión y escala.
+        """
+        return np.concatenate([self.translations, self.rotations, self.scales], axis=1)
+
+    def matrices(self, out=None):
+        """
+        Entrega las matrices T @ R @ S (N,4,4) float32.
+        """
+        return compose(self.translations, self.rotations, self.scales, n=len(self), out=out)
+
+    def interpolate(self, other, t, spherical=True):
+        """
+        Interpola entre esta pila y other: traslación y escala lineales,
+        rotación con slerp (o nlerp si spherical es False).
+
+        Parámetros:
+        other -- Otra TRS del mismo tamaño (o de tamaño 1)
+        t -- Parámetro (o arreglo (N,) de parámetros) entre 0 y 1
+        """
+        t = np.asarray(t, dtype=np.float32)
+        lerp_t = t[..., np.newaxis]
+        return TRS(
+            self.translations + (other.translations - self.translations) * lerp_t,
+            (slerp if spherical else nlerp)(self.rotations, other.rotations, t),
+            self.scales + (other.scales - self.scales) * lerp_t,
+        )
+
+    def __len__(self):
+        return len(self.translations)
+
+
+def sample_keyframes(times, keyframes, t, spherical=True):
+    """
+    Evalúa una animación guardada como cuadros clave TRS en los instantes t.
+    Antes del primer cuadro (o después del último) entrega el primero (o el último).
+
+    Parámetros:
+    times -- Arreglo (K,) creciente con el instante de cada cuadro clave
+    keyframes -- Arreglo (K,10) de cuadros clave (ver TRS.as_array)
+    t -- Instante o arreglo (N,) de instantes
+    spherical -- Si es True, interpola las rotaciones con slerp; si no, con nlerp
+
+    Entrega una TRS con un elemento por instante.
+    """
+    times = np.asarray(times, dtype=np.float32)
+    keyframes = np.asarray(keyframes, dtype=np.float32).reshape(-1, 10)
+    t = np.atleast_1d(np.asarray(t, dtype=np.float32))
+
+    segment = np.clip(np.searchsorted(times, t, side="right") - 1, 0, max(len(times) - 2, 0))
+    following = np.minimum(segment + 1, len(times) - 1)
+    span = times[following] - times[segment]
+    local = np.clip((t - times[segment]) / np.where(span > 0, span, 1), 0, 1)
+
+    start = TRS.from_array(keyframes[segment])
+    end = TRS.from_array(keyframes[following])
+    return start.interpolate(end, local, spherical)
@@ -1,13 +1,92 @@
 import networkx as nx
-from .scenegraph_nodes import _node_from_file
+import numpy as np
+from .scenegraph_nodes import _node_from_file, _preprocess_file, _node_from_preprocessed
+from .scenegraph_hierarchy import SceneHierarchy, GlobalTransformsView
+from .scenegraph_render import RenderPlan, RenderStats
+from .uniforms import get_uniform_cache, UniformBlockBuffer
+from .scenegraph_geometry import GeometryCache
+from .scenegraph_culling import SceneBounds, frustum_planes
+from .scenegraph_static import static_batch_key, merge_static_nodes
+from .scenegraph_profiler import FrameProfiler
+from .scenegraph_streaming import AsyncLoader, placeholder_mesh, preprocessed_bytes, decode_texture
+from .textures import texture_2D_setup, texture_2D_upload, TextureCache
 import grafica.transformations as tr
+import grafica.quaternions as quaternions
 import pyglet.gl as GL
 import pyglet
+from PIL import Image
 from copy import copy
+import weakref
+from contextlib import nullcontext
+
+
+class _NodeAttributes(dict):
+    """
+    Diccionario de atributos de un nodo del grafo de escena.
+
+    Es igual a un diccionario normal, pero avisa al grafo cuando se reemplaza
+    la transformación del nodo (o sus atributos de instancia), para que
+    calculate_global_transforms recalcule solo los subárboles afectados.
+    El grafo se asocia al diccionario al reconstruir la jerarquía.
+    """
+
+    __slots__ = ("graph", "key")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.graph = None
+        self.key = None
+
+    def __setitem__(self, attr, value):
+        super().__setitem__(attr, value)
+        self._notify(attr)
+
+    def __delitem__(self, attr):
+        super().__delitem__(attr)
+        self._notify(attr)
+
+    def update(self, *args, **kwargs):
+        # networkx usa update al agregar nodos, así que pasamos por __setitem__
+        for attr, value in dict(*args, **kwargs).items():
+            self[attr] = value
+
+    def _notify(self, attr):
+        if self.graph is None:
+            return
+
+        if attr == "transform" or attr == "instance_attributes":
+            self.graph.mark_dirty(self.key)
+
+        # cualquier otro cambio puede afectar lo que se dibuja
+        if attr != "transform":
+            self.graph.invalidate_render_plan()
+
+
+def _no_section(name):
+    return nullcontext()
 
 
 class Scenegraph(nx.DiGraph):
+    node_attr_dict_factory = _NodeAttributes
+
     def __init__(self, root_key, transform=None):
+        # estado para el recálculo incremental de transformaciones globales
+        self._structure_dirty = True
+        self._dirty_nodes = set()
+        # índices (en la jerarquía) con transformación local ya escrita por set_transforms
+        self._dirty_indices = []
+        self._hierarchy = None
+        self._render_plan = None
+        self._render_plans = {}
+        self._geometry = GeometryCache()
+        # subárboles congelados: clave del nodo -> estado para descongelarlos
+        self._frozen = {}
+        self._global_block = None
+        self._bounds = None
+        self._culling_stats = {"nodes_tested": 0, "nodes_visible": 0, "nodes_culled": 0}
+        # mallas que se están cargando en segundo plano: nombre -> trabajo
+        self._loading = {}
+
         super().__init__()
         self.root_key = root_key
 
@@ -19,14 +98,33 @@ class Scenegraph(nx.DiGraph):
         self.meshes = {}
         self.pipelines = {}
         self.global_attributes = {"projection": tr.identity()}
-        self.global_transforms = {}
+        self.global_transforms = GlobalTransformsView()
         self.views = {None: tr.identity()}
         self.current_view = None
         self.view_parameter_name = 'view'
         self.transform_parameter_name = 'transform'
+        self.max_render_plans = 8
+        self.instanced_pipelines = {}
+        self.instance_data_parameter_name = 'instance_data'
+        self.instance_stride_parameter_name = 'instance_stride'
+        # descarta los subárboles fuera del frustum de projection @ vista actual
+        self.frustum_culling = False
+        # bloque de uniforms (uniform block) con la vista y los atributos globales
+        self.global_block_name = 'SceneGlobals'
+        # perfilador de cuadros (ver enable_profiler)
+        self.profiler = None
+        # caché en disco de mallas preprocesadas (ver grafica.mesh_cache.MeshCache)
+        self.mesh_cache = None
+        # texturas de las mallas cargadas, compartidas si tienen el mismo contenido
+        self.texture_cache = TextureCache()
+        # carga en segundo plano (ver load_and_register_mesh_async)
+        self.loader = None
+        self.loader_workers = 1
+        # bytes que se suben a la GPU por cuadro desde la carga en segundo plano
+        self.upload_budget = 8 << 20
 
     def load_and_register_pipeline(
-        self, name, vertex_program_path, fragment_program_path
+        self, name, vertex_program_path, fragment_program_path, instanced=False, instance_attributes=()
     ):
         with open(vertex_program_path) as f:
             vertex_source_code = f.read()
@@ -38,11 +136,29 @@ class Scenegraph(nx.DiGraph):
         vert_shader = pyglet.graphics.shader.Shader(vertex_source_code, "vertex")
         frag_shader = pyglet.graphics.shader.Shader(fragment_source_code, "fragment")
         pipeline = pyglet.graphics.shader.ShaderProgram(vert_shader, frag_shader)
-        self.register_pipeline(name, pipeline)
+        self.register_pipeline(name, pipeline, instanced, instance_attributes)
 
-    def register_pipeline(self, name, pipeline):
+    def register_pipeline(self, name, pipeline, instanced=False, instance_attributes=()):
+        """
+        Registra un pipeline con un nombre.
+
+        Parámetros:
+        name -- Nombre del pipeline
+        pipeline -- ShaderProgram de pyglet
+        instanced -- Si es True, las instancias de una misma malla con este pipeline
+                     se dibujan con una sola llamada instanciada
+                     (ver grafica.scenegraph_instancing)
+        instance_attributes -- Nombres de los atributos de instancia que cambian
+                               entre instancias (por ejemplo, bulb_color)
+        """
         self.pipelines[name] = pipeline
 
+        if instanced:
+            self.instanced_pipelines[name] = tuple(instance_attributes)
+        else:
+            self.instanced_pipelines.pop(name, None)
+        self.invalidate_render_plan()
+
     def register_view_transform(self, view_transform, name='default', set_as_current=True):
         self.views[name] = view_transform
         if set_as_current:
@@ -51,178 +167,661 @@ class Scenegraph(nx.DiGraph):
     def add_transform(self, name, transform):
         self.add_node(name, transform=transform)
 
+    # cualquier cambio en la estructura del grafo invalida el árbol
+    # de recorrido que usamos para recalcular transformaciones
+    def add_node(self, node_for_adding, **attr):
+        super().add_node(node_for_adding, **attr)
+        self._mark_structure_dirty()
+
+    def add_nodes_from(self, nodes_for_adding, **attr):
+        super().add_nodes_from(nodes_for_adding, **attr)
+        self._mark_structure_dirty()
+
+    def remove_node(self, n):
+        self._release_geometry([n])
+        super().remove_node(n)
+        self._mark_structure_dirty()
+
+    def remove_nodes_from(self, nodes):
+        nodes = list(nodes)
+        self._release_geometry(nodes)
+        super().remove_nodes_from(nodes)
+        self._mark_structure_dirty()
+
+    def add_edge(self, u_of_edge, v_of_edge, **attr):
+        super().add_edge(u_of_edge, v_of_edge, **attr)
+        self._mark_structure_dirty()
+
+    def add_edges_from(self, ebunch_to_add, **attr):
+        super().add_edges_from(ebunch_to_add, **attr)
+        self._mark_structure_dirty()
+
+    def remove_edge(self, u, v):
+        super().remove_edge(u, v)
+        self._mark_structure_dirty()
+
+    def remove_edges_from(self, ebunch):
+        super().remove_edges_from(ebunch)
+        self._mark_structure_dirty()
+
+    def clear(self):
+        self._release_geometry(list(self._node))
+        super().clear()
+        self._mark_structure_dirty()
+
+    def clear_edges(self):
+        super().clear_edges()
+        self._mark_structure_dirty()
+
+    def _mark_structure_dirty(self):
+        self._structure_dirty = True
+        self.invalidate_render_plan()
+
+    def mark_dirty(self, node_key):
+        """
+        Marca un nodo para que su transformación global (y la de su subárbol)
+        se recalcule en la próxima llamada a calculate_global_transforms.
+
+        Asignar graph.nodes[key]["transform"] ya marca el nodo automáticamente.
+        Hay que llamar a este método solo si se modifica una matriz "in place",
+        por ejemplo con graph.nodes[key]["transform"][:] = ...
+        """
+        self._dirty_nodes.add(node_key)
+
+    def set_transforms(self, keys, transforms=None, translations=None, rotations=None, scales=None):
+        """
+        Asigna las transformaciones de varios nodos a la vez y los marca para
+        recalcular sus transformaciones globales.
+
+        Se puede entregar una pila de matrices, o bien sus componentes
+        (traslación, rotación y escala), que se componen como T @ R @ S.
+
+        Parámetros:
+        keys -- Lista de N claves de nodos
+        transforms -- Pila (N,4,4) de transformaciones
+        translations -- Arreglo (N,3) de traslaciones
+        rotations -- Pila (N,3,3) de matrices de rotación, o (N,4) de cuaterniones
+                     (ver grafica.quaternions)
+        scales -- Arreglo (N,3) de escalas por eje, o (N,) de escalas uniformes
+        """
+        keys = list(keys)
+        if transforms is None:
+            transforms = quaternions.compose(translations, rotations, scales, n=len(keys))
+        else:
+            # copiamos para que los nodos no compartan memoria con el arreglo de entrada
+            transforms = np.array(transforms, dtype=np.float32).reshape(len(keys), 4, 4)
+
+        if self._structure_dirty or self._hierarchy is None:
+            self.calculate_global_transforms()
+        index = self._hierarchy.index
+
+        indices = []
+        positions = []
+        instanced = []
+        for i, node_key in enumerate(keys):
+            node = self._node[node_key]
+            # cada nodo guarda una vista de la pila; sin avisar al grafo nodo a nodo
+            dict.__setitem__(node, "transform", transforms[i])
+
+            node_index = index.get(node_key)
+            if node_index is None:
+                continue
+            indices.append(node_index)
+            positions.append(i)
+
+            instance_attributes = node.get("instance_attributes")
+            if node_key != self.root_key and instance_attributes and "transform" in instance_attributes:
+                instanced.append((len(indices) - 1, instance_attributes["transform"]))
+
+        if not indices:
+            return
+
+        indices = np.array(indices, dtype=np.int32)
+        local = transforms[positions]
+        if instanced:
+            rows = [row for row, _ in instanced]
+            local[rows] = local[rows] @ np.array([transform for _, transform in instanced], dtype=np.float32)
+
+        self._hierarchy.set_local(indices, local)
+        self._dirty_indices.append(indices)
+
     def load_and_register_mesh(self, name, filename, **kwargs):
+        kwargs.setdefault("cache", self.mesh_cache)
+        kwargs.setdefault("textures", self.texture_cache)
+        self._loading.pop(name, None)
         self.meshes[name] = _node_from_file(filename, name, **kwargs)
 
+    def get_mesh_optimization(self, name):
+        """
+        Entrega el resumen de la optimización de cada parte de la malla name
+        (vértices y ACMR antes y después), o una lista vacía si no se optimizó
+        (ver la opción optimize de load_and_register_mesh).
+        """
+        mesh = self.meshes[name]
+        return [
+            node["mesh"]["optimization"]
+            for node in [mesh] + mesh["children"]
+            if node.get("mesh") is not None and "optimization" in node["mesh"]
+        ]
+
     def register_mesh(self, name, mesh):
+        self._loading.pop(name, None)
         self.meshes[name] = mesh
 
+    def load_and_register_mesh_async(self, name, filename, placeholder=None, **kwargs):
+        """
+        Como load_and_register_mesh, pero no bloquea: registra de inmediato una
+        malla provisoria y lee el archivo en un hilo de trabajo. Al terminar,
+        render sube la malla a la GPU (respetando upload_budget) y la pone en
+        lugar de la provisoria en todas sus instancias, que conservan su nombre,
+        transformación, atributos de instancia y texturas agregadas.
+
+        Parámetros:
+        name -- Nombre de la malla
+        filename -- Archivo de la malla
+        placeholder -- Malla provisoria (por omisión, placeholder_mesh())
+        **kwargs -- Opciones de load_and_register_mesh
+        """
+        kwargs.setdefault("cache", self.mesh_cache)
+        textures = kwargs.pop("textures", self.texture_cache)
+        atlas = kwargs.pop("atlas", False)
+        if placeholder is None:
+            placeholder = placeholder_mesh()
+
+        self.meshes[name] = placeholder
+
+        def finish(preprocessed):
+            # si la malla se registró de nuevo mientras tanto, descartamos esta carga
+            if self._loading.get(name) is not job:
+                return
+            del self._loading[name]
+            self._replace_mesh(name, _node_from_preprocessed(preprocessed, id=name, textures=textures, atlas=atlas))
+
+        def fail(error):
+            # la malla provisoria se queda registrada
+            if self._loading.get(name) is job:
+                del self._loading[name]
+
+        job = self._get_loader().submit(
+            filename, lambda: _preprocess_file(filename, **kwargs), finish, cost=preprocessed_bytes, fail=fail
+        )
+        self._loading[name] = job
+        return job
+
+    def load_texture_async(self, filename, placeholder_color=(255, 255, 255, 255), flip_top_bottom=True, **texture_params):
+        """
+        Crea de inmediato una textura de 1x1 pixel y entrega su ID. La imagen
+        se decodifica en un hilo de trabajo y render la sube a esa misma
+        textura, así que el ID sigue siendo válido.
+
+        Parámetros:
+        filename -- Archivo de la imagen
+        placeholder_color -- Color RGBA de la textura provisoria
+        flip_top_bottom -- Si es True, invierte la imagen verticalmente
+        **texture_params -- Parámetros de texture_2D_setup (modos de wrap y filtro)
+        """
+        texture = texture_2D_setup(Image.new("RGBA", (1, 1), tuple(placeholder_color)), **texture_params)
+
+        def finish(image):
+            texture_2D_upload(texture, image, flip_top_bottom=False)
+
+        self._get_loader().submit(
+            filename,
+            lambda: decode_texture(filename, flip_top_bottom),
+            finish,
+            cost=lambda image: image.size[0] * image.size[1] * 4,
+        )
+        return texture
+
+    def is_loading(self, name=None):
+        """
+        Indica si la malla name (o cualquier trabajo, si name es None) se está cargando.
+        """
+        if name is not None:
+            return name in self._loading
+        return self.loader is not None and self.loader.pending > 0
+
+    def process_uploads(self, budget=None):
+        """
+        Sube a la GPU lo que ya terminó de cargarse en segundo plano, hasta
+        gastar budget bytes (por omisión, upload_budget). Render lo llama en
+        cada cuadro. Entrega la cantidad de bytes subidos.
+        """
+        if self.loader is None:
+            return 0
+        return self.loader.process(self.upload_budget if budget is None else budget)
+
+    def finish_loading(self, timeout=None):
+        """
+        Espera a que termine la carga en segundo plano y sube todo a la GPU.
+        """
+        if self.loader is not None:
+            self.loader.wait(timeout)
+            self.loader.process()
+
+    def close(self):
+        """
+        Detiene la carga en segundo plano (ver load_and_register_mesh_async).
+        Las mallas que no terminaron de cargarse quedan con su reemplazo provisorio.
+        """
+        if self.loader is not None:
+            self.loader.shutdown()
+            self.loader = None
+        self._loading.clear()
+
+    def _get_loader(self):
+        if self.loader is None:
+            self.loader = AsyncLoader(workers=self.loader_workers)
+            # por si el grafo se descarta sin llamar a close
+            weakref.finalize(self, self.loader.shutdown)
+        return self.loader
+
+    def _replace_mesh(self, mesh_name, mesh):
+        """
+        Registra mesh como mesh_name y la pone en lugar de la anterior en todas
+        las instancias de mesh_name.
+        """
+        old_mesh = self.meshes.get(mesh_name)
+        self.meshes[mesh_name] = mesh
+
+        roots = []
+        for node_key, attributes in self._node.items():
+            if attributes.get("mesh_name") != mesh_name:
+                continue
+            instance_attributes = attributes.get("instance_attributes")
+            if not any(
+                self._node[parent_key].get("instance_attributes") is instance_attributes
+                for parent_key in self.predecessors(node_key)
+            ):
+                roots.append(node_key)
+
+        for root_key in roots:
+            self._replace_instance(root_key, old_mesh, mesh, mesh_name)
+
+    def _replace_instance(self, root_key, old_mesh, mesh, mesh_name):
+        """
+        Pone mesh en lugar de old_mesh en la instancia root_key (y sus hijos).
+        """
+        attributes = self._node[root_key]
+        instance_attributes = attributes.get("instance_attributes")
+        children = [
+            child_key
+            for child_key in self.successors(root_key)
+            if self._node[child_key].get("instance_attributes") is instance_attributes
+        ]
+        nodes = [attributes] + [self._node[child_key] for child_key in children]
+
+        pipelines = [node["pipeline"] for node in nodes if node.get("pipeline") is not None]
+        if not pipelines:
+            return
+        pipeline = pipelines[0]
+
+        # texturas agregadas con add_texture_to_node ("diffuse" es la de la malla misma)
+        added_textures = {}
+        for node in nodes:
+            if node.get("mesh") is not None:
+                for texture_name, texture_id in node["mesh"].get("textures", {}).items():
+                    if texture_name != "diffuse":
+                        added_textures[texture_name] = texture_id
+
+        transform = attributes["transform"]
+        transparent = attributes.get("transparent")
+
+        self.remove_nodes_from(children)
+        if "geometry_key" in attributes:
+            self._geometry.release(attributes["geometry_key"])
+
+        replacement = self._instance_node(mesh, None, pipeline, instance_attributes, mesh_name)
+        # si el usuario cambió la transformación de la instancia, la conservamos
+        if transform is not old_mesh["transform"]:
+            replacement["transform"] = transform
+
+        # reemplazamos los atributos sin avisar al grafo en cada cambio
+        for attr in set(attributes) - set(replacement):
+            dict.__delitem__(attributes, attr)
+        dict.update(attributes, replacement)
+
+        self._add_instance_children(root_key, mesh, pipeline, mesh_name, instance_attributes)
+
+        for texture_name, texture_id in added_textures.items():
+            self.add_texture_to_node(root_key, texture_name, texture_id)
+        if transparent is not None:
+            self.set_transparent(root_key, transparent)
+
+        self.mark_dirty(root_key)
+        self.invalidate_render_plan()
+
     def add_mesh_instance(self, name, mesh_name, pipeline, **instance_attributes):
 
         self._add_instance(
-            name, self.meshes[mesh_name], pipeline, **instance_attributes
+            name, self.meshes[mesh_name], pipeline, mesh_name=mesh_name, **instance_attributes
         )
 
-    def _add_instance(self, name, mesh, pipeline, **instance_attributes):
+    def _add_instance(self, name, mesh, pipeline, mesh_name=None, **instance_attributes):
         if instance_attributes is None:
             instance_attributes = {}
 
-        self.add_node(name, **self._instance_node(mesh, pipeline, instance_attributes))
+        self.add_node(name, **self._instance_node(mesh, None, pipeline, instance_attributes, mesh_name))
+        self._add_instance_children(name, mesh, pipeline, mesh_name, instance_attributes)
 
+    def _add_instance_children(self, name, mesh, pipeline, mesh_name, instance_attributes):
         for i, child in enumerate(mesh["children"]):
             child_name = f"{name}_child_{i}"
             self.add_node(
-                child_name, **self._instance_node(child, pipeline, instance_attributes)
+                child_name, **self._instance_node(mesh, i, pipeline, instance_attributes, mesh_name)
             )
             self.add_edge(name, child_name)
 
+    def remove_mesh_instance(self, name):
+        """
+        Elimina una instancia de malla (y los nodos de sus hijos).
+        La geometría en la GPU se libera cuando ya no la usa ninguna instancia.
+        """
+        instance_attributes = self.nodes[name].get("instance_attributes")
+        children = [
+            child_key
+            for child_key in self.successors(name)
+            if self.nodes[child_key].get("instance_attributes") is instance_attributes
+        ]
+        self.remove_nodes_from([name] + children)
+
+    def freeze(self, node_key):
+        """
+        Congela el subárbol de node_key (sin incluir a node_key) para dibujarlo
+        con menos llamadas: la geometría de sus nodos se transforma al espacio
+        de node_key y se une en un nodo por cada combinación de pipeline,
+        texturas, tipo de primitiva y uniforms de instancia.
+
+        Los nodos congelados se reemplazan por esos nodos unidos, que cuelgan de
+        node_key, así que la transformación de node_key se puede seguir
+        modificando. Los nodos originales (y su geometría en la GPU) se guardan
+        hasta que se llame a unfreeze.
+
+        Parámetros:
+        node_key -- Clave del nodo cuyo subárbol se congela
+
+        Entrega las claves de los nodos unidos.
+        """
+        if node_key in self._frozen:
+            raise ValueError(f"El subárbol de {node_key} ya está congelado")
+
+        self.calculate_global_transforms()
+        hierarchy = self._hierarchy
+        if node_key not in hierarchy.index:
+            raise ValueError(f"El nodo {node_key} no cuelga de la raíz del grafo")
+
+        start = hierarchy.index[node_key]
+        end = hierarchy.subtree_end[start]
+        subtree = hierarchy.keys[start + 1 : end]
+
+        inside = set(subtree)
+        inside.add(node_key)
+        for key in subtree:
+            if key in self._frozen:
+                raise ValueError(f"El subárbol de {key} ya está congelado")
+            if any(parent not in inside for parent in self.predecessors(key)):
+                raise ValueError(f"El nodo {key} también cuelga de un nodo fuera del subárbol")
+
+        # transformaciones relativas a node_key, compuestas desde sus transformaciones
+        # locales (la global de node_key puede no ser invertible, por ejemplo con escala 0)
+        relative = hierarchy.relative_transforms(start)
+
+        groups = {}
+        for key, transform in zip(subtree, relative):
+            node = self._node[key]
+            if node.get("mesh") is None or node.get("pipeline") is None:
+                continue
+            nodes, transforms = groups.setdefault(static_batch_key(key, node), ([], []))
+            nodes.append(node)
+            transforms.append(transform)
+
+        # unimos todo antes de tocar el grafo, por si algún nodo no se puede congelar
+        merged = [
+            (nodes[0]["pipeline"], merge_static_nodes(nodes, transforms))
+            for nodes, transforms in groups.values()
+        ]
+
+        frozen = {
+            "nodes": [(key, dict(self._node[key])) for key in subtree],
+            "edges": list(self.out_edges([node_key] + subtree, data=True)),
+            "merged": [],
+        }
+
+        # quitamos los nodos sin liberar su geometría, que se usará al descongelar
+        nx.DiGraph.remove_nodes_from(self, subtree)
+        self._frozen[node_key] = frozen
+
+        for i, (pipeline, node) in enumerate(merged):
+            geometry_key, mesh_gpu = self._geometry.acquire(node, None, self.pipelines[pipeline])
+            node.update(
+                pipeline=pipeline,
+                mesh_gpu=mesh_gpu,
+                geometry_key=geometry_key,
+                transform=tr.identity(),
+            )
+
+            merged_key = f"{node_key}_static_{i}"
+            self.add_node(merged_key, **node)
+            self.add_edge(node_key, merged_key)
+            frozen["merged"].append(merged_key)
+
+        self._mark_structure_dirty()
+        return list(frozen["merged"])
+
+    def unfreeze(self, node_key):
+        """
+        Deshace freeze: elimina los nodos unidos y restaura el subárbol original.
+        """
+        frozen = self._frozen.pop(node_key, None)
+        if frozen is None:
+            raise ValueError(f"El subárbol de {node_key} no está congelado")
+
+        self.remove_nodes_from(frozen["merged"])
+
+        for key, attributes in frozen["nodes"]:
+            nx.DiGraph.add_node(self, key, **attributes)
+        nx.DiGraph.add_edges_from(self, frozen["edges"])
+        self._mark_structure_dirty()
+
+    def is_frozen(self, node_key):
+        return node_key in self._frozen
+
     def render(self, recalculate_transforms=True, **pipeline_attrs):
         """
         Renderiza el grafo de escena.
 
+        El recorrido del grafo se compila en un plan de dibujo (ver RenderPlan)
+        que se reutiliza en cada cuadro, hasta que el grafo cambie.
+
         Parámetros:
         recalculate_transforms -- Si es True, recalcula las transformaciones globales
         **pipeline_attrs -- Atributos adicionales para las pipelines
         """
-        # por cada pipeline, configuramos sus atributos uniform
-        for pipeline_name, pipeline in self.pipelines.items():
-            pipeline.use()
-            
-            # configura la cámara (mat4)
-            # si no se ha indicado una, utiliza la identidad
-            try:
-                pipeline[self.view_parameter_name] = self.views[self.current_view].reshape(16, 1, order="F")
-            # esto sucederá si el shader no tiene el parámetro de vista
-            except pyglet.graphics.shader.ShaderException as e:
-                pass
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin_frame()
+            section = profiler.section
+        else:
+            section = _no_section
 
+        # mallas y texturas cargadas en segundo plano
+        if self.loader is not None:
+            with section("uploads"):
+                self.process_uploads()
 
-            for attr, value in self.global_attributes.items():
-                if not (type(value) == float or type(value) == int):
-                    size = value.shape[0]
+        # Calcular transformaciones globales si es necesario
+        with section("transforms"):
+            if recalculate_transforms or self._hierarchy is None or self._structure_dirty:
+                self.calculate_global_transforms()
 
-                    if len(value.shape) > 1:
-                        size = size * value.shape[1]
+        # hay un plan por cada asignación de pipelines, así que se pueden
+        # intercambiar pipelines entre cuadros sin recompilar
+        with section("plan"):
+            signature = tuple((name, id(pipeline)) for name, pipeline in self.pipelines.items())
+            self._render_plan = self._render_plans.get(signature)
+            if self._render_plan is None:
+                if len(self._render_plans) >= self.max_render_plans:
+                    self.invalidate_render_plan()
+                self._render_plan = self._render_plans[signature] = RenderPlan.compile(self)
 
-                    value = value.reshape(size, 1, order="F")
+        with section("culling"):
+            visible = self._cull() if self.frustum_culling else None
 
-                # esto no es lo más adecuado
-                # (pero no logré hacerlo de otra forma)
-                try:
-                    pipeline[attr] = value
-                except pyglet.graphics.shader.ShaderException as e:
-                    continue
+        self._render_plan.execute(
+            self._hierarchy.world,
+            self.views[self.current_view],
+            self.global_attributes,
+            self.view_parameter_name,
+            visible,
+            self._get_global_block(),
+            profiler,
+        )
 
-            pipeline.stop()
+        if profiler is not None:
+            profiler.end_frame(
+                self._render_plan.stats.as_dict(),
+                self._culling_stats if self.frustum_culling else {},
+            )
 
-        # Calcular transformaciones globales si es necesario
-        if recalculate_transforms or not self.global_transforms:
-            self.calculate_global_transforms()
+    def enable_profiler(self, per_node=False, max_frames=1000):
+        """
+        Activa el perfilador de cuadros (ver FrameProfiler) y lo entrega.
 
-        for node_key, current_node in self.nodes.items():
-            if "mesh" in current_node:
-                if current_node["pipeline"] is None:
-                    continue
-                current_pipeline = self.pipelines[current_node["pipeline"]]
-                current_pipeline.use()
-
-                # Usar la transformación global ya calculada
-                try:
-                    current_pipeline[self.transform_parameter_name] = self.global_transforms[
-                        node_key
-                    ].reshape(16, 1, order="F")
-                except pyglet.graphics.shader.ShaderException as e:
-                    pass 
-
-                # Aplicar atributos de instancia
-                if "instance_attributes" in current_node:
-                    instance_attrs = current_node["instance_attributes"]
-
-                    for attr in instance_attrs.keys():
-                        if attr == "transform":
-                            continue
-
-                        current_attr = instance_attrs[attr]
-
-                        if type(current_attr) == float or type(current_attr) == int:
-                            current_pipeline[attr] = current_attr
-                        else:
-                            current_size = instance_attrs[attr].shape[0]
-
-                            if len(instance_attrs[attr].shape) > 1:
-                                current_size = (
-                                    current_size * instance_attrs[attr].shape[1]
-                                )
-
-                            current_pipeline[attr] = instance_attrs[attr].reshape(
-                                current_size, 1, order="F"
-                            )
-
-                # Configurar texturas: primero la textura por defecto (mantener compatibilidad)
-                initial_texture_unit = 0
-                if (
-                    "texture" in current_node["mesh"]
-                    and current_node["mesh"]["texture"] is not None
-                ):
-                    GL.glActiveTexture(GL.GL_TEXTURE0)
-                    GL.glBindTexture(GL.GL_TEXTURE_2D, current_node["mesh"]["texture"])
-                    initial_texture_unit = 1
-                    # try:
-                    #     current_pipeline["diffuse_texture"] = 0
-                    # except pyglet.graphics.shader.ShaderException:
-                    #     pass
-                else:
-                    GL.glActiveTexture(GL.GL_TEXTURE0)
-                    GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
-                
-                # Configurar texturas adicionales usando enumerate
-                if 'textures' in current_node["mesh"]:
-                    for i, (tex_name, tex_id) in enumerate(current_node["mesh"]["textures"].items(), initial_texture_unit):
-                        if tex_name == 'diffuse':  # Saltar 'diffuse' que ya se manejó arriba
-                            continue
-                            
-                        GL.glActiveTexture(GL.GL_TEXTURE0 + i)
-                        GL.glBindTexture(GL.GL_TEXTURE_2D, tex_id)
-                        
-                        # Intentar configurar el uniform en el shader
-                        try:
-                            current_pipeline[tex_name] = i
-                        except pyglet.graphics.shader.ShaderException:
-                            pass
-
-                # Dibujar!
-                current_node["mesh_gpu"].draw(current_node.get("GL_TYPE"))
-
-    def __add_pipeline_single_node(self, node, pipeline_name):
-        if "mesh" not in node or node["mesh"] is None:
-            node["pipeline"] = None
-            return
+        Parámetros:
+        per_node -- Si es True, también registra el tiempo de dibujo de cada nodo
+        max_frames -- Cantidad máxima de cuadros guardados
+        """
+        self.profiler = FrameProfiler(per_node=per_node, max_frames=max_frames)
+        return self.profiler
 
-        pipeline = self.pipelines[pipeline_name]
+    def disable_profiler(self):
+        """
+        Desactiva el perfilador y entrega el que estaba activo (o None).
+        """
+        profiler, self.profiler = self.profiler, None
+        return profiler
 
-        mesh_gpu = pipeline.vertex_list_indexed(
-            node["mesh"]["n_vertices"], node["GL_TYPE"], node["indices"]
-        )
+    def _get_global_block(self):
+        """
+        Entrega el buffer del bloque de uniforms globales (ver global_block_name),
+        creándolo a partir del primer pipeline que lo declare, o None si ninguno lo hace.
+        """
+        block = self._render_plan.global_block
+        if block is None:
+            return None
 
-        node["pipeline"] = pipeline_name
-        node["mesh_gpu"] = mesh_gpu
+        if self._global_block is None or self._global_block.name != block.name:
+            self._global_block = UniformBlockBuffer(block)
+        return self._global_block
 
-        for attr in node["attributes"]:
-            if node["attributes"][attr] is not None and hasattr(mesh_gpu, attr):
-                getattr(mesh_gpu, attr)[:] = node["attributes"][attr]
+    def _cull(self):
+        """
+        Calcula qué nodos están dentro del frustum de la cámara actual.
+        Las cajas contenedoras se recalculan solo si cambiaron las transformaciones.
+        """
+        if self._bounds is None or self._bounds.hierarchy is not self._hierarchy:
+            self._bounds = SceneBounds(self, self._hierarchy)
+        self._bounds.update(self._hierarchy.version)
+
+        clip_transform = self.global_attributes.get("projection", tr.identity()) @ self.views[self.current_view]
+        visible, tests = self._bounds.cull(frustum_planes(clip_transform))
 
-    def _add_node_pipeline(self, node, pipeline):
-        self.__add_pipeline_single_node(node, pipeline)
-        for child in node["children"]:
-            self.__add_pipeline_single_node(child, pipeline)
+        n_visible = int(visible.sum())
+        self._culling_stats = {
+            "nodes_tested": tests,
+            "nodes_visible": n_visible,
+            "nodes_culled": len(visible) - n_visible,
+        }
+        return visible
 
-    def _instance_node(self, node, pipeline, instance_attrs=None):
+    def get_culling_stats(self):
+        """
+        Entrega los contadores del último cuadro dibujado con frustum_culling:
+        nodos probados contra el frustum, nodos visibles y nodos descartados
+        (incluyendo los que se descartaron junto con su subárbol).
+        """
+        return dict(self._culling_stats)
+
+    def get_render_stats(self):
+        """
+        Entrega los contadores del último cuadro dibujado: llamadas de dibujo,
+        cambios de pipeline y de textura, y cuántos de ellos se evitaron
+        gracias al orden por estado.
+        """
+        if self._render_plan is None:
+            return RenderStats().as_dict()
+        return self._render_plan.stats.as_dict()
+
+    def set_transparent(self, node_key, transparent=True):
+        """
+        Marca un nodo (y sus hijos, si es una instancia de malla) como transparente.
+        Los nodos transparentes se dibujan después de los opacos, de atrás hacia adelante.
+        """
+        self.nodes[node_key]["transparent"] = transparent
+        for child_key in self.successors(node_key):
+            if self.nodes[child_key].get("instance_attributes") is self.nodes[node_key].get("instance_attributes"):
+                self.nodes[child_key]["transparent"] = transparent
+
+    def invalidate_render_plan(self):
+        """
+        Descarta el plan de dibujo compilado; se volverá a compilar en el próximo render.
+
+        El grafo lo hace automáticamente al cambiar su estructura, sus pipelines
+        o texturas. Los atributos de instancia se leen en cada cuadro, así que
+        no hace falta llamarlo al modificarlos; la excepción son los nodos de
+        pipelines instanciados, cuyos atributos se empaquetan al compilar:
+        si se modifican sin pasar por apply_instance_attributes, hay que llamarlo.
+        """
+        for plan in self._render_plans.values():
+            plan.release()
+        self._render_plan = None
+        self._render_plans.clear()
+        # la geometría de algún nodo pudo cambiar, así que también sus cajas
+        self._bounds = None
+
+    def invalidate_uniform_cache(self):
+        """
+        Olvida los valores de uniforms guardados para los pipelines del grafo.
+        Hay que llamarlo si se escriben uniforms directamente en esos pipelines
+        (pipeline[name] = value), porque el grafo omite las escrituras repetidas.
+        """
+        for pipeline in self.pipelines.values():
+            get_uniform_cache(pipeline).invalidate()
+
+    def _instance_node(self, mesh, child_index, pipeline, instance_attrs=None, mesh_name=None):
+        """
+        Crea los atributos de un nodo instancia del hijo child_index de mesh
+        (o de mesh mismo si child_index es None). Las instancias de una misma
+        malla y pipeline comparten la geometría en la GPU.
+        """
+        node = mesh if child_index is None else mesh["children"][child_index]
         instance = copy(node)
-        self._add_node_pipeline(instance, pipeline)
+        instance["mesh_name"] = mesh_name
+
+        if "mesh" not in node or node["mesh"] is None:
+            instance["pipeline"] = None
+        else:
+            key, mesh_gpu = self._geometry.acquire(mesh, child_index, self.pipelines[pipeline])
+            instance["pipeline"] = pipeline
+            instance["mesh_gpu"] = mesh_gpu
+            instance["geometry_key"] = key
+
         instance["instance_attributes"] = instance_attrs
 
         return instance
 
+    def _release_geometry(self, node_keys):
+        for node_key in node_keys:
+            if node_key in self._node and "geometry_key" in self._node[node_key]:
+                self._geometry.release(self._node[node_key]["geometry_key"])
+
+            # los nodos guardados de un subárbol congelado también tienen geometría
+            frozen = self._frozen.pop(node_key, None)
+            if frozen is not None:
+                for _, attributes in frozen["nodes"]:
+                    if "geometry_key" in attributes:
+                        self._geometry.release(attributes["geometry_key"])
+
     def apply_instance_attributes(self, node_key, **attrs):
         """
         Aplica o actualiza atributos de instancia a un nodo existente
@@ -233,64 +832,146 @@ class Scenegraph(nx.DiGraph):
         """
 
         node = self.nodes[node_key]
-        if "instance_attributes" not in node:
+        if node.get("instance_attributes") is None:
             node["instance_attributes"] = {}
+        instance_attributes = node["instance_attributes"]
 
         # Actualizar los atributos existentes o añadir nuevos
+        added = any(key not in instance_attributes for key in attrs)
         for key, value in attrs.items():
-            node["instance_attributes"][key] = value
+            instance_attributes[key] = value
+
+        # el plan lee los uniforms de cada nodo en cada cuadro; solo hay que
+        # compilarlo de nuevo si aparece un atributo o si cambia un grupo instanciado
+        if added:
+            self.invalidate_render_plan()
+        else:
+            self._update_instance_batches(instance_attributes, attrs)
+
+        if "transform" in attrs:
+            self.mark_dirty(node_key)
+            # las instancias comparten el diccionario de atributos con sus hijos,
+            # así que el padre que lo comparte también cambió
+            for parent_key in self.predecessors(node_key):
+                if self.nodes[parent_key].get("instance_attributes") is node["instance_attributes"]:
+                    self.mark_dirty(parent_key)
+
+    def _update_instance_batches(self, instance_attributes, names):
+        """
+        Actualiza los grupos instanciados que contienen un diccionario de
+        atributos de instancia después de cambiar los atributos names.
+        """
+        for plan in self._render_plans.values():
+            for batch, cache in plan.instance_batches.get(id(instance_attributes), ()):
+                if any(name in batch.names for name in names):
+                    if not batch.refresh():
+                        self.invalidate_render_plan()
+                        return
+                # los uniforms compartidos definen el grupo: el nodo puede cambiar de grupo
+                if any(name != "transform" and name not in batch.names and name in cache for name in names):
+                    self.invalidate_render_plan()
+                    return
 
     def set_global_attributes(self, **attrs):
         self.global_attributes.update(attrs)
 
-    def calculate_global_transforms(self):
+    def calculate_global_transforms(self, full=False):
         """
         Calcula las transformaciones globales para todos los nodos del grafo
         y las almacena en self.global_transforms.
+
+        Las transformaciones se guardan en una jerarquía compilada
+        (ver SceneHierarchy) y se evalúan nivel a nivel con np.matmul sobre
+        pilas de matrices. Si la estructura del grafo no ha cambiado, solo se
+        recalculan los subárboles de los nodos modificados.
+
+        Parámetros:
+        full -- Si es True, se recompila la jerarquía y se recalculan todas las
+                transformaciones aunque el grafo no haya cambiado
         """
-        self.global_transforms = {self.root_key: self.nodes[self.root_key]["transform"]}
+        if full or self._structure_dirty or self._hierarchy is None:
+            return self._rebuild_global_transforms()
+
+        if not self._dirty_nodes and not self._dirty_indices:
+            return self.global_transforms
+
+        index = self._hierarchy.index
+        dirty = [index[node_key] for node_key in self._dirty_nodes if node_key in index]
+        self._dirty_nodes = set()
+
+        if dirty:
+            self._hierarchy.set_local(
+                dirty, [self._local_transform(self._hierarchy.keys[i]) for i in dirty]
+            )
+
+        # las transformaciones locales de set_transforms ya están escritas
+        dirty = np.concatenate([np.array(dirty, dtype=np.int32)] + self._dirty_indices)
+        self._dirty_indices = []
+
+        if len(dirty):
+            self._hierarchy.update(dirty)
+
+        return self.global_transforms
+
+    def _local_transform(self, node_key):
+        node = self.nodes[node_key]
+        transform = node.get("transform", tr.identity())
+
+        # la raíz no considera transformaciones de instancia
+        if node_key == self.root_key:
+            return transform
 
-        # tenemos que hacer un recorrido basado en profundidad (DFS).
-        # networkx provee una función que nos entrega dicho recorrido!
-        # hay que recorrerlo desde un nodo raíz, que almacenamos como atributo del grafo
-        edges = list(nx.edge_dfs(self, source=self.root_key))
+        # Considerar transformaciones de instancia si existen
+        instance_attributes = node.get("instance_attributes")
+        if instance_attributes and "transform" in instance_attributes:
+            transform = transform @ instance_attributes["transform"]
 
-        for src, dst in edges:
-            if dst not in self.global_transforms:
-                dst_transform = self.nodes[dst].get("transform", tr.identity())
+        return transform
 
-                # Considerar transformaciones de instancia si existen
-                if (
-                    "instance_attributes" in self.nodes[dst]
-                    and "transform" in self.nodes[dst]["instance_attributes"]
-                ):
-                    dst_transform = (
-                        dst_transform
-                        @ self.nodes[dst]["instance_attributes"]["transform"]
-                    )
+    def _rebuild_global_transforms(self):
+        # tenemos que hacer un recorrido basado en profundidad (DFS) desde la raíz,
+        # que almacenamos como atributo del grafo. El recorrido queda compilado
+        # en arreglos para evaluarlo de manera vectorizada
+        self._hierarchy = SceneHierarchy.from_graph(self, self.root_key)
+        self._hierarchy.set_local(
+            slice(None), [self._local_transform(node_key) for node_key in self._hierarchy.keys]
+        )
+        self._hierarchy.update()
+        self.global_transforms = GlobalTransformsView(self._hierarchy)
+        self.invalidate_render_plan()
 
-                self.global_transforms[dst] = (
-                    self.global_transforms[src] @ dst_transform
-                )
+        # asociamos los atributos de cada nodo al grafo para detectar cambios
+        for node_key, attributes in self.nodes.items():
+            if isinstance(attributes, _NodeAttributes):
+                attributes.graph = self
+                attributes.key = node_key
 
+        self._structure_dirty = False
+        self._dirty_nodes = set()
+        self._dirty_indices = []
         return self.global_transforms
 
     def get_global_transform(self, node_key):
         """
         Obtiene la transformación global para un nodo específico.
-        Si las transformaciones globales no están calculadas, las calcula primero.
+        Si las transformaciones globales no están calculadas (o hay nodos
+        modificados desde el último cálculo), las calcula primero.
         """
-        if not self.global_transforms or node_key not in self.global_transforms:
+        if self._structure_dirty or self._dirty_nodes or self._dirty_indices or self._hierarchy is None:
             self.calculate_global_transforms()
 
-        return self.global_transforms.get(node_key, tr.identity())
+        if node_key not in self._hierarchy.index:
+            return tr.identity()
+
+        # una copia: modificarla no debe alterar la pila de transformaciones globales
+        return self._hierarchy.world[self._hierarchy.index[node_key]].copy()
 
     def get_global_position(self, node_key):
         """
         Obtiene la posición global de un nodo.
         """
         transform = self.get_global_transform(node_key)
-        return transform[0:3, 3]
+        return transform[0:3, 3].copy()
 
     def add_texture_to_node(self, node_key, texture_name, texture_id):
         """
@@ -313,6 +994,8 @@ class Scenegraph(nx.DiGraph):
             
             current_node['mesh']['textures'][texture_name] = texture_id
             return True
+
+        self.invalidate_render_plan()
         
         # Primero intentamos agregar al nodo principal
         added_to_main = _add_texture_to_single_node(node)
@@ -343,6 +1026,8 @@ class Scenegraph(nx.DiGraph):
                 if texture_name in current_node['mesh']['textures']:
                     del current_node['mesh']['textures'][texture_name]
         
+        self.invalidate_render_plan()
+
         # Eliminar del nodo principal
         _remove_texture_from_single_node(node)
         
@@ -0,0 +1,153 @@
+import numpy as np
+
+
+def node_local_bounds(node):
+    """
+    Entrega la caja contenedora (mínimo, máximo) de la geometría de un nodo
+    en su espacio local, o None si el nodo no tiene geometría.
+
+    Se usa object.bounds (trimesh) si existe; si no, las posiciones de los vértices.
+    """
+    if node.get("mesh") is None:
+        return None
+
+    bounds = getattr(node.get("object"), "bounds", None)
+    if bounds is not None:
+        return np.asarray(bounds[0], dtype=np.float32), np.asarray(bounds[1], dtype=np.float32)
+
+    positions = node.get("attributes", {}).get("position")
+    n_vertices = node["mesh"].get("n_vertices", 0)
+    if positions is None or n_vertices == 0:
+        return None
+
+    positions = np.asarray(positions, dtype=np.float32).reshape(n_vertices, -1)
+    if positions.shape[1] < 3:
+        # posiciones en 2D: completamos con z = 0
+        positions = np.hstack(
+            (positions, np.zeros((n_vertices, 3 - positions.shape[1]), dtype=np.float32))
+        )
+    positions = positions[:, :3]
+    return positions.min(axis=0), positions.max(axis=0)
+
+
+def frustum_planes(clip_transform):
+    """
+    Extrae los 6 planos del frustum de una matriz projection @ view
+    (método de Gribb y Hartmann). Cada fila es (a, b, c, d), con la normal
+    apuntando hacia el interior del frustum y normalizada.
+    """
+    m = np.asarray(clip_transform, dtype=np.float64)
+    planes = np.array(
+        [
+            m[3] + m[0],  # izquierda
+            m[3] - m[0],  # derecha
+            m[3] + m[1],  # abajo
+            m[3] - m[1],  # arriba
+            m[3] + m[2],  # cerca
+            m[3] - m[2],  # lejos
+        ]
+    )
+    norms = np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (planes / norms).astype(np.float32)
+
+
+class SceneBounds:
+    """
+    Cajas contenedoras alineadas a los ejes (AABB) de cada nodo de una
+    SceneHierarchy, en el espacio del mundo.
+
+    La caja de un nodo incluye su propia geometría y la de todo su subárbol.
+    """
+
+    def __init__(self, graph, hierarchy):
+        self.hierarchy = hierarchy
+
+        n_nodes = len(hierarchy)
+        centers = np.zeros((n_nodes, 3), dtype=np.float32)
+        extents = np.zeros((n_nodes, 3), dtype=np.float32)
+        has_bounds = np.zeros(n_nodes, dtype=bool)
+
+        for i, node_key in enumerate(hierarchy.keys):
+            bounds = node_local_bounds(graph.nodes[node_key])
+            if bounds is not None:
+                centers[i] = (bounds[0] + bounds[1]) * 0.5
+                extents[i] = (bounds[1] - bounds[0]) * 0.5
+                has_bounds[i] = True
+
+        self._with_bounds = np.flatnonzero(has_bounds)
+        self._centers = centers[self._with_bounds]
+        self._extents = extents[self._with_bounds]
+
+        self.min = np.empty((n_nodes, 3), dtype=np.float32)
+        self.max = np.empty((n_nodes, 3), dtype=np.float32)
+        self._version = None
+
+    def update(self, version=None):
+        """
+        Recalcula las cajas en el espacio del mundo a partir de las
+        transformaciones globales. Si version coincide con la del último
+        cálculo, no hace nada.
+        """
+        if version is not None and version == self._version:
+            return
+        self._version = version
+
+        hierarchy = self.hierarchy
+        world = hierarchy.world[self._with_bounds]
+        rotation = world[:, :3, :3]
+
+        # centro transformado y semi-extensión transformada (Arvo)
+        centers = np.einsum("nij,nj->ni", rotation, self._centers) + world[:, :3, 3]
+        extents = np.einsum("nij,nj->ni", np.abs(rotation), self._extents)
+
+        self.min.fill(np.inf)
+        self.max.fill(-np.inf)
+        self.min[self._with_bounds] = centers - extents
+        self.max[self._with_bounds] = centers + extents
+
+        # unimos las cajas de abajo hacia arriba, un nivel a la vez
+        for level in reversed(hierarchy.levels[1:]):
+            parents = hierarchy.parent[level]
+            np.minimum.at(self.min, parents, self.min[level])
+            np.maximum.at(self.max, parents, self.max[level])
+
+    def cull(self, planes):
+        """
+        Determina qué nodos son visibles dentro del frustum. Se prueba cada nivel
+        solo con los nodos cuyo padre es visible, así que un subárbol completo
+        fuera del frustum cuesta una sola prueba.
+
+        Entrega (máscara de visibilidad, cantidad de pruebas realizadas).
+        """
+        hierarchy = self.hierarchy
+        visible = np.zeros(len(hierarchy), dtype=bool)
+        tests = 0
+
+        candidates = hierarchy.levels[0]
+        for depth in range(len(hierarchy.levels)):
+            if depth > 0:
+                level = hierarchy.levels[depth]
+                candidates = level[visible[hierarchy.parent[level]]]
+            if len(candidates) == 0:
+                break
+
+            visible[candidates] = self._inside(candidates, planes)
+            tests += len(candidates)
+
+        return visible, tests
+
+    def _inside(self, indices, planes):
+        low = self.min[indices]
+        high = self.max[indices]
+
+        # los nodos sin geometría en su subárbol no se pueden descartar
+        empty = ~np.isfinite(low).all(axis=1)
+        low = np.where(empty[:, None], 0.0, low)
+        high = np.where(empty[:, None], 0.0, high)
+
+        centers = (low + high) * 0.5
+        extents = (high - low) * 0.5
+        distance = centers @ planes[:, :3].T + planes[:, 3]
+        radius = extents @ np.abs(planes[:, :3]).T
+        return (distance + radius >= 0).all(axis=1) | empty
@@ -0,0 +1,99 @@
+import ctypes
+
+import numpy as np
+
+
+def upload_geometry(node, pipeline):
+    """
+    Sube la geometría de un nodo de malla a la GPU, usando el pipeline dado.
+    Entrega la vertex list indexada de pyglet.
+
+    Los atributos que son arreglos de NumPy se copian (y convierten de tipo)
+    directo a la memoria de la vertex list, sin pasar por listas de Python.
+    """
+    indices = node["indices"]
+    if isinstance(indices, np.ndarray):
+        # pyglet recorre los índices en Python, así que una lista es lo más rápido
+        indices = indices.tolist()
+
+    mesh_gpu = pipeline.vertex_list_indexed(node["mesh"]["n_vertices"], node["GL_TYPE"], indices)
+
+    for attr, values in node["attributes"].items():
+        if values is None or not hasattr(mesh_gpu, attr):
+            continue
+
+        region = getattr(mesh_gpu, attr)
+        if isinstance(values, np.ndarray) and isinstance(region, ctypes.Array):
+            np.ctypeslib.as_array(region).reshape(-1)[:] = values.reshape(-1)
+        else:
+            region[:] = values
+
+    return mesh_gpu
+
+
+class _GeometryEntry:
+    __slots__ = ("mesh_gpu", "refcount", "mesh", "pipeline")
+
+    def __init__(self, mesh_gpu, mesh, pipeline):
+        self.mesh_gpu = mesh_gpu
+        self.refcount = 0
+        # guardamos las referencias para que los id de la llave sigan siendo válidos
+        self.mesh = mesh
+        self.pipeline = pipeline
+
+
+class GeometryCache:
+    """
+    Caché de geometría en la GPU compartida entre instancias de una malla.
+
+    Cada entrada corresponde a (malla registrada, índice de hijo, pipeline) y
+    cuenta cuántas instancias la usan. Cuando la última instancia la libera,
+    se borra su vertex list.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    @staticmethod
+    def key(mesh, child_index, pipeline):
+        """
+        Llave de la geometría del hijo child_index (None para el nodo base) de mesh.
+        """
+        return (id(mesh), child_index, id(pipeline))
+
+    def acquire(self, mesh, child_index, pipeline):
+        """
+        Entrega la llave y la vertex list de la geometría, subiéndola si no existe.
+        """
+        key = self.key(mesh, child_index, pipeline)
+        entry = self._entries.get(key)
+
+        if entry is None:
+            node = mesh if child_index is None else mesh["children"][child_index]
+            entry = self._entries[key] = _GeometryEntry(upload_geometry(node, pipeline), mesh, pipeline)
+
+        entry.refcount += 1
+        return key, entry.mesh_gpu
+
+    def release(self, key):
+        """
+        Libera una referencia a la geometría. Si era la última, se borra de la GPU.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+
+        entry.refcount -= 1
+        if entry.refcount <= 0:
+            entry.mesh_gpu.delete()
+            del self._entries[key]
+
+    def refcount(self, key):
+        entry = self._entries.get(key)
+        return entry.refcount if entry is not None else 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
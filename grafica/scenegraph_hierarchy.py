@@ -0,0 +1,221 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+import grafica.quaternions as quaternions
+
+
+class SceneHierarchy:
+    """
+    Representación compilada de la jerarquía de un grafo de escena.
+
+    Los nodos alcanzables desde la raíz se guardan en orden DFS (preorden),
+    de modo que el subárbol de cada nodo ocupa un rango contiguo de índices.
+    Cada nodo tiene un único padre (el primero que lo alcanza en el recorrido,
+    igual que el cálculo original con nx.edge_dfs).
+
+    Atributos:
+    keys -- Lista de claves de nodo en preorden
+    index -- Diccionario clave -> índice
+    parent -- Arreglo (N,) con el índice del padre (-1 para la raíz)
+    depth -- Arreglo (N,) con la profundidad de cada nodo
+    subtree_end -- Arreglo (N,): el subárbol del nodo i es [i, subtree_end[i])
+    levels -- Lista de arreglos de índices, uno por profundidad
+    local -- Pila (N,4,4) float32 de transformaciones locales
+    world -- Pila (N,4,4) float32 de transformaciones globales
+    version -- Contador que aumenta cada vez que cambia world
+    """
+
+    def __init__(self, keys, parent, depth, subtree_end):
+        self.keys = keys
+        self.index = {key: i for i, key in enumerate(keys)}
+        self.parent = parent
+        self.depth = depth
+        self.subtree_end = subtree_end
+
+        # agrupamos los nodos por profundidad para evaluarlos nivel a nivel
+        order = np.argsort(depth, kind="stable")
+        boundaries = np.searchsorted(depth[order], np.arange(depth.max() + 2))
+        self.levels = [
+            order[boundaries[d] : boundaries[d + 1]] for d in range(len(boundaries) - 1)
+        ]
+
+        n_nodes = len(keys)
+        self.local = np.tile(np.identity(4, dtype=np.float32), (n_nodes, 1, 1))
+        self.world = np.empty((n_nodes, 4, 4), dtype=np.float32)
+        self.version = 0
+
+    @classmethod
+    def from_graph(cls, graph, root_key):
+        """
+        Construye la jerarquía a partir de un grafo dirigido (networkx),
+        recorriéndolo en profundidad desde root_key.
+        """
+        keys = [root_key]
+        parent = [-1]
+        depth = [0]
+        index = {root_key: 0}
+
+        # cada elemento de la pila es (índice del nodo, iterador de sus sucesores)
+        stack = [(0, iter(graph.successors(root_key)))]
+        while stack:
+            current, successors = stack[-1]
+            for child in successors:
+                if child not in index:
+                    index[child] = len(keys)
+                    keys.append(child)
+                    parent.append(current)
+                    depth.append(depth[current] + 1)
+                    stack.append((index[child], iter(graph.successors(child))))
+                    break
+            else:
+                stack.pop()
+
+        parent = np.array(parent, dtype=np.int32)
+        depth = np.array(depth, dtype=np.int32)
+
+        # en preorden, el subárbol de i termina donde aparece el siguiente
+        # nodo con profundidad menor o igual a la de i
+        n_nodes = len(keys)
+        subtree_end = np.full(n_nodes, n_nodes, dtype=np.int32)
+        open_nodes = []
+        for i in range(n_nodes):
+            while open_nodes and depth[open_nodes[-1]] >= depth[i]:
+                subtree_end[open_nodes.pop()] = i
+            open_nodes.append(i)
+
+        return cls(keys, parent, depth, subtree_end)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def set_local(self, indices, transforms):
+        """
+        Escribe transformaciones locales (una matriz (4,4) o una pila (K,4,4)).
+        """
+        self.local[indices] = transforms
+
+    def update(self, indices=None):
+        """
+        Recalcula las transformaciones globales.
+
+        Parámetros:
+        indices -- Índices de los nodos que cambiaron. Si es None, se recalcula todo.
+                   Si no, solo se recalculan los subárboles de esos nodos.
+        """
+        self.version += 1
+
+        if indices is None:
+            self.world[0] = self.local[0]
+            for level in self.levels[1:]:
+                self.world[level] = np.matmul(self.world[self.parent[level]], self.local[level])
+            return
+
+        affected = self.affected_indices(indices)
+        if len(affected) == 0:
+            return
+
+        if affected[0] == 0:
+            self.world[0] = self.local[0]
+            affected = affected[1:]
+
+        depths = self.depth[affected]
+        order = np.argsort(depths, kind="stable")
+        affected = affected[order]
+        depths = depths[order]
+        boundaries = np.flatnonzero(np.diff(depths)) + 1
+
+        for level in np.split(affected, boundaries):
+            if len(level):
+                self.world[level] = np.matmul(self.world[self.parent[level]], self.local[level])
+
+    def relative_transforms(self, index):
+        """
+        Entrega una pila (M,4,4) float32 con las transformaciones de los nodos
+        del subárbol de index (sin incluirlo, en preorden) relativas a index.
+        Se componen bajando por las transformaciones locales (en float64), así
+        que no hace falta invertir la transformación global de index.
+        """
+        end = self.subtree_end[index]
+        relative = np.empty((end - index, 4, 4), dtype=np.float64)
+        relative[0] = np.identity(4)
+
+        nodes = np.arange(index + 1, end)
+        depths = self.depth[nodes]
+        order = np.argsort(depths, kind="stable")
+        nodes = nodes[order]
+        boundaries = np.flatnonzero(np.diff(depths[order])) + 1
+
+        for level in np.split(nodes, boundaries):
+            if len(level):
+                relative[level - index] = np.matmul(relative[self.parent[level] - index], self.local[level])
+
+        return relative[1:].astype(np.float32)
+
+    def affected_indices(self, indices):
+        """
+        Entrega los índices de todos los nodos en los subárboles de indices,
+        sin repetir (si un nodo está dentro del subárbol de otro, se ignora).
+        """
+        indices = np.unique(np.asarray(indices, dtype=np.int32))
+        if len(indices) == 0:
+            return indices
+
+        ends = self.subtree_end[indices]
+        # un índice está cubierto si cae dentro de un rango anterior
+        reach = np.maximum.accumulate(ends)
+        keep = np.ones(len(indices), dtype=bool)
+        keep[1:] = indices[1:] >= reach[:-1]
+
+        starts = indices[keep]
+        ends = ends[keep]
+        lengths = ends - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return np.arange(lengths.sum(), dtype=np.int32) + offsets
+
+
+def compose_transforms(n_transforms, translations=None, rotations=None, scales=None):
+    """
+    Compone una pila (N,4,4) float32 de transformaciones T @ R @ S a partir de
+    sus componentes (ver grafica.quaternions.compose, que hace el cálculo).
+    Los componentes que no se entregan quedan como identidad.
+
+    Parámetros:
+    n_transforms -- Cantidad de transformaciones N
+    translations -- Arreglo (N,3) de traslaciones
+    rotations -- Pila (N,3,3) de matrices de rotación, o (N,4) de cuaterniones
+    scales -- Arreglo (N,3) de escalas por eje, o (N,) de escalas uniformes
+    """
+    return quaternions.compose(translations, rotations, scales, n=n_transforms)
+
+
+class GlobalTransformsView(Mapping):
+    """
+    Vista de solo lectura (tipo diccionario) sobre la pila de transformaciones
+    globales de una SceneHierarchy. Cada valor es una vista (4,4) de la pila,
+    así que se actualiza cuando se recalculan las transformaciones. Las vistas
+    no se pueden modificar; para eso hay que copiarlas.
+    """
+
+    def __init__(self, hierarchy=None):
+        self.hierarchy = hierarchy
+
+    def __getitem__(self, node_key):
+        if self.hierarchy is None:
+            raise KeyError(node_key)
+        transform = self.hierarchy.world[self.hierarchy.index[node_key]]
+        transform.setflags(write=False)
+        return transform
+
+    def __contains__(self, node_key):
+        return self.hierarchy is not None and node_key in self.hierarchy.index
+
+    def __iter__(self):
+        if self.hierarchy is None:
+            return iter(())
+        return iter(self.hierarchy.keys)
+
+    def __len__(self):
+        if self.hierarchy is None:
+            return 0
+        return len(self.hierarchy)
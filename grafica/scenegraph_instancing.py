@@ -0,0 +1,204 @@
+"""
+Dibujo instanciado (hardware instancing) para el grafo de escena.
+
+Los pipelines registrados como instanciados reciben los datos de cada instancia
+en un buffer de textura (samplerBuffer) con texeles RGBA de 32 bits. Para la
+instancia i, los texeles [i * instance_stride, (i + 1) * instance_stride) contienen:
+
+- 4 texeles con las columnas de la transformación global,
+- los atributos de instancia declarados al registrar el pipeline, en ese
+  orden, rellenados con ceros hasta completar múltiplos de 4 floats.
+
+Un vertex shader instanciado se ve así:
+
+    uniform samplerBuffer instance_data;
+    uniform int instance_stride;
+
+    void main() {
+        int base = gl_InstanceID * instance_stride;
+        mat4 transform = mat4(
+            texelFetch(instance_data, base),
+            texelFetch(instance_data, base + 1),
+            texelFetch(instance_data, base + 2),
+            texelFetch(instance_data, base + 3)
+        );
+        vec3 bulb_color = texelFetch(instance_data, base + 4).rgb;
+        ...
+    }
+"""
+from ctypes import byref
+
+import numpy as np
+import pyglet.gl as GL
+
+# unidad de textura reservada para los datos de instancia
+INSTANCE_TEXTURE_UNIT = 15
+
+
+def pack_instance_attributes(instance_attributes, names):
+    """
+    Empaqueta los atributos de instancia (una lista de diccionarios, uno por
+    instancia) en un arreglo (K, n_texeles, 4) float32.
+
+    Parámetros:
+    instance_attributes -- Lista de diccionarios de atributos de instancia
+    names -- Nombres de los atributos a empaquetar, en orden
+    """
+    sizes = []
+    for name in names:
+        size = 1
+        for attributes in instance_attributes:
+            if name in attributes:
+                size = np.size(attributes[name])
+                break
+        sizes.append(-(-size // 4))
+
+    packed = np.zeros((len(instance_attributes), sum(sizes) * 4), dtype=np.float32)
+    offset = 0
+    for name, n_texels in zip(names, sizes):
+        for i, attributes in enumerate(instance_attributes):
+            if name in attributes:
+                value = np.asarray(attributes[name], dtype=np.float32).ravel(order="F")
+                packed[i, offset : offset + len(value)] = value
+        offset += n_texels * 4
+
+    return packed.reshape(len(instance_attributes), -1, 4)
+
+
+class InstanceBuffer:
+    """
+    Buffer de textura (GL_TEXTURE_BUFFER) con los datos por instancia de un grupo.
+    Solo se vuelve a subir cuando su contenido cambia.
+    """
+
+    def __init__(self):
+        self.buffer_id = GL.GLuint()
+        self.texture_id = GL.GLuint()
+        GL.glGenBuffers(1, byref(self.buffer_id))
+        GL.glGenTextures(1, byref(self.texture_id))
+
+        GL.glBindBuffer(GL.GL_TEXTURE_BUFFER, self.buffer_id)
+        GL.glBindTexture(GL.GL_TEXTURE_BUFFER, self.texture_id)
+        GL.glTexBuffer(GL.GL_TEXTURE_BUFFER, GL.GL_RGBA32F, self.buffer_id)
+        GL.glBindTexture(GL.GL_TEXTURE_BUFFER, 0)
+        GL.glBindBuffer(GL.GL_TEXTURE_BUFFER, 0)
+
+        self._data = None
+
+    def upload(self, data):
+        """
+        Sube data (float32 contiguo) si es distinto a lo que ya está en la GPU.
+        Entrega True si se subió.
+        """
+        if self._data is not None and self._data.shape == data.shape and np.array_equal(self._data, data):
+            return False
+
+        GL.glBindBuffer(GL.GL_TEXTURE_BUFFER, self.buffer_id)
+        GL.glBufferData(GL.GL_TEXTURE_BUFFER, data.nbytes, data.ctypes.data, GL.GL_STREAM_DRAW)
+        GL.glBindBuffer(GL.GL_TEXTURE_BUFFER, 0)
+        self._data = data.copy()
+        return True
+
+    def delete(self):
+        GL.glDeleteTextures(1, byref(self.texture_id))
+        GL.glDeleteBuffers(1, byref(self.buffer_id))
+
+
+def draw_instanced(mesh_gpu, mode, count):
+    """
+    Dibuja count instancias de una vertex list indexada de pyglet con una sola
+    llamada (equivale a mesh_gpu.draw, pero con glDrawElementsInstanced).
+    """
+    domain = mesh_gpu.domain
+    domain.vao.bind()
+
+    # pyglet 2.1 usa commit y las versiones anteriores sub_data
+    for buffer, _ in domain.buffer_attributes:
+        (getattr(buffer, "commit", None) or buffer.sub_data)()
+    (getattr(domain.index_buffer, "commit", None) or domain.index_buffer.sub_data)()
+
+    GL.glDrawElementsInstanced(
+        mode,
+        mesh_gpu.index_count,
+        domain.index_gl_type,
+        domain.index_buffer.ptr + mesh_gpu.index_start * domain.index_element_size,
+        count,
+    )
+
+
+class InstanceBatch:
+    """
+    Grupo de nodos con la misma malla, pipeline, texturas y uniforms compartidos,
+    que se dibuja con una sola llamada instanciada.
+
+    Parámetros:
+    world_indices -- Índices de los nodos en la pila de transformaciones globales
+    sources -- Diccionarios de atributos de instancia de cada nodo
+    names -- Nombres de los atributos por instancia, en orden
+    """
+
+    __slots__ = ("world_indices", "sources", "names", "attributes", "buffer", "_data")
+
+    def __init__(self, world_indices, sources, names):
+        self.world_indices = np.asarray(world_indices, dtype=np.int32)
+        self.sources = sources
+        self.names = names
+        self.attributes = pack_instance_attributes(sources, names)
+        self.buffer = None
+
+        n_texels = 4 + self.attributes.shape[1]
+        self._data = np.zeros((len(self.world_indices), n_texels, 4), dtype=np.float32)
+        self._data[:, 4:] = self.attributes
+
+    def refresh(self):
+        """
+        Vuelve a empaquetar los atributos por instancia (después de cambiar
+        alguno). Entrega False si cambió su tamaño, en cuyo caso hay que
+        volver a compilar el plan.
+        """
+        attributes = pack_instance_attributes(self.sources, self.names)
+        if attributes.shape != self.attributes.shape:
+            return False
+
+        self.attributes = attributes
+        self._data[:, 4:] = attributes
+        return True
+
+    @property
+    def stride(self):
+        return self._data.shape[1]
+
+    def __len__(self):
+        return len(self.world_indices)
+
+    def upload(self, world_transforms, visible=None):
+        """
+        Copia las transformaciones globales del grupo (como columnas) al buffer
+        de instancias. Entrega la cantidad de instancias a dibujar.
+
+        Parámetros:
+        world_transforms -- Pila (N,4,4) de transformaciones globales
+        visible -- Máscara (N,) de nodos visibles, o None para dibujar todas
+        """
+        if self.buffer is None:
+            self.buffer = InstanceBuffer()
+
+        indices = self.world_indices
+        data = self._data
+        if visible is not None:
+            selected = visible[indices]
+            if not selected.all():
+                # solo subimos las instancias que quedaron dentro del frustum
+                indices = indices[selected]
+                data = data[selected]
+            if len(indices) == 0:
+                return 0
+
+        data[:, :4] = world_transforms[indices].transpose(0, 2, 1)
+        self.buffer.upload(data)
+        return len(indices)
+
+    def release(self):
+        if self.buffer is not None:
+            self.buffer.delete()
+            self.buffer = None
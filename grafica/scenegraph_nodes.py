@@ -1,12 +1,20 @@
 import networkx as nx
 import trimesh as tm
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 import grafica.transformations as tr
 import pyglet.gl as GL
 import numpy as np
-from grafica.textures import texture_2D_setup
+from grafica.textures import texture_2D_setup, TextureCache
+from grafica.texture_atlas import build_atlas, remap_uv, uv_in_unit_square
+from grafica.mesh_optimization import optimize_arrays
 
+# solo las imágenes de a lo más este tamaño (en pixeles) van a un atlas
+ATLAS_MAX_IMAGE_SIZE = 1024
+ATLAS_MAX_SIZE = 4096
 
-def _node_from_mesh(mesh, id=None, parent=None, transform=None, fix_normals=False, smooth=False, smooth_threshold=100000, force_color=None, invert_normals=False):
+
+def _node_from_mesh(mesh, id=None, parent=None, transform=None, fix_normals=False, smooth=False, smooth_threshold=100000, force_color=None, invert_normals=False, textures=None):
     """
     Crea un nodo a partir de una malla.
     
@@ -20,42 +28,205 @@ def _node_from_mesh(mesh, id=None, parent=None, transform=None, fix_normals=Fals
     smooth_threshold -- Umbral para suavizado
     force_color -- Color forzado como array numpy [R,G,B,A] (valores 0-255)
                    Si es None, se usa el color original del modelo
+    textures -- TextureCache para no subir dos veces la misma imagen, o None
     """
-    if transform is None:
-        transform = tr.identity()
+    arrays = _mesh_arrays(
+        mesh,
+        fix_normals=fix_normals,
+        smooth=smooth,
+        smooth_threshold=smooth_threshold,
+        force_color=force_color,
+        invert_normals=invert_normals,
+    )
+    return _node_from_arrays(arrays, mesh, parent=parent, transform=transform, textures=textures)
+
 
+def _mesh_arrays(mesh, fix_normals=False, smooth=False, smooth_threshold=100000, force_color=None, invert_normals=False):
+    """
+    Preprocesa una malla y entrega sus arreglos de vértices, sin tocar la GPU:
+    un diccionario con n_vertices, position, normal, uv, color, indices
+    e image (la imagen de textura, o None).
+
+    Los arreglos son de NumPy, contiguos y con el tipo que usa la GPU
+    (float32 para posiciones, normales y uv; uint8 para colores RGBA; uint32
+    para índices), así que se pueden copiar directo a la vertex list.
+
+    Los parámetros son los mismos de _node_from_mesh.
+    """
     if fix_normals:
         mesh.fix_normals()
 
-    vertex_list = tm.rendering.mesh_to_vertexlist(mesh, smooth=smooth, smooth_threshold=smooth_threshold)
+    n_vertices, indices, positions, normals, (extra_format, extra_data) = _mesh_vertex_arrays(
+        mesh, smooth=smooth, smooth_threshold=smooth_threshold
+    )
 
-    # Obtener número de vértices primero
-    n_vertices = len(vertex_list[4][1]) // 3
-
-    # Obtener normales del vertex_list
-    normal_data = vertex_list[5][1]
-    
     # Invertir normales si se solicita
     if invert_normals:
-        # Las normales están almacenadas como un arreglo plano de floats
-        # Cada 3 valores representan una normal (x, y, z)
-        normal_data = -np.array(normal_data)  # Invertir todas las normales
+        np.negative(normals, out=normals)
         print("Normales invertidas para el modelo")
 
+    arrays = {
+        'n_vertices': n_vertices,
+        'position': positions,
+        'normal': normals,
+        'uv': None,
+        'color': None,
+        'indices': indices,
+        'image': None,
+    }
+
+    # Manejar la textura si existe
+    if hasattr(mesh.visual, "material") and getattr(mesh.visual.material, 'image', None) is not None:
+        arrays['uv'] = np.ascontiguousarray(extra_data, dtype=np.float32)
+        arrays['image'] = mesh.visual.material.image
+
+    # Procesar el color
+    if force_color is not None and isinstance(force_color, np.ndarray) and len(force_color) == 4:
+        # Usar el color forzado para todos los vértices
+        colors = np.empty((n_vertices, 4), dtype=np.uint8)
+        colors[:] = force_color
+        arrays['color'] = colors.reshape(-1)
+        print(f"Aplicando color forzado al modelo: {force_color}")
+    else:
+        arrays['color'] = _colors_to_rgba(extra_format, extra_data, n_vertices)
+
+    return arrays
+
+
+def _mesh_vertex_arrays(mesh, smooth=False, smooth_threshold=100000):
+    """
+    Equivalente a tm.rendering.mesh_to_vertexlist, pero entrega arreglos de
+    NumPy en vez de listas de Python:
+    (n_vertices, índices, posiciones, normales, (formato, datos)), donde el
+    último elemento son las coordenadas de textura ('t2f') o los colores
+    ('c3f', 'c3B', 'c4f' o 'c4B') de cada vértice.
+    """
+    vertices = np.asarray(mesh.vertices)
+    # soportamos vértices en 2D
+    if vertices.ndim == 2 and vertices.shape[1] == 2:
+        vertices = np.column_stack((vertices, np.zeros(len(vertices))))
+
+    if hasattr(mesh.visual, "uv"):
+        # si la malla tiene textura, usamos sus coordenadas uv
+        n_vertices = len(vertices)
+        normals = mesh.vertex_normals
+        faces = mesh.faces
+        uv = mesh.visual.uv
+        material = mesh.visual.material
+
+        if hasattr(material, "image"):
+            no_image = material.image is None
+        elif hasattr(material, "baseColorTexture"):
+            no_image = material.baseColorTexture is None
+        else:
+            no_image = True
+
+        if uv is None or no_image or len(uv) != n_vertices:
+            # sin coordenadas válidas usamos el color principal del material
+            extra = _vertex_colors(material.main_color, n_vertices)
+        else:
+            extra = ("t2f", np.asarray(uv)[:, :2].reshape(-1))
+
+    elif smooth and len(mesh.faces) < smooth_threshold:
+        # unimos los vértices de caras con ángulos pequeños para suavizar
+        smooth_mesh = mesh.smooth_shaded
+        vertices = np.asarray(smooth_mesh.vertices)
+        n_vertices = len(vertices)
+        normals = smooth_mesh.vertex_normals
+        faces = smooth_mesh.faces
+        extra = _vertex_colors(smooth_mesh.visual.vertex_colors, n_vertices)
+
+    else:
+        # triángulos independientes (cada cara con sus propios vértices)
+        n_vertices = len(mesh.faces) * 3
+        normals = np.repeat(mesh.face_normals, 3, axis=0)
+        vertices = vertices[mesh.faces]
+        faces = np.arange(n_vertices, dtype=np.uint32)
+        colors = np.repeat(np.asarray(mesh.visual.face_colors), 3, axis=0)
+        extra = _vertex_colors(colors, n_vertices)
+
+    return (
+        n_vertices,
+        np.ascontiguousarray(faces, dtype=np.uint32).reshape(-1),
+        np.ascontiguousarray(vertices, dtype=np.float32).reshape(-1),
+        np.ascontiguousarray(normals, dtype=np.float32).reshape(-1),
+        extra,
+    )
+
+
+def _vertex_colors(colors, n_vertices):
+    """
+    Entrega los colores de los vértices como (formato, arreglo plano),
+    igual que tm.rendering.colors_to_gl (negro si los colores no son válidos).
+    """
+    colors = np.asanyarray(colors)
+    kind = {"f": "f", "i": "B", "u": "B"}.get(colors.dtype.kind)
+
+    if kind is not None and colors.ndim == 2 and colors.shape[0] == n_vertices and colors.shape[1] in (3, 4):
+        return f"c{colors.shape[1]}{kind}", colors.reshape(-1)
+    if kind is not None and colors.shape in [(3,), (4,)]:
+        # un solo color para todos los vértices
+        return f"c{colors.size}{kind}", np.tile(colors, n_vertices)
+    return "c3f", np.zeros(n_vertices * 3)
+
+
+def _colors_to_rgba(color_format, color_data, n_vertices):
+    """
+    Convierte los colores de los vértices a RGBA uint8 (un arreglo plano de
+    n_vertices * 4 valores entre 0 y 255).
+
+    Parámetros:
+    color_format -- Formato de los datos ('c3f', 'c3B', 'c4f' o 'c4B')
+    color_data -- Arreglo plano con los colores
+    n_vertices -- Cantidad de vértices
+    """
+    if color_format.startswith('c3') or color_format.startswith('c4'):
+        channels = int(color_format[1])
+        color_data = np.asarray(color_data).reshape(n_vertices, channels)
+
+        if color_format[2] == 'f':
+            # float en rango [0,1], convertir a byte [0,255]
+            color_data = color_data * 255
+
+        rgba_data = np.full((n_vertices, 4), 255, dtype=np.uint8)
+        rgba_data[:, :channels] = color_data
+        return rgba_data.reshape(-1)
+
+    # Formato desconocido, crear un color por defecto (BLANCO)
+    print(f"Formato de color no reconocido: {color_format}, usando color blanco por defecto")
+    return np.full(n_vertices * 4, 255, dtype=np.uint8)
+
+
+def _node_from_arrays(arrays, mesh=None, parent=None, transform=None, textures=None, texture_id=None):
+    """
+    Crea un nodo de malla a partir de los arreglos de _mesh_arrays,
+    subiendo su textura (si tiene) a la GPU.
+
+    Parámetros:
+    arrays -- Diccionario entregado por _mesh_arrays
+    mesh -- Objeto de la malla (se guarda en node['object'])
+    parent -- Nodo padre
+    transform -- Transformación a aplicar
+    textures -- TextureCache para no subir dos veces la misma imagen, o None
+    texture_id -- Textura ya subida a usar en vez de la imagen (ej: un atlas)
+    """
+    if transform is None:
+        transform = tr.identity()
+
     node = {
         'object': mesh,
         'mesh': {
-            'n_vertices': n_vertices,
+            'n_vertices': arrays['n_vertices'],
             'texture': None,
             'textures': {}
         },
         'attributes':{
-            'position': vertex_list[4][1],
+            'position': arrays['position'],
             'uv': None,
-            'normal': normal_data,
-            'color': None
+            'normal': arrays['normal'],
+            'color': arrays['color']
         },
-        'indices': vertex_list[3],
+        'indices': arrays['indices'],
         'GL_TYPE': GL.GL_TRIANGLES,
         'transform': transform,
         'id': None,
@@ -64,84 +235,207 @@ def _node_from_mesh(mesh, id=None, parent=None, transform=None, fix_normals=Fals
         'has_texture': False,
     }
 
+    if arrays.get('optimization') is not None:
+        node['mesh']['optimization'] = arrays['optimization']
+
     # Manejar la textura si existe
-    if hasattr(mesh.visual, "material") and getattr(mesh.visual.material, 'image', None) is not None:
-        node['attributes']['uv'] = vertex_list[6][1]
-        texture_id = texture_2D_setup(mesh.visual.material.image)
+    if arrays['image'] is not None:
+        node['attributes']['uv'] = arrays['uv']
+        if texture_id is None:
+            if textures is not None:
+                texture_id = textures.get(arrays['image'])
+            else:
+                texture_id = texture_2D_setup(arrays['image'])
         node['mesh']['texture'] = texture_id
         node['mesh']['textures'] = dict(diffuse=texture_id)
         node['has_texture'] = True
-    
-    # Procesar el color
-    if force_color is not None and isinstance(force_color, np.ndarray) and len(force_color) == 4:
-        # Usar el color forzado para todos los vértices
-        colors = np.ones((n_vertices, 4), dtype=np.uint8)
-        colors[:] = force_color
-        node['attributes']['color'] = colors.flatten()
-        print(f"Aplicando color forzado al modelo: {force_color}")
-    else:
-        # Procesar el color original como antes
-        if len(vertex_list) > 6:
-            color_format = vertex_list[6][0]
-            color_data = vertex_list[6][1]
-            
-            if color_format.startswith('c3'):
-                # Formato RGB, convertir a RGBA
-                if color_format.startswith('c3f'):
-                    # RGB float en rango [0,1], convertir a RGBA byte [0,255]
-                    rgba_data = np.ones(n_vertices * 4, dtype=np.uint8) * 255
-                    for i in range(n_vertices):
-                        rgba_data[i*4] = int(color_data[i*3] * 255)
-                        rgba_data[i*4+1] = int(color_data[i*3+1] * 255)
-                        rgba_data[i*4+2] = int(color_data[i*3+2] * 255)
-                        rgba_data[i*4+3] = 255  # Alpha = 255
-                else:
-                    # RGB byte, ya está en rango [0,255], convertir a RGBA byte
-                    rgba_data = np.ones(n_vertices * 4, dtype=np.uint8) * 255
-                    for i in range(n_vertices):
-                        rgba_data[i*4] = color_data[i*3]
-                        rgba_data[i*4+1] = color_data[i*3+1]
-                        rgba_data[i*4+2] = color_data[i*3+2]
-                        rgba_data[i*4+3] = 255  # Alpha = 255
-                
-                node['attributes']['color'] = rgba_data
-            
-            elif color_format.startswith('c4'):
-                # Formato RGBA
-                if color_format.startswith('c4f'):
-                    # RGBA float en rango [0,1], convertir a RGBA byte [0,255]
-                    rgba_data = np.ones(n_vertices * 4, dtype=np.uint8) * 255
-                    for i in range(n_vertices):
-                        rgba_data[i*4] = int(color_data[i*4] * 255)
-                        rgba_data[i*4+1] = int(color_data[i*4+1] * 255)
-                        rgba_data[i*4+2] = int(color_data[i*4+2] * 255)
-                        rgba_data[i*4+3] = int(color_data[i*4+3] * 255)
-                else:
-                    # RGBA byte, ya está en rango [0,255]
-                    rgba_data = color_data
-                
-                node['attributes']['color'] = rgba_data
-            
-            else:
-                # Formato desconocido, crear un color por defecto (BLANCO)
-                print(f"Formato de color no reconocido: {color_format}, usando color blanco por defecto")
-                node['attributes']['color'] = np.ones(n_vertices * 4, dtype=np.uint8) * 255
-        else:
-            # Si no hay información de color, crear un color por defecto (BLANCO)
-            node['attributes']['color'] = np.ones(n_vertices * 4, dtype=np.uint8) * 255
-            print("No se encontró información de color, usando color blanco por defecto")
 
     return node
 
 
 
-def _node_from_file(filename, id=None, parent=None, rezero=True, normalize=True, fix_normals=True, smooth=False, smooth_threshold=100000, force_color=None, invert_normals=False):
-    scene = tm.load(filename, force="scene")
-    if rezero:
-        scene.rezero()
+def _preprocess_geometry(mesh, options, optimize=False):
+    """
+    Preprocesa una geometría (ver _mesh_arrays). Entrega la malla (que puede
+    haber cambiado, por ejemplo con fix_normals) y sus arreglos.
+    Si optimize es True, también optimiza los índices (ver grafica.mesh_optimization).
+    """
+    arrays = _mesh_arrays(mesh, **options)
+    if optimize:
+        arrays = optimize_arrays(arrays)
+    return mesh, arrays
+
 
-    if normalize:
-        scene = scene.scaled(2.0 / scene.scale)
+def _preprocess_geometries(meshes, options, workers=None, processes=False, optimize=False):
+    """
+    Preprocesa varias geometrías, en paralelo si workers > 1.
+    Entrega las mallas y sus arreglos en el mismo orden de meshes.
+
+    Parámetros:
+    meshes -- Lista de mallas de trimesh
+    options -- Opciones de _mesh_arrays
+    workers -- Cantidad de hilos o procesos (None o 1 para hacerlo en secuencia)
+    processes -- Si es True, usa procesos en vez de hilos
+    optimize -- Si es True, optimiza los índices de cada geometría
+    """
+    if workers is None or workers <= 1 or len(meshes) <= 1:
+        results = [_preprocess_geometry(mesh, options, optimize) for mesh in meshes]
+    else:
+        executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        with executor(max_workers=min(workers, len(meshes))) as pool:
+            # map conserva el orden de entrada
+            results = list(pool.map(_preprocess_geometry, meshes, repeat(options), repeat(optimize)))
+
+    return [mesh for mesh, _ in results], [arrays for _, arrays in results]
+
+
+def _node_from_file(filename, id=None, parent=None, textures=None, atlas=False, **kwargs):
+    """
+    Crea un nodo base a partir de un archivo de malla, con un hijo por cada
+    geometría del archivo.
+
+    Parámetros:
+    filename -- Archivo de la malla
+    id -- Identificador del nodo
+    parent -- Nodo padre
+    textures -- TextureCache para no subir dos veces la misma imagen, o None
+    atlas -- Si es True, junta las texturas pequeñas en un atlas (ver _pack_atlas)
+    **kwargs -- Opciones de _preprocess_file
+    """
+    return _node_from_preprocessed(
+        _preprocess_file(filename, **kwargs), id=id, parent=parent, textures=textures, atlas=atlas
+    )
+
+
+def _preprocess_file(filename, rezero=True, normalize=True, fix_normals=True, smooth=False, smooth_threshold=100000, force_color=None, invert_normals=False, optimize=False, cache=None, workers=None, processes=False):
+    """
+    Lee y preprocesa un archivo de malla, sin usar OpenGL (así que se puede
+    llamar desde otro hilo). Entrega (escena, objetos, geometrías), donde cada
+    geometría es un diccionario de _mesh_arrays; _node_from_preprocessed
+    construye el nodo a partir de ese resultado.
+
+    Parámetros:
+    optimize -- Si es True, elimina vértices repetidos y reordena triángulos
+                y vértices para el caché de vértices de la GPU (ver
+                grafica.mesh_optimization). El resumen, con el ACMR antes y
+                después, queda en node['mesh']['optimization'] de cada hijo
+    cache -- MeshCache (ver grafica.mesh_cache) donde buscar y guardar el
+             resultado del preprocesamiento, o None para no usar caché
+    workers -- Cantidad de hilos (o procesos) para preprocesar las geometrías
+               en paralelo. Los hijos quedan en el orden del archivo, y las
+               texturas se suben después, en _node_from_preprocessed
+    processes -- Si es True, usa procesos en vez de hilos (conviene para
+                 archivos con muchas geometrías grandes, ya que el trabajo
+                 de trimesh retiene el GIL)
+    (el resto de los parámetros son los de _node_from_mesh)
+    """
+    options = dict(
+        rezero=rezero,
+        normalize=normalize,
+        fix_normals=fix_normals,
+        smooth=smooth,
+        smooth_threshold=smooth_threshold,
+        force_color=None if force_color is None else np.asarray(force_color).tolist(),
+        invert_normals=invert_normals,
+        optimize=optimize,
+    )
+
+    cached = cache.load(filename, options) if cache is not None else None
+    if cached is not None:
+        meta, geometries = cached
+        scene, objects = cache.scene_object(meta, geometries)
+    else:
+        scene = tm.load(filename, force="scene")
+        if rezero:
+            scene.rezero()
+
+        if normalize:
+            scene = scene.scaled(2.0 / scene.scale)
+
+        mesh_options = dict(fix_normals=fix_normals, smooth=smooth, smooth_threshold=smooth_threshold, force_color=force_color, invert_normals=invert_normals)
+        objects, geometries = _preprocess_geometries(
+            list(scene.geometry.values()), mesh_options, workers=workers, processes=processes, optimize=optimize
+        )
+
+        # con procesos, las mallas vuelven como copias; las dejamos en la escena
+        for object_name, object_geometry in zip(list(scene.geometry), objects):
+            scene.geometry[object_name] = object_geometry
+
+        if cache is not None:
+            cache.store(filename, options, scene, geometries)
+
+    return scene, objects, geometries
+
+
+def _pack_atlas(geometries, textures=None):
+    """
+    Junta en un atlas las texturas de las geometrías que lo permiten (imagen
+    de a lo más ATLAS_MAX_IMAGE_SIZE pixeles por lado y coordenadas uv en
+    [0, 1], es decir, sin repetición), y lo sube a la GPU.
+
+    Entrega (geometrías, texturas): las geometrías del atlas son copias con
+    sus uv reescritas, y texturas tiene el ID del atlas para esas geometrías
+    (None para las demás).
+    """
+    texture_ids = [None] * len(geometries)
+    candidates = [
+        i
+        for i, arrays in enumerate(geometries)
+        if arrays['image'] is not None
+        and arrays['uv'] is not None
+        and max(arrays['image'].size) <= ATLAS_MAX_IMAGE_SIZE
+        and uv_in_unit_square(arrays['uv'])
+    ]
+
+    # una imagen repetida va una sola vez al atlas
+    slots = {}
+    images = []
+    placements = []
+    for i in candidates:
+        key = TextureCache.key(geometries[i]['image'])
+        if key not in slots:
+            slots[key] = len(images)
+            images.append(geometries[i]['image'])
+        placements.append((i, slots[key]))
+
+    if len(images) < 2:
+        return geometries, texture_ids
+
+    atlas_image, rectangles = build_atlas(images, max_size=ATLAS_MAX_SIZE)
+    if textures is not None:
+        atlas_texture = textures.get(atlas_image)
+    else:
+        atlas_texture = texture_2D_setup(atlas_image)
+
+    geometries = list(geometries)
+    for i, slot in placements:
+        if rectangles[slot] is None:
+            continue
+        arrays = dict(geometries[i])
+        arrays['uv'] = remap_uv(arrays['uv'], rectangles[slot], atlas_image.size)
+        geometries[i] = arrays
+        texture_ids[i] = atlas_texture
+
+    return geometries, texture_ids
+
+
+def _node_from_preprocessed(preprocessed, id=None, parent=None, textures=None, atlas=False):
+    """
+    Crea el nodo base de una malla preprocesada por _preprocess_file,
+    subiendo sus texturas a la GPU.
+
+    Parámetros:
+    preprocessed -- Tupla (escena, objetos, geometrías) de _preprocess_file
+    id -- Identificador del nodo
+    parent -- Nodo padre
+    textures -- TextureCache para no subir dos veces la misma imagen, o None
+    atlas -- Si es True, junta las texturas pequeñas en un atlas (ver _pack_atlas)
+    """
+    scene, objects, geometries = preprocessed
+
+    texture_ids = [None] * len(geometries)
+    if atlas:
+        geometries, texture_ids = _pack_atlas(geometries, textures)
 
     base = {
         'mesh': None,
@@ -154,10 +448,9 @@ def _node_from_file(filename, id=None, parent=None, rezero=True, normalize=True,
         'object': scene
     }
 
-    for object_id, object_geometry in scene.geometry.items():
-        node = _node_from_mesh(object_geometry, fix_normals=fix_normals, smooth=smooth, smooth_threshold=smooth_threshold, force_color=force_color, invert_normals=invert_normals)
+    for object_geometry, arrays, texture_id in zip(objects, geometries, texture_ids):
+        node = _node_from_arrays(arrays, object_geometry, textures=textures, texture_id=texture_id)
         base['children'].append(node)
         base['has_texture'] = node['has_texture']
 
     return base
-    
@@ -0,0 +1,139 @@
+import csv
+import json
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+
+# secciones de tiempo que se registran en cada cuadro, en milisegundos
+SECTIONS = ("uploads", "transforms", "culling", "plan", "uniforms", "textures", "draws")
+
+
+class FrameProfiler:
+    """
+    Perfilador opcional de Scenegraph.render (ver Scenegraph.enable_profiler).
+
+    En cada cuadro registra el tiempo de cada sección (SECTIONS) y del cuadro
+    completo, junto con los contadores del plan de dibujo (llamadas de dibujo,
+    cambios de pipeline, texturas y uniforms) y del descarte por frustum.
+    Si per_node es True, también acumula el tiempo y las llamadas de dibujo
+    de cada nodo.
+
+    Parámetros:
+    per_node -- Si es True, registra el desglose por nodo
+    max_frames -- Cantidad máxima de cuadros guardados (los más antiguos se descartan)
+    """
+
+    def __init__(self, per_node=False, max_frames=1000):
+        self.per_node = per_node
+        self.frames = deque(maxlen=max_frames)
+        self.nodes = {}
+        self.frame_count = 0
+        self._current = None
+        self._start = None
+
+    def begin_frame(self):
+        self._current = dict.fromkeys(SECTIONS, 0.0)
+        self._start = perf_counter()
+
+    def end_frame(self, *counters):
+        """
+        Cierra el cuadro actual y lo guarda.
+
+        Parámetros:
+        *counters -- Diccionarios de contadores a agregar al registro del cuadro
+        """
+        record = {"frame": self.frame_count, "total": (perf_counter() - self._start) * 1000.0}
+        for section in SECTIONS:
+            record[section] = self._current[section] * 1000.0
+        for values in counters:
+            record.update(values)
+
+        self.frames.append(record)
+        self.frame_count += 1
+        self._current = None
+
+    def add(self, section, seconds):
+        """
+        Suma tiempo (en segundos) a una sección del cuadro actual.
+        """
+        self._current[section] += seconds
+
+    def add_node(self, node_key, seconds, draws=1):
+        """
+        Suma tiempo (en segundos) y llamadas de dibujo al desglose de un nodo.
+        """
+        entry = self.nodes.get(node_key)
+        if entry is None:
+            entry = self.nodes[node_key] = {"draws": 0, "time": 0.0}
+        entry["draws"] += draws
+        entry["time"] += seconds * 1000.0
+
+    @contextmanager
+    def section(self, name):
+        """
+        Mide el tiempo de un bloque de código en la sección name.
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self._current[name] += perf_counter() - start
+
+    def reset(self):
+        self.frames.clear()
+        self.nodes.clear()
+        self.frame_count = 0
+
+    def summary(self):
+        """
+        Entrega, para cada valor numérico registrado, su promedio y máximo
+        sobre los cuadros guardados.
+        """
+        summary = {}
+        for name in self._columns():
+            if name == "frame":
+                continue
+            values = [frame[name] for frame in self.frames if name in frame]
+            if values:
+                summary[name] = {"mean": sum(values) / len(values), "max": max(values)}
+        return summary
+
+    def _columns(self):
+        columns = {}
+        for frame in self.frames:
+            columns.update(dict.fromkeys(frame))
+        return list(columns)
+
+    def to_csv(self, filename, nodes=False):
+        """
+        Guarda los cuadros registrados (una fila por cuadro) en un archivo CSV.
+        Si nodes es True, guarda en cambio el desglose por nodo.
+        """
+        with open(filename, "w", newline="") as f:
+            if nodes:
+                writer = csv.writer(f)
+                writer.writerow(["node", "draws", "time"])
+                for node_key, entry in self.nodes.items():
+                    writer.writerow([node_key, entry["draws"], entry["time"]])
+            else:
+                writer = csv.DictWriter(f, fieldnames=self._columns())
+                writer.writeheader()
+                writer.writerows(self.frames)
+
+    def to_json(self, filename=None):
+        """
+        Entrega (y guarda en filename, si se indica) los cuadros registrados,
+        el resumen y el desglose por nodo en formato JSON.
+        """
+        data = json.dumps(
+            {
+                "frames": list(self.frames),
+                "summary": self.summary(),
+                "nodes": {str(node_key): entry for node_key, entry in self.nodes.items()},
+            },
+            indent=2,
+        )
+        if filename is not None:
+            with open(filename, "w") as f:
+                f.write(data)
+        return data
@@ -0,0 +1,467 @@
+from time import perf_counter
+
+import numpy as np
+import pyglet.gl as GL
+
+from .uniforms import flatten_uniform, uniform_bytes, get_uniform_cache
+from .scenegraph_instancing import (
+    INSTANCE_TEXTURE_UNIT,
+    InstanceBatch,
+    draw_instanced,
+)
+
+
+def _instance_uniforms(attributes, cache, skip=()):
+    """
+    Entrega los atributos de instancia que son uniforms del pipeline como
+    tuplas (nombre, valor aplanado, bytes del valor).
+    """
+    for attr, value in attributes.items():
+        if attr == "transform" or attr in skip or attr not in cache:
+            continue
+        value = flatten_uniform(value)
+        yield attr, value, uniform_bytes(value)
+
+
+class DrawCommand:
+    """
+    Una llamada de dibujo ya resuelta: pipeline (y su caché de uniforms),
+    transformación global, uniforms de instancia, texturas y la geometría en la GPU.
+
+    Los uniforms son tuplas (nombre, valor aplanado, bytes del valor) que no
+    cambian entre cuadros (unidades de textura, por ejemplo). Los atributos
+    de instancia del nodo se leen de attributes (el mismo diccionario del
+    nodo) en cada cuadro, así que los cambios hechos "in place" se respetan.
+    Si instances no es None, el comando dibuja un grupo de nodos con una
+    sola llamada instanciada (ver InstanceBatch).
+    """
+
+    __slots__ = (
+        "node_key",
+        "pipeline",
+        "cache",
+        "world_index",
+        "transform_name",
+        "uniforms",
+        "attributes",
+        "textures",
+        "mesh_gpu",
+        "gl_type",
+        "instances",
+    )
+
+    def __init__(
+        self, node_key, pipeline, world_index, transform_name, uniforms, textures, mesh_gpu, gl_type, instances=None, attributes=None
+    ):
+        self.node_key = node_key
+        self.pipeline = pipeline
+        self.cache = get_uniform_cache(pipeline)
+        self.world_index = world_index
+        self.transform_name = transform_name
+        self.uniforms = uniforms
+        self.attributes = attributes
+        self.textures = textures
+        self.mesh_gpu = mesh_gpu
+        self.gl_type = gl_type
+        self.instances = instances
+
+
+class RenderStats:
+    """
+    Contadores del último cuadro dibujado con un RenderPlan.
+
+    Los valores *_saved indican cuántos cambios de estado se evitaron en
+    comparación con activar el pipeline y las texturas en cada llamada de dibujo.
+    """
+
+    __slots__ = (
+        "draw_calls",
+        "pipeline_binds",
+        "pipeline_binds_saved",
+        "texture_binds",
+        "texture_binds_saved",
+        "uniform_writes",
+        "uniform_writes_saved",
+        "instances_drawn",
+        "draws_culled",
+        "instances_culled",
+    )
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.draw_calls = 0
+        self.pipeline_binds = 0
+        self.pipeline_binds_saved = 0
+        self.texture_binds = 0
+        self.texture_binds_saved = 0
+        self.uniform_writes = 0
+        self.uniform_writes_saved = 0
+        # instancias extra dibujadas dentro de llamadas instanciadas
+        self.instances_drawn = 0
+        # llamadas de dibujo e instancias omitidas por estar fuera del frustum
+        self.draws_culled = 0
+        self.instances_culled = 0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class RenderPlan:
+    """
+    Plan de dibujo compilado a partir de un grafo de escena.
+
+    Se construye una vez (con compile) y se reproduce en cada cuadro (con execute).
+    El grafo lo invalida cuando cambia su estructura o las texturas de algún
+    nodo, y guarda un plan por cada asignación de pipelines. Los atributos de
+    instancia de cada nodo se leen al reproducirlo (ver DrawCommand).
+
+    Los comandos opacos se ordenan por pipeline, luego por conjunto de texturas
+    y luego por malla, y al reproducirlos solo se cambia el estado de OpenGL
+    cuando es distinto al actual. Los nodos transparentes (con el atributo
+    transparent=True) se dibujan al final, de atrás hacia adelante según la vista.
+
+    Los nodos de pipelines instanciados se agrupan por malla, texturas y uniforms
+    compartidos, y cada grupo se dibuja con una sola llamada instanciada.
+    """
+
+    def __init__(self):
+        # por cada pipeline (sin repetir): (pipeline, caché de uniforms)
+        self.pipelines = []
+        # bloque de uniforms globales declarado por algún pipeline (o None)
+        self.global_block = None
+        self.commands = []
+        self.transparent_commands = []
+        # id del diccionario de atributos de un nodo -> [(grupo instanciado, caché de uniforms)]
+        self.instance_batches = {}
+        self.stats = RenderStats()
+
+    @classmethod
+    def compile(cls, graph):
+        plan = cls()
+        hierarchy = graph._hierarchy
+
+        caches = {}
+        for pipeline in graph.pipelines.values():
+            if id(pipeline) in caches:
+                continue
+            caches[id(pipeline)] = get_uniform_cache(pipeline)
+            plan.pipelines.append((pipeline, caches[id(pipeline)]))
+
+            if plan.global_block is None and graph.global_block_name is not None:
+                plan.global_block = getattr(pipeline, "uniform_blocks", {}).get(graph.global_block_name)
+
+        # pipelines instanciados: id del pipeline -> nombres de atributos por instancia
+        instanced = {
+            id(graph.pipelines[name]): attribute_names
+            for name, attribute_names in graph.instanced_pipelines.items()
+            if name in graph.pipelines
+        }
+        groups = {}
+
+        for node_key, current_node in graph.nodes.items():
+            if "mesh" not in current_node or current_node.get("pipeline") is None:
+                continue
+            # los nodos que no cuelgan de la raíz no tienen transformación global
+            if node_key not in hierarchy.index:
+                continue
+
+            pipeline = graph.pipelines[current_node["pipeline"]]
+            cache = caches[id(pipeline)]
+
+            uniforms = []
+            instance_attrs = current_node.get("instance_attributes") or {}
+
+            textures, texture_uniforms = cls._resolve_textures(current_node["mesh"])
+            for tex_name, unit in texture_uniforms:
+                if tex_name in cache:
+                    uniforms.append((tex_name, unit, uniform_bytes(unit)))
+
+            transparent = current_node.get("transparent", False)
+            instance_names = instanced.get(id(pipeline))
+            if instance_names is not None:
+                # los uniforms compartidos por el grupo se fijan al compilar
+                shared = tuple(_instance_uniforms(instance_attrs, cache, instance_names)) + tuple(uniforms)
+                key = (
+                    id(pipeline),
+                    id(current_node["mesh_gpu"]),
+                    current_node.get("GL_TYPE"),
+                    tuple(textures),
+                    tuple((name, data) for name, _, data in shared),
+                )
+                # los nodos transparentes se ordenan uno a uno, así que no se agrupan
+                if transparent:
+                    key = key + (node_key,)
+                if key not in groups:
+                    groups[key] = (node_key, pipeline, shared, tuple(textures), current_node, transparent, [], [])
+                groups[key][6].append(hierarchy.index[node_key])
+                groups[key][7].append(instance_attrs)
+                continue
+
+            commands = plan.transparent_commands if transparent else plan.commands
+            commands.append(
+                DrawCommand(
+                    node_key,
+                    pipeline,
+                    hierarchy.index[node_key],
+                    graph.transform_parameter_name if graph.transform_parameter_name in cache else None,
+                    tuple(uniforms),
+                    tuple(textures),
+                    current_node["mesh_gpu"],
+                    current_node.get("GL_TYPE"),
+                    attributes=current_node.get("instance_attributes"),
+                )
+            )
+
+        for node_key, pipeline, shared, textures, node, transparent, indices, attributes in groups.values():
+            cache = caches[id(pipeline)]
+            batch = InstanceBatch(indices, attributes, instanced[id(pipeline)])
+            for source in attributes:
+                plan.instance_batches.setdefault(id(source), []).append((batch, cache))
+
+            uniforms = list(shared)
+            for name, value in (
+                (graph.instance_data_parameter_name, INSTANCE_TEXTURE_UNIT),
+                (graph.instance_stride_parameter_name, batch.stride),
+            ):
+                if name in cache:
+                    uniforms.append((name, value, uniform_bytes(value)))
+
+            commands = plan.transparent_commands if transparent else plan.commands
+            commands.append(
+                DrawCommand(
+                    node_key,
+                    pipeline,
+                    indices[0],
+                    None,
+                    tuple(uniforms),
+                    textures,
+                    node["mesh_gpu"],
+                    node.get("GL_TYPE"),
+                    instances=batch,
+                )
+            )
+
+        # ordenamos por estado para minimizar los cambios de pipeline y texturas
+        pipeline_order = {id(pipeline): i for i, (pipeline, _) in enumerate(plan.pipelines)}
+        plan.commands.sort(
+            key=lambda command: (
+                pipeline_order[id(command.pipeline)],
+                command.textures,
+                id(command.mesh_gpu),
+            )
+        )
+        plan._transparent_indices = np.array(
+            [command.world_index for command in plan.transparent_commands], dtype=np.int32
+        )
+
+        return plan
+
+    def release(self):
+        """
+        Libera los buffers de instancias del plan en la GPU.
+        """
+        for command in self.commands + self.transparent_commands:
+            if command.instances is not None:
+                command.instances.release()
+
+    @staticmethod
+    def _resolve_textures(mesh):
+        """
+        Entrega las texturas a activar como pares (unidad de textura, id) y
+        los uniforms de textura como pares (nombre, unidad).
+        """
+        # primero la textura por defecto (mantener compatibilidad)
+        texture = mesh.get("texture")
+        textures = [(GL.GL_TEXTURE0, texture if texture is not None else 0)]
+        initial_texture_unit = 1 if texture is not None else 0
+
+        # texturas adicionales. 'diffuse' ya se manejó arriba, pero igual ocupa su unidad
+        texture_uniforms = []
+        for i, (tex_name, tex_id) in enumerate(mesh.get("textures", {}).items(), initial_texture_unit):
+            if tex_name == "diffuse":
+                continue
+            textures.append((GL.GL_TEXTURE0 + i, tex_id))
+            texture_uniforms.append((tex_name, i))
+
+        return textures, texture_uniforms
+
+    def execute(self, world_transforms, view, global_attributes, view_name="view", visible=None, global_block=None, profiler=None):
+        """
+        Reproduce el plan: configura los uniforms globales de cada pipeline y
+        luego ejecuta cada comando de dibujo.
+
+        Parámetros:
+        world_transforms -- Pila (N,4,4) de transformaciones globales
+        view -- Matriz de vista actual
+        global_attributes -- Diccionario de uniforms globales
+        view_name -- Nombre del uniform de la vista
+        visible -- Máscara (N,) de nodos dentro del frustum, o None para dibujar todo
+        global_block -- UniformBlockBuffer para los uniforms globales, o None
+        profiler -- FrameProfiler que registra los tiempos, o None
+        """
+        self.stats.reset()
+        stats = self.stats
+        if profiler is not None:
+            start = perf_counter()
+
+        view = flatten_uniform(view)
+        view_data = uniform_bytes(view)
+        global_values = []
+        for attr, value in global_attributes.items():
+            value = flatten_uniform(value)
+            global_values.append((attr, value, uniform_bytes(value)))
+
+        # el bloque global se escribe una vez para todos los pipelines que lo declaran
+        if global_block is not None:
+            block_values = {attr: value for attr, value, _ in global_values}
+            block_values[view_name] = view
+            if global_block.update(block_values):
+                stats.uniform_writes += 1
+            else:
+                stats.uniform_writes_saved += 1
+
+        # los uniforms se escriben solo si cambiaron desde la última vez
+        # (los miembros de un bloque no están en el caché, así que se omiten)
+        for pipeline, cache in self.pipelines:
+            if view_name in cache:
+                if cache.set(view_name, view, view_data):
+                    stats.uniform_writes += 1
+                else:
+                    stats.uniform_writes_saved += 1
+            for attr, value, data in global_values:
+                if attr in cache:
+                    if cache.set(attr, value, data):
+                        stats.uniform_writes += 1
+                    else:
+                        stats.uniform_writes_saved += 1
+
+        if profiler is not None:
+            profiler.add("uniforms", perf_counter() - start)
+
+        state = {}
+        self._submit(self.commands, world_transforms, state, visible, profiler)
+
+        if self.transparent_commands:
+            self._submit(
+                self._back_to_front(world_transforms, view), world_transforms, state, visible, profiler
+            )
+
+    def _back_to_front(self, world_transforms, view):
+        """
+        Ordena los comandos transparentes según su profundidad en el espacio de la
+        cámara (la cámara mira hacia -z, así que los más lejanos tienen z menor).
+        """
+        view = np.reshape(view, (4, 4), order="F")
+        positions = world_transforms[self._transparent_indices, :3, 3]
+        depth = positions @ view[2, :3] + view[2, 3]
+        return [self.transparent_commands[i] for i in np.argsort(depth, kind="stable")]
+
+    def _submit(self, commands, world_transforms, state, visible=None, profiler=None):
+        """
+        Ejecuta los comandos de dibujo, cambiando pipeline y texturas solo
+        cuando difieren del estado actual.
+
+        Parámetros:
+        state -- Diccionario con el pipeline activo (llave None) y la
+                 textura activa en cada unidad
+        visible -- Máscara (N,) de nodos dentro del frustum, o None
+        profiler -- FrameProfiler que registra los tiempos, o None
+        """
+        stats = self.stats
+
+        # con el perfilador activo medimos cada etapa de cada comando
+        clock = perf_counter if profiler is not None else None
+        per_node = profiler is not None and profiler.per_node
+        uniform_time = texture_time = draw_time = 0.0
+
+        for command in commands:
+            if visible is not None and command.instances is None and not visible[command.world_index]:
+                stats.draws_culled += 1
+                continue
+
+            if clock is not None:
+                started = clock()
+
+            if command.instances is not None:
+                # primero vemos cuántas instancias sobreviven, para no cambiar estado en vano
+                instances = command.instances
+                count = instances.upload(world_transforms, visible)
+                stats.instances_culled += len(instances) - count
+                if count == 0:
+                    stats.draws_culled += 1
+                    continue
+
+            if state.get(None) is not command.pipeline:
+                command.pipeline.use()
+                state[None] = command.pipeline
+                stats.pipeline_binds += 1
+            else:
+                stats.pipeline_binds_saved += 1
+
+            cache = command.cache
+            if command.transform_name is not None:
+                if cache.set_matrix(command.transform_name, world_transforms[command.world_index]):
+                    stats.uniform_writes += 1
+                else:
+                    stats.uniform_writes_saved += 1
+
+            for name, value, data in command.uniforms:
+                if cache.set(name, value, data):
+                    stats.uniform_writes += 1
+                else:
+                    stats.uniform_writes_saved += 1
+
+            if command.attributes:
+                # el caché compara bytes, así que los valores que no cambiaron no se suben
+                for name, value, data in _instance_uniforms(command.attributes, cache):
+                    if cache.set(name, value, data):
+                        stats.uniform_writes += 1
+                    else:
+                        stats.uniform_writes_saved += 1
+
+            if clock is not None:
+                uniforms_done = clock()
+
+            for unit, texture in command.textures:
+                if state.get(unit) != texture:
+                    GL.glActiveTexture(unit)
+                    GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
+                    state[unit] = texture
+                    stats.texture_binds += 1
+                else:
+                    stats.texture_binds_saved += 1
+
+            if clock is not None:
+                textures_done = clock()
+
+            # Dibujar!
+            if command.instances is None:
+                command.mesh_gpu.draw(command.gl_type)
+            else:
+                buffer_unit = (GL.GL_TEXTURE0 + INSTANCE_TEXTURE_UNIT, GL.GL_TEXTURE_BUFFER)
+                if state.get(buffer_unit) != instances.buffer.texture_id.value:
+                    GL.glActiveTexture(buffer_unit[0])
+                    GL.glBindTexture(GL.GL_TEXTURE_BUFFER, instances.buffer.texture_id)
+                    state[buffer_unit] = instances.buffer.texture_id.value
+                    stats.texture_binds += 1
+                else:
+                    stats.texture_binds_saved += 1
+
+                draw_instanced(command.mesh_gpu, command.gl_type, count)
+                stats.instances_drawn += count - 1
+            stats.draw_calls += 1
+
+            if clock is not None:
+                finished = clock()
+                uniform_time += uniforms_done - started
+                texture_time += textures_done - uniforms_done
+                draw_time += finished - textures_done
+                if per_node:
+                    profiler.add_node(command.node_key, finished - started)
+
+        if profiler is not None:
+            profiler.add("uniforms", uniform_time)
+            profiler.add("textures", texture_time)
+            profiler.add("draws", draw_time)
@@ -0,0 +1,112 @@
+import numpy as np
+import pyglet.gl as GL
+
+import grafica.transformations as tr
+
+from .uniforms import flatten_uniform, uniform_bytes
+
+# primitivas que se pueden concatenar sin mezclar sus elementos
+_LIST_PRIMITIVES = (GL.GL_TRIANGLES, GL.GL_LINES, GL.GL_POINTS)
+
+
+def static_batch_key(node_key, node):
+    """
+    Llave de agrupación de un nodo de malla al congelar un subárbol: los nodos
+    con el mismo pipeline, texturas, tipo de primitiva, atributos de vértice
+    y uniforms de instancia se pueden dibujar con una sola llamada.
+
+    Los nodos transparentes y los que usan primitivas encadenadas (strips,
+    fans, loops) no se mezclan con otros.
+    """
+    mesh = node["mesh"]
+    instance_attributes = node.get("instance_attributes") or {}
+
+    key = (
+        node["pipeline"],
+        mesh.get("texture"),
+        tuple(mesh.get("textures", {}).items()),
+        node.get("GL_TYPE"),
+        node.get("transparent", False),
+        tuple(name for name, value in node["attributes"].items() if value is not None),
+        tuple(
+            (name, uniform_bytes(flatten_uniform(value)))
+            for name, value in sorted(instance_attributes.items())
+            if name != "transform"
+        ),
+    )
+
+    if node.get("transparent", False) or node.get("GL_TYPE") not in _LIST_PRIMITIVES:
+        key = key + (node_key,)
+    return key
+
+
+def merge_static_nodes(nodes, transforms):
+    """
+    Une varios nodos de malla (de una misma llave de agrupación) en un solo
+    nodo, aplicando a sus vértices la transformación de cada uno.
+
+    Parámetros:
+    nodes -- Lista de nodos de malla
+    transforms -- Lista de transformaciones (4,4), una por nodo
+    """
+    first = nodes[0]
+    names = [name for name, value in first["attributes"].items() if value is not None]
+
+    attributes = {name: [] for name in names}
+    indices = []
+    n_vertices = 0
+
+    for node, transform in zip(nodes, transforms):
+        count = node["mesh"]["n_vertices"]
+        transform = np.asarray(transform, dtype=np.float32)
+
+        for name in names:
+            values = np.asarray(node["attributes"][name])
+
+            if name == "position":
+                positions = values.astype(np.float32).reshape(count, -1)
+                if positions.shape[1] != 3:
+                    raise ValueError("Solo se pueden congelar mallas con posiciones en 3D")
+                values = positions @ transform[:3, :3].T + transform[:3, 3]
+            elif name == "normal":
+                # las normales se transforman con la inversa transpuesta; como se
+                # normalizan después basta la matriz de cofactores con el signo del
+                # determinante, que también existe para transformaciones singulares
+                normal_matrix, det = tr._cofactors(transform)
+                if det < 0:
+                    normal_matrix = -normal_matrix
+                normals = values.astype(np.float32).reshape(count, 3) @ normal_matrix.T
+                lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+                lengths[lengths == 0] = 1.0
+                values = normals / lengths
+
+            attributes[name].append(values.ravel())
+
+        indices.append(np.asarray(node["indices"], dtype=np.uint32) + n_vertices)
+        n_vertices += count
+
+    merged_attributes = dict.fromkeys(first["attributes"])
+    for name in names:
+        merged_attributes[name] = np.concatenate(attributes[name]).astype(
+            np.asarray(first["attributes"][name]).dtype, copy=False
+        )
+
+    instance_attributes = {
+        name: value
+        for name, value in (first.get("instance_attributes") or {}).items()
+        if name != "transform"
+    }
+
+    return {
+        "mesh": {
+            "n_vertices": n_vertices,
+            "texture": first["mesh"].get("texture"),
+            "textures": dict(first["mesh"].get("textures", {})),
+        },
+        "attributes": merged_attributes,
+        "indices": np.concatenate(indices).tolist(),
+        "GL_TYPE": first.get("GL_TYPE"),
+        "children": [],
+        "instance_attributes": instance_attributes,
+        "transparent": first.get("transparent", False),
+    }
@@ -0,0 +1,220 @@
+"""
+Carga de mallas y texturas en segundo plano (ver Scenegraph.load_and_register_mesh_async).
+
+La lectura de archivos, el preprocesamiento y la decodificación de imágenes
+ocurren en hilos de trabajo, sin OpenGL. Lo que sí necesita OpenGL (subir
+vértices y texturas a la GPU) queda en una cola que el hilo de render procesa
+en cada cuadro, hasta gastar un presupuesto de bytes.
+"""
+import warnings
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+import pyglet.gl as GL
+from PIL import Image
+
+import grafica.transformations as tr
+
+
+def placeholder_mesh(bounds=None, color=(160, 160, 160, 255)):
+    """
+    Crea una malla provisoria: una caja, con la misma estructura de las
+    mallas de _node_from_file (un nodo base con un hijo).
+
+    Parámetros:
+    bounds -- Esquinas [mínimo, máximo] de la caja. Por omisión, una caja
+              centrada en el origen con diagonal 2 (el tamaño de una malla
+              normalizada por _node_from_file)
+    color -- Color RGBA de la caja (valores 0-255)
+    """
+    if bounds is None:
+        half = 1.0 / np.sqrt(3.0)
+        bounds = [[-half] * 3, [half] * 3]
+
+    low, high = np.asarray(bounds, dtype=np.float32)
+    corners = np.array(
+        [[x, y, z] for x in (low[0], high[0]) for y in (low[1], high[1]) for z in (low[2], high[2])],
+        dtype=np.float32,
+    )
+    faces = np.array(
+        [
+            [0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5],
+            [0, 4, 5], [0, 5, 1], [2, 3, 7], [2, 7, 6],
+            [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3],
+        ],
+        dtype=np.uint32,
+    )
+    center = (low + high) / 2
+    normals = corners - center
+    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+
+    box = {
+        "object": None,
+        "mesh": {"n_vertices": len(corners), "texture": None, "textures": {}},
+        "attributes": {
+            "position": corners.reshape(-1),
+            "uv": None,
+            "normal": normals.reshape(-1),
+            "color": np.tile(np.asarray(color, dtype=np.uint8), len(corners)),
+        },
+        "indices": faces.reshape(-1),
+        "GL_TYPE": GL.GL_TRIANGLES,
+        "transform": tr.identity(),
+        "id": None,
+        "children": [],
+        "parent": None,
+        "has_texture": False,
+    }
+
+    return {
+        "mesh": None,
+        "GL_TYPE": None,
+        "transform": tr.identity(),
+        "id": None,
+        "children": [box],
+        "parent": None,
+        "has_texture": False,
+        "object": None,
+    }
+
+
+def preprocessed_bytes(preprocessed):
+    """
+    Estima cuántos bytes hay que subir a la GPU para una malla preprocesada
+    por _preprocess_file (vértices, índices y texturas).
+    """
+    _, _, geometries = preprocessed
+    total = 0
+    for arrays in geometries:
+        for name in ("position", "normal", "uv", "color", "indices"):
+            if arrays.get(name) is not None:
+                total += np.asarray(arrays[name]).nbytes
+        if arrays.get("image") is not None:
+            width, height = arrays["image"].size
+            total += width * height * 4
+    return total
+
+
+def decode_texture(filename, flip_top_bottom=True):
+    """
+    Lee una imagen y la deja lista para texture_2D_upload (en modo RGB o
+    RGBA, y ya invertida si corresponde). No usa OpenGL.
+    """
+    image = Image.open(filename)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+    if flip_top_bottom:
+        image = image.transpose(Image.FLIP_TOP_BOTTOM)
+    image.load()
+    return image
+
+
+class _Job:
+    __slots__ = ("name", "future", "finish", "fail", "cost")
+
+    def __init__(self, name, future, finish, fail):
+        self.name = name
+        self.future = future
+        self.finish = finish
+        self.fail = fail
+        self.cost = 0
+
+
+class AsyncLoader:
+    """
+    Ejecuta trabajos de carga en hilos y entrega sus resultados al hilo de
+    render de a poco (ver process).
+
+    Parámetros:
+    workers -- Cantidad de hilos de trabajo
+    """
+
+    def __init__(self, workers=1):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="grafica-loader")
+        # trabajos terminados, en el orden en que terminaron (deque es seguro entre hilos)
+        self._ready = deque()
+        self._jobs = set()
+        self.errors = {}
+        self.uploaded_bytes = 0
+
+    def submit(self, name, function, finish, cost=None, fail=None):
+        """
+        Ejecuta function() en un hilo de trabajo. Cuando termine, process
+        llamará a finish(resultado) en el hilo de render.
+
+        Parámetros:
+        name -- Nombre del trabajo (para los mensajes de error)
+        function -- Función sin argumentos a ejecutar en segundo plano (sin OpenGL)
+        finish -- Función a ejecutar en el hilo de render con el resultado
+        cost -- Función que estima los bytes a subir a partir del resultado
+        fail -- Función a ejecutar en el hilo de render con la excepción, si function falla
+        """
+        job = _Job(name, None, finish, fail)
+
+        def run():
+            result = function()
+            if cost is not None:
+                job.cost = cost(result)
+            return result
+
+        job.future = self._executor.submit(run)
+        self._jobs.add(job)
+        job.future.add_done_callback(lambda future: self._ready.append(job))
+        return job
+
+    @property
+    def pending(self):
+        """
+        Cantidad de trabajos que aún no se terminan de procesar.
+        """
+        return len(self._jobs)
+
+    def process(self, budget=None):
+        """
+        Termina, en el hilo actual (el de render), los trabajos listos hasta
+        gastar budget bytes. Siempre termina al menos uno, para que un trabajo
+        más grande que el presupuesto no quede esperando para siempre.
+        Entrega la cantidad de bytes subidos. Los trabajos que fallaron quedan
+        en errors (y se avisa con warnings.warn).
+
+        Parámetros:
+        budget -- Bytes por llamada, o None para terminar todos los trabajos listos
+        """
+        spent = 0
+        while self._ready:
+            job = self._ready[0]
+            if budget is not None and spent > 0 and spent + job.cost > budget:
+                break
+
+            self._ready.popleft()
+            self._jobs.discard(job)
+            spent += job.cost
+
+            error = job.future.exception()
+            if error is not None:
+                warnings.warn(f"No se pudo cargar {job.name}: {error}", RuntimeWarning, stacklevel=2)
+                self.errors[job.name] = error
+                if job.fail is not None:
+                    job.fail(error)
+                continue
+
+            job.finish(job.future.result())
+
+        self.uploaded_bytes += spent
+        return spent
+
+    def wait(self, timeout=None):
+        """
+        Espera a que terminen los trabajos en segundo plano (sin procesarlos).
+        """
+        wait([job.future for job in list(self._jobs)], timeout=timeout)
+
+    def shutdown(self):
+        """
+        Cancela los trabajos que no han empezado y libera los hilos, sin
+        esperar a los que están en curso.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._ready.clear()
+        self._jobs.clear()
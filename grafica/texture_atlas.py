@@ -0,0 +1,119 @@
+"""
+Atlas de texturas: combina varias imágenes pequeñas en una sola, para usar
+menos texturas (y cambiar menos de textura al dibujar).
+"""
+import numpy as np
+from PIL import Image
+
+
+def pack_rectangles(sizes, width, max_height, padding=2):
+    """
+    Ubica rectángulos en filas ("shelf packing") dentro de un ancho dado.
+    Entrega (posiciones, alto usado); cada posición es (x, y) de la esquina
+    superior izquierda del rectángulo (sin el margen), o None si no cupo.
+
+    Parámetros:
+    sizes -- Lista de tamaños (ancho, alto)
+    width -- Ancho disponible
+    max_height -- Alto máximo disponible
+    padding -- Margen alrededor de cada rectángulo
+    """
+    positions = [None] * len(sizes)
+    # de más alto a más bajo, para desperdiciar menos espacio en cada fila
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+
+    x = y = shelf_height = 0
+    for i in order:
+        w, h = sizes[i][0] + 2 * padding, sizes[i][1] + 2 * padding
+        if w > width:
+            continue
+        if x + w > width:
+            # fila nueva
+            x, y, shelf_height = 0, y + shelf_height, 0
+        if y + h > max_height:
+            continue
+        positions[i] = (x + padding, y + padding)
+        x += w
+        shelf_height = max(shelf_height, h)
+
+    return positions, y + shelf_height
+
+
+def build_atlas(images, max_size=4096, padding=2):
+    """
+    Combina imágenes en un atlas RGBA. Entrega (atlas, rectángulos), donde
+    cada rectángulo es (x, y, ancho, alto) en pixeles, o None si la imagen
+    no cupo en el atlas.
+
+    Los bordes de cada imagen se repiten en el margen (padding), para que
+    el filtrado lineal no mezcle imágenes vecinas.
+
+    Parámetros:
+    images -- Lista de imágenes de PIL
+    max_size -- Tamaño máximo (ancho y alto) del atlas
+    padding -- Margen alrededor de cada imagen, en pixeles
+    """
+    sizes = [image.size for image in images]
+    area = sum((w + 2 * padding) * (h + 2 * padding) for w, h in sizes)
+
+    # el ancho más pequeño (potencia de 2) en el que caben todas
+    width = 1
+    while width * width < area and width < max_size:
+        width *= 2
+    width = max(width, min(max_size, max(w + 2 * padding for w, _ in sizes)))
+    while True:
+        positions, height = pack_rectangles(sizes, width, max_size, padding)
+        if all(position is not None for position in positions) or width >= max_size:
+            break
+        width = min(width * 2, max_size)
+
+    # recortamos el ancho que no se usó
+    width = max(
+        [position[0] + size[0] + padding for size, position in zip(sizes, positions) if position is not None] or [1]
+    )
+    atlas = np.zeros((max(height, 1), width, 4), dtype=np.uint8)
+    rectangles = []
+    for image, position in zip(images, positions):
+        if position is None:
+            rectangles.append(None)
+            continue
+
+        x, y = position
+        pixels = np.asarray(image.convert("RGBA"))
+        h, w = pixels.shape[:2]
+        atlas[y - padding : y + h + padding, x - padding : x + w + padding] = np.pad(
+            pixels, ((padding, padding), (padding, padding), (0, 0)), mode="edge"
+        )
+        rectangles.append((x, y, w, h))
+
+    return Image.fromarray(atlas, mode="RGBA"), rectangles
+
+
+def remap_uv(uv, rectangle, atlas_size):
+    """
+    Convierte coordenadas de textura de una imagen a las de su rectángulo
+    en el atlas. Supone que ambas se suben invertidas verticalmente (como
+    hace texture_2D_setup por omisión), es decir, v = 1 es la fila superior.
+
+    Parámetros:
+    uv -- Arreglo de coordenadas (u, v), con valores en [0, 1]
+    rectangle -- Rectángulo (x, y, ancho, alto) de la imagen en el atlas
+    atlas_size -- Tamaño (ancho, alto) del atlas
+    """
+    x, y, w, h = rectangle
+    atlas_width, atlas_height = atlas_size
+    uv = np.asarray(uv, dtype=np.float32).reshape(-1, 2)
+
+    remapped = np.empty_like(uv)
+    remapped[:, 0] = (x + uv[:, 0] * w) / atlas_width
+    remapped[:, 1] = 1.0 - (y + (1.0 - uv[:, 1]) * h) / atlas_height
+    return remapped.reshape(-1)
+
+
+def uv_in_unit_square(uv, tolerance=1e-4):
+    """
+    Indica si todas las coordenadas de textura están en [0, 1], es decir,
+    si la imagen no se repite (y entonces puede ir en un atlas).
+    """
+    uv = np.asarray(uv)
+    return uv.size == 0 or (uv.min() >= -tolerance and uv.max() <= 1.0 + tolerance)
@@ -15,13 +15,42 @@ from OpenGL.GL import (
     GL_LINEAR,
     GL_NEAREST,
     GL_REPEAT,
+    glDeleteTextures,
+    glCompressedTexImage2D,
+    glPixelStorei,
+    GL_UNPACK_ALIGNMENT,
+    GL_TEXTURE_BASE_LEVEL,
+    GL_TEXTURE_MAX_LEVEL,
+    GL_LINEAR_MIPMAP_LINEAR,
+)
+from OpenGL.GL.EXT.texture_compression_s3tc import (
+    GL_COMPRESSED_RGB_S3TC_DXT1_EXT,
+    GL_COMPRESSED_RGBA_S3TC_DXT5_EXT,
 )
 
 from PIL import Image
 import numpy as np
+import hashlib
+import warnings
+from grafica.mipmaps import MipmapChain
+
+# formatos comprimidos de grafica.mipmaps
+_COMPRESSED_FORMATS = {
+    "bc1": GL_COMPRESSED_RGB_S3TC_DXT1_EXT,
+    "bc3": GL_COMPRESSED_RGBA_S3TC_DXT5_EXT,
+}
 
 SIZE_IN_BYTES = 4
 
+# parámetros por omisión de texture_2D_setup (para las llaves de TextureCache)
+_TEXTURE_DEFAULTS = dict(
+    sWrapMode=GL_CLAMP_TO_EDGE,
+    tWrapMode=GL_CLAMP_TO_EDGE,
+    minFilterMode=GL_LINEAR,
+    maxFilterMode=GL_LINEAR,
+    flip_top_bottom=True,
+)
+
 
 def texture_2D_setup(
     image,
@@ -44,6 +73,22 @@ def texture_2D_setup(
     glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, minFilterMode)
     glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, maxFilterMode)
 
+    texture_2D_upload(texture, image, flip_top_bottom)
+
+    return texture
+
+
+def texture_2D_upload(texture, image, flip_top_bottom=True):
+    """
+    Sube (o reemplaza) la imagen de una textura 2D ya creada.
+
+    Parámetros:
+    texture -- ID de la textura de OpenGL
+    image -- Imagen de PIL en modo RGB o RGBA
+    flip_top_bottom -- Si es True, invierte la imagen verticalmente
+    """
+    glBindTexture(GL_TEXTURE_2D, texture)
+
     if flip_top_bottom:
         image = image.transpose(Image.FLIP_TOP_BOTTOM)
     img_data = np.array(image, np.uint8)
@@ -70,4 +115,185 @@ def texture_2D_setup(
         img_data,
     )
 
-    return texture
+
+class TextureCache:
+    """
+    Caché de texturas en la GPU. Las imágenes con el mismo contenido y los
+    mismos parámetros de texture_2D_setup comparten una sola textura, así que
+    una imagen usada por varios materiales o mallas se sube una sola vez.
+    """
+
+    def __init__(self):
+        self._textures = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(image, **params):
+        """
+        Llave de una imagen de PIL con parámetros de texture_2D_setup:
+        un hash de su contenido, modo, tamaño y parámetros.
+        """
+        params = {**_TEXTURE_DEFAULTS, **params}
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{image.mode}:{image.size}:{sorted(params.items())}".encode())
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def get(self, image, **params):
+        """
+        Entrega el ID de la textura de image, creándola con texture_2D_setup
+        si no existe.
+
+        Parámetros:
+        image -- Imagen de PIL
+        **params -- Parámetros de texture_2D_setup
+        """
+        key = self.key(image, **params)
+        texture = self._textures.get(key)
+        if texture is None:
+            self.misses += 1
+            texture = self._textures[key] = texture_2D_setup(image, **{**_TEXTURE_DEFAULTS, **params})
+        else:
+            self.hits += 1
+        return texture
+
+    def clear(self):
+        """
+        Borra de la GPU todas las texturas del caché.
+        """
+        if self._textures:
+            glDeleteTextures(list(self._textures.values()))
+        self._textures.clear()
+
+    def __len__(self):
+        return len(self._textures)
+
+
+def s3tc_supported():
+    """
+    Indica si la GPU (del contexto actual) acepta texturas BC1/BC3 (S3TC).
+    """
+    from pyglet.gl import gl_info
+
+    return gl_info.have_extension("GL_EXT_texture_compression_s3tc")
+
+
+class MipmappedTexture:
+    """
+    Textura 2D con mipmaps calculados en la CPU (ver grafica.mipmaps).
+    Guarda la cadena de niveles, así que se pueden subir a la GPU de a poco:
+    primero los niveles pequeños (baratos) y después, con upload, los más
+    grandes, cuando se necesiten. OpenGL solo usa los niveles desde
+    base_level, el más grande que ya se subió.
+
+    Parámetros:
+    chain -- MipmapChain con los niveles
+    resident_level -- Primer nivel que se sube de inmediato (0 es el de
+                      resolución completa; None sube solo el de 1x1)
+    sWrapMode, tWrapMode, maxFilterMode -- Como en texture_2D_setup
+    minFilterMode -- Filtro de reducción (por omisión, trilineal)
+    """
+
+    def __init__(
+        self,
+        chain,
+        resident_level=0,
+        sWrapMode=GL_REPEAT,
+        tWrapMode=GL_REPEAT,
+        minFilterMode=GL_LINEAR_MIPMAP_LINEAR,
+        maxFilterMode=GL_LINEAR,
+    ):
+        self.chain = chain
+        self.texture = glGenTextures(1)
+        # nivel más grande en la GPU (len(chain) significa ninguno)
+        self.base_level = len(chain)
+
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, sWrapMode)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, tWrapMode)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, minFilterMode)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, maxFilterMode)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, len(chain) - 1)
+
+        self.upload(len(chain) - 1 if resident_level is None else resident_level)
+
+    def upload(self, level=0):
+        """
+        Sube los niveles que falten desde level (hasta los que ya están en la
+        GPU) y los habilita.
+        """
+        level = max(0, min(level, len(self.chain) - 1))
+        if level >= self.base_level:
+            return
+
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        # las filas de los niveles pequeños no siempre miden un múltiplo de 4 bytes
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+
+        for i in range(level, self.base_level):
+            width, height, data = self.chain.levels[i]
+            if self.chain.format in _COMPRESSED_FORMATS:
+                glCompressedTexImage2D(
+                    GL_TEXTURE_2D, i, _COMPRESSED_FORMATS[self.chain.format], width, height, 0, data.nbytes, data
+                )
+            else:
+                format = GL_RGBA if data.shape[2] == 4 else GL_RGB
+                glTexImage2D(GL_TEXTURE_2D, i, format, width, height, 0, format, GL_UNSIGNED_BYTE, data)
+
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_BASE_LEVEL, level)
+        self.base_level = level
+
+    @property
+    def resident_bytes(self):
+        """
+        Bytes de los niveles que están en la GPU.
+        """
+        return sum(data.nbytes for _, _, data in self.chain.levels[self.base_level :])
+
+    def delete(self):
+        glDeleteTextures([self.texture])
+
+
+def texture_2D_mipmap_setup(
+    image,
+    filter="box",
+    compression=None,
+    cache=None,
+    resident_level=0,
+    flip_top_bottom=True,
+    **texture_params
+):
+    """
+    Crea una textura con mipmaps calculados en la CPU. Entrega un
+    MipmappedTexture (el ID de OpenGL está en su atributo texture).
+
+    Parámetros:
+    image -- Imagen de PIL
+    filter -- "box" o "lanczos" (ver grafica.mipmaps.mip_chain)
+    compression -- None, "bc1" (RGB, 4 bits por pixel) o "bc3" (RGBA, 8 bits
+                   por pixel). Si la GPU no los acepta, se usa la textura sin comprimir
+    cache -- MipmapCache donde buscar y guardar los niveles, o None
+    resident_level -- Primer nivel que se sube de inmediato (ver MipmappedTexture)
+    flip_top_bottom -- Si es True, invierte la imagen verticalmente
+    **texture_params -- Modos de wrap y filtro (ver MipmappedTexture)
+    """
+    format = compression or "rgba"
+    if compression is not None and not s3tc_supported():
+        warnings.warn(
+            f"La GPU no acepta texturas {compression}, se usará el formato sin comprimir.",
+            RuntimeWarning,
+            stacklevel=2,
+        )
+        format = "rgba"
+
+    if flip_top_bottom:
+        image = image.transpose(Image.FLIP_TOP_BOTTOM)
+
+    if cache is not None:
+        chain = cache.get(image, filter, format)
+    else:
+        chain = MipmapChain.from_image(image, filter, format)
+
+    return MipmappedTexture(chain, resident_level=resident_level, **texture_params)
@@ -91,40 +91,14 @@ def rotationA(theta, axis):
 def rotationAxis(theta, point1, point2):
     axis = point2-point1
     axis = axis / np.linalg.norm(axis)
-    a,b,c = axis
-    h = np.sqrt(a**2 + c**2)
 
-    T = translate(-point1[0], -point1[1], -point1[2])
-    Tinv = translate(point1[0], point1[1], point1[2])
+    # rotación en torno al eje que pasa por point1: T(point1) @ R @ T(-point1),
+    # armada directamente (la traslación queda en point1 - R @ point1)
+    out = rotationA(theta, axis)
+    out[:3,3] = point1 - out[:3,:3] @ point1
+    return out
 
-    Ry = np.array([
-        [a/h, 0, c/h, 0],
-        [0,1,0,0],
-        [-c/h, 0, a/h, 0],
-        [0,0,0,1]], dtype=np.float32)
-    
-    Ryinv = np.array([
-        [a/h, 0, -c/h, 0],
-        [0,1,0,0],
-        [c/h, 0, a/h, 0],
-        [0,0,0,1]], dtype=np.float32)
-    
-    Rz = np.array([
-        [h, b, 0, 0],
-        [-b, h, 0, 0],
-        [0,0,1,0],
-        [0,0,0,1]], dtype=np.float32)
-    
-    Rzinv = np.array([
-        [h, -b, 0, 0],
-        [b, h, 0, 0],
-        [0,0,1,0],
-        [0,0,0,1]], dtype=np.float32)
-    
-    Rx = rotationX(theta)
 
-    return matmul([Tinv,Ryinv,Rzinv,Rx,Rz,Ry,T])
-    
 def translate(tx, ty, tz):
     return np.array([
         [1,0,0,tx],
@@ -142,6 +116,10 @@ def shearing(xy, yx, xz, zx, yz, zy):
 
 
 def matmul(mats):
+    # las cadenas largas se reducen por pares (ver matmulChain)
+    if len(mats) >= CHAIN_TREE_MIN:
+        return matmulChain(mats)
+
     out = mats[0]
     for i in range(1, len(mats)):
         out = np.matmul(out, mats[i])
@@ -206,3 +184,293 @@ def lookAt(eye, at, up):
             [         0,          0,          0,                     1]
     ], dtype = np.float32)
 
+
+
+# Versiones por lotes: reciben arreglos de parámetros (o escalares, que se
+# repiten) y entregan una pila (N,4,4) float32. Si se entrega out, se escribe
+# ahí en vez de crear un arreglo nuevo.
+
+def _batchParameters(*values):
+    arrays = [np.atleast_1d(np.asarray(value, dtype=np.float32)) for value in values]
+    return np.broadcast_arrays(*arrays)
+
+
+def _batchVectors(*values):
+    arrays = [np.atleast_2d(np.asarray(value, dtype=np.float32)) for value in values]
+    return np.broadcast_arrays(*arrays)
+
+
+def _batchOutput(n, out):
+    if out is None:
+        return np.zeros((n, 4, 4), dtype=np.float32)
+
+    if out.shape != (n, 4, 4) or out.dtype != np.float32:
+        raise ValueError(f"out debe ser un arreglo float32 de forma {(n, 4, 4)}, no {out.dtype} {out.shape}")
+
+    out[...] = 0
+    return out
+
+
+def identityBatch(n, out=None):
+    out = _batchOutput(n, out)
+    out[:, [0, 1, 2, 3], [0, 1, 2, 3]] = 1
+    return out
+
+
+def uniformScaleBatch(s, out=None):
+    s, = _batchParameters(s)
+    out = _batchOutput(len(s), out)
+    out[:, 0, 0] = s
+    out[:, 1, 1] = s
+    out[:, 2, 2] = s
+    out[:, 3, 3] = 1
+    return out
+
+
+def scaleBatch(sx, sy, sz, out=None):
+    sx, sy, sz = _batchParameters(sx, sy, sz)
+    out = _batchOutput(len(sx), out)
+    out[:, 0, 0] = sx
+    out[:, 1, 1] = sy
+    out[:, 2, 2] = sz
+    out[:, 3, 3] = 1
+    return out
+
+
+def translateBatch(tx, ty, tz, out=None):
+    tx, ty, tz = _batchParameters(tx, ty, tz)
+    out = _batchOutput(len(tx), out)
+    out[:, [0, 1, 2, 3], [0, 1, 2, 3]] = 1
+    out[:, 0, 3] = tx
+    out[:, 1, 3] = ty
+    out[:, 2, 3] = tz
+    return out
+
+
+def _rotationBatch(theta, i, j, k, out):
+    # rotación en el plano (i, j), dejando fijo el eje k
+    theta, = _batchParameters(theta)
+    out = _batchOutput(len(theta), out)
+    sin_theta = np.sin(theta)
+    cos_theta = np.cos(theta)
+    out[:, i, i] = cos_theta
+    out[:, i, j] = -sin_theta
+    out[:, j, i] = sin_theta
+    out[:, j, j] = cos_theta
+    out[:, k, k] = 1
+    out[:, 3, 3] = 1
+    return out
+
+
+def rotationXBatch(theta, out=None):
+    return _rotationBatch(theta, 1, 2, 0, out)
+
+
+def rotationYBatch(theta, out=None):
+    return _rotationBatch(theta, 2, 0, 1, out)
+
+
+def rotationZBatch(theta, out=None):
+    return _rotationBatch(theta, 0, 1, 2, out)
+
+
+def rotationABatch(theta, axis, out=None):
+    # axis puede ser un solo eje (3,) o uno por matriz (N,3)
+    theta, = _batchParameters(theta)
+    axis = np.atleast_2d(np.asarray(axis, dtype=np.float32))
+    n = np.broadcast_shapes(theta.shape, axis.shape[:1])[0]
+    theta = np.broadcast_to(theta, (n,))
+    x, y, z = np.broadcast_to(axis, (n, 3)).T
+
+    s = np.sin(theta)
+    c = np.cos(theta)
+    t = 1 - c
+
+    out = _batchOutput(n, out)
+    out[:, 0, 0] = c + t * x * x
+    out[:, 0, 1] = t * x * y - s * z
+    out[:, 0, 2] = t * x * z + s * y
+    out[:, 1, 0] = t * x * y + s * z
+    out[:, 1, 1] = c + t * y * y
+    out[:, 1, 2] = t * y * z - s * x
+    out[:, 2, 0] = t * x * z - s * y
+    out[:, 2, 1] = t * y * z + s * x
+    out[:, 2, 2] = c + t * z * z
+    out[:, 3, 3] = 1
+    return out
+
+
+def frustumBatch(left, right, bottom, top, near, far, out=None):
+    left, right, bottom, top, near, far = _batchParameters(left, right, bottom, top, near, far)
+    r_l = right - left
+    t_b = top - bottom
+    f_n = far - near
+
+    out = _batchOutput(len(left), out)
+    out[:, 0, 0] = 2 * near / r_l
+    out[:, 0, 2] = (right + left) / r_l
+    out[:, 1, 1] = 2 * near / t_b
+    out[:, 1, 2] = (top + bottom) / t_b
+    out[:, 2, 2] = -(far + near) / f_n
+    out[:, 2, 3] = -2 * near * far / f_n
+    out[:, 3, 2] = -1
+    return out
+
+
+def perspectiveBatch(fovy, aspect, near, far, out=None):
+    fovy, aspect, near, far = _batchParameters(fovy, aspect, near, far)
+    halfHeight = np.tan(np.pi * fovy / 360) * near
+    halfWidth = halfHeight * aspect
+    return frustumBatch(-halfWidth, halfWidth, -halfHeight, halfHeight, near, far, out)
+
+
+def orthoBatch(left, right, bottom, top, near, far, out=None):
+    left, right, bottom, top, near, far = _batchParameters(left, right, bottom, top, near, far)
+    r_l = right - left
+    t_b = top - bottom
+    f_n = far - near
+
+    out = _batchOutput(len(left), out)
+    out[:, 0, 0] = 2 / r_l
+    out[:, 0, 3] = -(right + left) / r_l
+    out[:, 1, 1] = 2 / t_b
+    out[:, 1, 3] = -(top + bottom) / t_b
+    out[:, 2, 2] = -2 / f_n
+    out[:, 2, 3] = -(far + near) / f_n
+    out[:, 3, 3] = 1
+    return out
+
+
+def lookAtBatch(eye, at, up, out=None):
+    # eye, at y up pueden ser vectores (3,) o pilas (N,3)
+    eye, at, up = _batchVectors(eye, at, up)
+
+    forward = eye - at
+    forward = forward / np.linalg.norm(forward, axis=1, keepdims=True)
+
+    side = np.cross(up, forward)
+    side = side / np.linalg.norm(side, axis=1, keepdims=True)
+
+    newUp = np.cross(forward, side)
+
+    out = _batchOutput(len(eye), out)
+    out[:, 0, :3] = side
+    out[:, 1, :3] = newUp
+    out[:, 2, :3] = forward
+    out[:, 0, 3] = -np.einsum("ij,ij->i", side, eye)
+    out[:, 1, 3] = -np.einsum("ij,ij->i", newUp, eye)
+    out[:, 2, 3] = -np.einsum("ij,ij->i", forward, eye)
+    out[:, 3, 3] = 1
+    return out
+
+
+
+# Núcleos para transformaciones afines (última fila [0,0,0,1], como todas las
+# de este módulo salvo las proyecciones). Reciben una matriz (4,4) o pilas
+# (...,4,4) y evitan la inversa general de 4x4.
+
+# desde este largo conviene reducir por pares: apilar las matrices tiene un
+# costo fijo que en cadenas cortas es mayor que multiplicarlas de a una
+CHAIN_TREE_MIN = 16
+
+
+def matmulChain(mats, affine=False):
+    # evalúa mats[0] @ mats[1] @ ... multiplicando pares vecinos en una
+    # sola llamada por nivel (log2(len(mats)) llamadas en vez de len(mats)-1)
+    if len(mats) == 1:
+        return mats[0]
+
+    product = affineMatmul if affine else np.matmul
+    shapes = {np.shape(mat) for mat in mats}
+    if len(shapes) > 1 or len(mats) < CHAIN_TREE_MIN:
+        # cadenas cortas o de formas distintas (por ejemplo, una pila y
+        # matrices sueltas): de a una
+        out = mats[0]
+        for i in range(1, len(mats)):
+            out = product(out, mats[i])
+        return out
+
+    stack = np.asarray(mats)
+    while len(stack) > 1:
+        paired = product(stack[0:len(stack) - 1:2], stack[1::2])
+        if len(stack) % 2:
+            paired = np.concatenate([paired, stack[-1:]])
+        stack = paired
+
+    return stack[0]
+
+
+def affineMatmul(a, b, out=None):
+    # a @ b calculando solo las 3 primeras filas; la última queda exacta
+    a = np.asarray(a)
+    b = np.asarray(b)
+    if out is None:
+        shape = np.broadcast_shapes(a.shape, b.shape)
+        out = np.empty(shape, dtype=np.result_type(a.dtype, b.dtype))
+
+    np.matmul(a[..., :3, :], b, out=out[..., :3, :])
+    out[..., 3, :] = (0, 0, 0, 1)
+    return out
+
+
+def _cofactors(m):
+    # cofactores de la parte 3x3 y su determinante
+    a = np.asarray(m)[..., :3, :3]
+    a00, a01, a02 = a[..., 0, 0], a[..., 0, 1], a[..., 0, 2]
+    a10, a11, a12 = a[..., 1, 0], a[..., 1, 1], a[..., 1, 2]
+    a20, a21, a22 = a[..., 2, 0], a[..., 2, 1], a[..., 2, 2]
+
+    out = np.empty(a.shape, dtype=np.result_type(a.dtype, np.float32))
+    out[..., 0, 0] = a11 * a22 - a12 * a21
+    out[..., 0, 1] = a12 * a20 - a10 * a22
+    out[..., 0, 2] = a10 * a21 - a11 * a20
+    out[..., 1, 0] = a21 * a02 - a22 * a01
+    out[..., 1, 1] = a22 * a00 - a20 * a02
+    out[..., 1, 2] = a20 * a01 - a21 * a00
+    out[..., 2, 0] = a01 * a12 - a02 * a11
+    out[..., 2, 1] = a02 * a10 - a00 * a12
+    out[..., 2, 2] = a00 * a11 - a01 * a10
+
+    det = a00 * out[..., 0, 0] + a01 * out[..., 0, 1] + a02 * out[..., 0, 2]
+    return out, det
+
+
+def normalMatrix(m):
+    # inversa transpuesta de la parte 3x3: transforma normales
+    cofactors, det = _cofactors(m)
+    if np.any(det == 0):
+        raise ValueError("La transformación no es invertible")
+    cofactors /= det[..., np.newaxis, np.newaxis]
+    return cofactors
+
+
+def affineInverse(m):
+    m = np.asarray(m)
+    out = np.empty(m.shape, dtype=np.result_type(m.dtype, np.float32))
+    inverse = np.swapaxes(normalMatrix(m), -1, -2)
+    out[..., :3, :3] = inverse
+    out[..., :3, 3:] = -(inverse @ m[..., :3, 3:])
+    out[..., 3, :] = (0, 0, 0, 1)
+    return out
+
+
+def rigidInverse(m):
+    # inversa de rotación + traslación (sin escala): R^T y -R^T t
+    m = np.asarray(m)
+    out = np.empty(m.shape, dtype=np.result_type(m.dtype, np.float32))
+    rotation = np.swapaxes(m[..., :3, :3], -1, -2)
+    out[..., :3, :3] = rotation
+    out[..., :3, 3:] = -(rotation @ m[..., :3, 3:])
+    out[..., 3, :] = (0, 0, 0, 1)
+    return out
+
+
+def perspectiveInverse(fovy, aspect, near, far):
+    # inversa de perspective, en forma cerrada
+    f = 1.0 / np.tan(fovy * np.pi / 360.0)
+    n_f = 2 * near * far
+    return np.array([
+        [aspect / f, 0, 0, 0],
+        [0, 1 / f, 0, 0],
+        [0, 0, 0, -1],
+        [0, 0, -(far - near) / n_f, (far + near) / n_f]], dtype = np.float32)
@@ -0,0 +1,191 @@
+import ctypes
+import weakref
+from functools import partial
+
+import numpy as np
+
+
+def flatten_uniform(value):
+    """
+    Convierte un valor a un formato que se pueda asignar a un uniform:
+    los escalares se mantienen y los arreglos se aplanan en orden de columnas
+    (como espera OpenGL para las matrices).
+    """
+    if np.ndim(value) == 0:
+        return value
+    return np.asarray(value).ravel(order="F")
+
+
+def uniform_bytes(value):
+    """
+    Entrega los bytes de un valor de uniform, para compararlo con el anterior.
+    """
+    if isinstance(value, np.ndarray):
+        return value.tobytes()
+    return np.asarray(value).tobytes()
+
+
+class UniformCache:
+    """
+    Copia "sombra" de los valores de uniforms de un ShaderProgram.
+
+    Guarda los bytes del último valor escrito en cada uniform y omite las
+    escrituras que no cambian nada. También guarda, una sola vez, el conjunto
+    de uniforms activos del programa, así que los uniforms que no existen se
+    detectan sin usar excepciones.
+
+    Si se escribe un uniform directamente en el programa (pipeline[name] = value)
+    hay que llamar a invalidate, porque la copia sombra queda desactualizada.
+    """
+
+    def __init__(self, pipeline):
+        self.names = frozenset(pipeline.uniforms)
+        self._uniforms = getattr(pipeline, "_uniforms", None)
+        self._pipeline = weakref.proxy(pipeline)
+        self._setters = {}
+        self._shadow = {}
+        self.uploads = 0
+        self.skipped = 0
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def setter(self, name):
+        """
+        Entrega la función que escribe el uniform (o None si no está activo).
+        """
+        if name not in self.names:
+            return None
+
+        setter = self._setters.get(name)
+        if setter is None:
+            if self._uniforms is not None:
+                setter = self._uniforms[name].set
+            else:
+                setter = partial(self._pipeline.__setitem__, name)
+            self._setters[name] = setter
+        return setter
+
+    def set(self, name, value, data=None):
+        """
+        Escribe el uniform solo si su valor cambió. Entrega True si se escribió.
+
+        Parámetros:
+        name -- Nombre del uniform
+        value -- Valor ya aplanado (ver flatten_uniform)
+        data -- Bytes del valor, si ya se calcularon
+        """
+        if data is None:
+            data = uniform_bytes(value)
+
+        if self._shadow.get(name) == data:
+            self.skipped += 1
+            return False
+
+        setter = self.setter(name)
+        if setter is None:
+            return False
+
+        setter(value)
+        self._shadow[name] = data
+        self.uploads += 1
+        return True
+
+    def set_matrix(self, name, matrix):
+        """
+        Igual que set, pero para una matriz (4,4). Solo se aplana si hay que escribirla.
+        """
+        data = matrix.tobytes()
+        if self._shadow.get(name) == data:
+            self.skipped += 1
+            return False
+
+        setter = self.setter(name)
+        if setter is None:
+            return False
+
+        setter(matrix.ravel(order="F"))
+        self._shadow[name] = data
+        self.uploads += 1
+        return True
+
+    def invalidate(self, name=None):
+        """
+        Olvida el valor de un uniform (o de todos), forzando la próxima escritura.
+        """
+        if name is None:
+            self._shadow.clear()
+        else:
+            self._shadow.pop(name, None)
+
+
+class UniformBlockBuffer:
+    """
+    Uniform Buffer Object con los valores de un bloque de uniforms.
+
+    pyglet asigna el mismo punto de enlace (binding) a los bloques con el mismo
+    nombre en todos los programas, así que un solo buffer, escrito una vez por
+    cuadro, sirve para todos los pipelines que declaran el bloque. Los miembros
+    del bloque no aparecen en pipeline.uniforms, de modo que los pipelines que
+    no lo declaran siguen recibiendo uniforms individuales.
+    """
+
+    def __init__(self, uniform_block):
+        self.name = uniform_block.name
+        self.ubo = uniform_block.create_ubo()
+        self.names = frozenset(
+            name for name, _ in self.ubo.view._fields_ if not name.startswith("_padding")
+        )
+        self._shadow = None
+        self.uploads = 0
+        self.skipped = 0
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def update(self, values):
+        """
+        Escribe los valores en el bloque y lo sube a la GPU solo si cambió.
+        En cualquier caso deja el buffer enlazado a su punto de enlace.
+        Entrega True si se subió.
+
+        Parámetros:
+        values -- Diccionario de nombre -> valor ya aplanado (ver flatten_uniform)
+        """
+        view = self.ubo.view
+        for name, value in values.items():
+            if name not in self.names:
+                continue
+
+            field = getattr(view, name)
+            if isinstance(field, ctypes.Array):
+                np.ctypeslib.as_array(field).reshape(-1)[:] = np.ravel(value)
+            else:
+                setattr(view, name, np.asarray(value).item())
+
+        data = bytes(view)
+        if data == self._shadow:
+            self.ubo.bind()
+            self.skipped += 1
+            return False
+
+        # al salir del contexto pyglet enlaza el buffer y sube la estructura
+        with self.ubo:
+            pass
+        self._shadow = data
+        self.uploads += 1
+        return True
+
+
+# un caché por ShaderProgram, compartido por todos los grafos que lo usen
+_caches = weakref.WeakKeyDictionary()
+
+
+def get_uniform_cache(pipeline):
+    """
+    Entrega el UniformCache asociado a un ShaderProgram (lo crea si no existe).
+    """
+    cache = _caches.get(pipeline)
+    if cache is None:
+        cache = _caches[pipeline] = UniformCache(pipeline)
+    return cache